@@ -0,0 +1,83 @@
+import json
+import os
+import platform
+
+
+
+'''
+Saves benchmark results as baselines and compares later runs against them.
+Results are flat dictionaries of metric name -> value, one file per benchmark
+in benchmarks/baselines/. Baselines are only comparable on the same machine.
+'''
+
+
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINES_DIR, f"{name}.json")
+
+
+def save(name: str, results: dict) -> str:
+    '''
+    Saves results as the baseline of a benchmark.
+
+    Args:
+        name (str): The benchmark name
+        results (dict): Metric name -> value
+
+    Returns:
+        str: The baseline file path
+    '''
+    os.makedirs(BASELINES_DIR, exist_ok=True)
+    path = baseline_path(name)
+    baseline = {
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "results": results
+    }
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=4, sort_keys=True)
+    return path
+
+
+def load(name: str) -> dict | None:
+    try:
+        with open(baseline_path(name), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def compare(name: str, results: dict, higher_is_better: set, tolerance: float) -> list:
+    '''
+    Compares results with the saved baseline and prints the change of every metric.
+
+    Args:
+        name (str): The benchmark name
+        results (dict): Metric name -> value
+        higher_is_better (set): Metric suffixes where a drop is a regression, e.g. "points_per_second"
+        tolerance (float): Allowed relative change before a metric counts as a regression, e.g. 0.2
+
+    Returns:
+        list: The regressed metric names
+    '''
+    baseline = load(name)
+    if baseline is None:
+        print(f"No baseline for {name}, save one with --save-baseline")
+        return []
+    if baseline["python"] != platform.python_version() or baseline["machine"] != platform.node():
+        print(f"Baseline recorded on {baseline['machine']} with Python {baseline['python']}, results may not be comparable")
+    regressions = []
+    for metric, value in results.items():
+        previous = baseline["results"].get(metric)
+        if not previous:
+            continue
+        change = (value - previous) / previous
+        higher = any(metric.endswith(suffix) for suffix in higher_is_better)
+        regressed = change < -tolerance if higher else change > tolerance
+        if regressed:
+            regressions.append(metric)
+        print(f"{metric:<48} {previous:14.3f} -> {value:14.3f}  {change * 100:+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
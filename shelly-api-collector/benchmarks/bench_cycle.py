@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import itertools
+import json
+import resource
+import subprocess
+import sys
+import time
+import baseline
+from fixtures import NullSink, ReplayTransport, make_fleet
+from services.collector import Collector
+from services.writer import BatchWriter
+
+
+
+'''
+End-to-end collection cycle benchmark.
+Every cycle polls the whole fleet, serializes the readings and queues them for
+the background writer (writing to a null sink), like one scheduler slot in which every device is due.
+Each fleet size runs in its own process so the peak RSS belongs to that size.
+
+Devices are replayed from the recorded payloads by default, or polled over HTTP
+from the devices.json written by the simulator (shelly-simulator, --devices-json).
+
+Usage: python bench_cycle.py --sizes 10,100,1000,5000 [--devices-json devices.json] [--save-baseline | --compare]
+'''
+
+
+
+# Metrics where a lower value is a regression
+HIGHER_IS_BETTER = {"points_per_second"}
+
+
+def percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(percent / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def interleave(devices: list) -> list:
+    '''
+    Orders the devices round-robin by model so any prefix of the list has a similar model mix.
+    '''
+    by_model = {}
+    for device in devices:
+        by_model.setdefault(device["model"], []).append(device)
+    return [device for group in itertools.zip_longest(*by_model.values()) for device in group if device]
+
+
+def collector_settings(args: argparse.Namespace) -> dict:
+    return {
+        "poll_interval_seconds": 10,
+        "scheduler_tick_seconds": 0.05,
+        "serialization": args.serialization,
+        "deadband_file": "",
+        "models_dir": "",
+        "devices_reload_seconds": 0,
+        "history_seconds": 0,
+        "history_max_samples": 100000,
+        "history_fields": ["*"],
+        "state_port": 0,
+        "state_bind": "127.0.0.1",
+        "energy_windows": "1m,15m,1h",
+        "ingestion": "poll",
+        "ws_reconnect_seconds": 5,
+        "coiot_enabled": False,
+        "breaker_failures": 3,
+        "breaker_backoff_seconds": 30,
+        "breaker_max_backoff_seconds": 600,
+        "max_concurrency": args.max_concurrency,
+        "info_ttl_seconds": 3600,
+        "http_connect_timeout": 2,
+        "http_read_timeout": 5
+    }
+
+
+async def run_cycles(collector: Collector, fleet: list, writer: BatchWriter, cycles: int, warmup: int) -> tuple[list, int]:
+    '''
+    Runs the collection cycles.
+
+    Returns:
+        tuple[list, int]: The cycle latencies in seconds and the points serialized in the measured cycles
+    '''
+    latencies = []
+    points = 0
+    for cycle in range(warmup + cycles):
+        start = time.perf_counter()
+        polled = await collector.poller.poll(fleet)
+        serialized = collector.serialize(polled)
+        writer.submit(serialized)
+        if cycle >= warmup:
+            latencies.append(time.perf_counter() - start)
+            points += len(serialized)
+    return latencies, points
+
+
+def run_size(args: argparse.Namespace) -> dict:
+    '''
+    Benchmarks a single fleet size in this process.
+
+    Returns:
+        dict: Metric name -> value
+    '''
+    writer = BatchWriter(NullSink(), max_pending=10**9)
+    writer.start()
+    collector = Collector(collector_settings(args), writer)
+    if args.devices_json:
+        with open(args.devices_json, "r") as file:
+            devices = interleave(json.load(file))[:args.devices]
+        collector.load(devices)
+        fleet = collector.registry.devices
+    else:
+        fleet = make_fleet(args.devices, ReplayTransport())
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    latencies, points = asyncio.run(run_cycles(collector, fleet, writer, args.cycles, args.warmup))
+    # Include the writer's share of the work
+    writer.close()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    collector.poller.close()
+    collector.transport.close()
+    # Warmup points are flushed too, scale the CPU to the measured cycles
+    cpu *= args.cycles / (args.cycles + args.warmup)
+    elapsed *= args.cycles / (args.cycles + args.warmup)
+    return {
+        "devices": len(fleet),
+        "cycle_p50_ms": percentile(latencies, 50) * 1000,
+        "cycle_p95_ms": percentile(latencies, 95) * 1000,
+        "cycle_p99_ms": percentile(latencies, 99) * 1000,
+        "cycle_max_ms": max(latencies) * 1000,
+        "points_per_second": points / elapsed if elapsed else 0.0,
+        "cpu_us_per_point": cpu / points * 1e6 if points else 0.0,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end collection cycles")
+    parser.add_argument("--sizes", type=str, default="10,100,1000,5000", help="Comma separated fleet sizes")
+    parser.add_argument("--cycles", type=int, default=20, help="Measured cycles per size")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured cycles before measuring, the first cycle fetches the device info")
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--serialization", type=str, default="line", choices=["line", "dict"])
+    parser.add_argument("--devices-json", type=str, default=None, help="Poll the devices in this file over HTTP instead of replaying payloads")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare with the baseline, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before a metric counts as a regression")
+    # Internal, runs one size and prints the results as JSON
+    parser.add_argument("--devices", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.devices is not None:
+        print(json.dumps(run_size(args)))
+        return
+
+    results = {}
+    print(f"{'devices':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'points/s':>11} {'cpu us/pt':>10} {'rss MiB':>8}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        command = [sys.executable, __file__, *sys.argv[1:], "--devices", str(size)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        # The result is the last line, anything before it is the collector's own output
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{result['devices']:>8} {result['cycle_p50_ms']:9.1f} {result['cycle_p95_ms']:9.1f} {result['cycle_p99_ms']:9.1f} "
+            f"{result['cycle_max_ms']:9.1f} {result['points_per_second']:11.0f} {result['cpu_us_per_point']:10.2f} {result['peak_rss_mib']:8.1f}"
+        )
+        for metric, value in result.items():
+            if metric != "devices":
+                results[f"{size}.{metric}"] = value
+
+    name = f"cycle_{'http' if args.devices_json else 'replay'}_{args.serialization}"
+    if args.save_baseline:
+        print(f"Saved baseline to {baseline.save(name, results)}")
+    if args.compare and baseline.compare(name, results, HIGHER_IS_BETTER, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
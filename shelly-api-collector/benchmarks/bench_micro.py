@@ -0,0 +1,122 @@
+import argparse
+import json
+import sys
+import tempfile
+import timeit
+import baseline
+from fixtures import ROUTES, SPECS, ReplayTransport
+from devices.shelly3em import Shelly3EM
+from devices.gen2 import ShellyGen2
+from services.fanout import structured
+from services.filesinks import encode_ndjson, encode_csv
+from services.remotewrite import encode_point
+from services.parquet import ParquetSink, record_batch, merge, pa
+
+
+
+'''
+Micro-benchmarks of the per-device parse and format work:
+Shelly3EM.format_data_to_influx, the compiled Pro 1 PM model spec extractors,
+a full poll (request replay and JSON decode included), create_point and write_lines,
+and the sink encodings of a Shelly 3EM's lines (parse, NDJSON, CSV, remote write,
+and with pyarrow a cycle's Parquet record batch and the merge of an hour's batches).
+
+Usage: python bench_micro.py [--save-baseline | --compare]
+'''
+
+
+
+def build_cases() -> dict:
+    '''
+    Builds the benchmark cases on polled devices.
+
+    Returns:
+        dict: Case name -> function
+    '''
+    transport = ReplayTransport()
+    shelly3em = Shelly3EM("10.0.0.1", "3em", transport=transport)
+    shelly3em.poll()
+    info = json.loads(ROUTES["/shelly?shelly3em"])
+    status = json.loads(ROUTES["/status"])
+
+    transport.pro1pm_hosts.add("10.0.0.2")
+    pro1pm = ShellyGen2("10.0.0.2", "pro1pm", SPECS["shellypro1pm"], transport=transport)
+    pro1pm.poll()
+    getstatus = json.loads(ROUTES["/rpc/Shelly.GetStatus"])
+    getconfig = json.loads(ROUTES["/rpc/Shelly.GetConfig"])
+    lines = []
+
+    def write_lines(device):
+        lines.clear()
+        device.write_lines(lines)
+
+    # One cycle of a Shelly 3EM as the fan-out encoder gets it
+    shelly3em_lines = []
+    shelly3em.write_lines(shelly3em_lines)
+    parsed = [structured(line) for line in shelly3em_lines]
+
+    if pa:
+        # The rows of a cycle as the parquet sink gets them from the encoder, one partition
+        sink = ParquetSink(tempfile.mkdtemp())
+        encoded = [sink.encode(point) for point in parsed]
+        rows = [row for _, _, row in encoded]
+        tags = {name for _, point_tags, _ in encoded for name in point_tags}
+        hour = [record_batch(rows, tags) for cycle in range(360)]
+
+    cases = {
+        "shelly3em.format_data_to_influx": lambda: shelly3em.format_data_to_influx(info, status),
+        "shelly3em.to_points": shelly3em.to_points,
+        "shelly3em.write_lines": lambda: write_lines(shelly3em),
+        "shellypro1pm.poll": pro1pm.poll,
+        "shellypro1pm.apply_status": lambda: pro1pm.apply_status(getstatus),
+        "shellypro1pm.extract_status": lambda: pro1pm.spec.extract_status(getstatus),
+        "shellypro1pm.extract_config": lambda: pro1pm.spec.extract_config(getconfig),
+        "shellypro1pm.create_point": pro1pm.create_point,
+        "shellypro1pm.write_lines": lambda: write_lines(pro1pm),
+        "shelly3em.parse_lines": lambda: [structured(line) for line in shelly3em_lines],
+        "shelly3em.encode_ndjson": lambda: [encode_ndjson(point) for point in parsed],
+        "shelly3em.encode_csv": lambda: [encode_csv(point) for point in parsed],
+        "shelly3em.encode_remote_write": lambda: [encode_point(point) for point in parsed]
+    }
+    if pa:
+        cases["shelly3em.parquet_batch"] = lambda: record_batch(rows, tags)
+        cases["shelly3em.parquet_table_1h"] = lambda: merge(hour)
+    return cases
+
+
+def measure(function, repeat: int) -> float:
+    '''
+    Times a function with timeit, best of repeat runs.
+
+    Returns:
+        float: Microseconds per call
+    '''
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the device parse and format functions")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case, the best is reported")
+    parser.add_argument("--filter", type=str, default="", help="Only run cases containing this text")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare with the baseline, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a case counts as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    for name, function in build_cases().items():
+        if args.filter not in name:
+            continue
+        results[f"{name}.us_per_call"] = measure(function, args.repeat)
+        print(f"{name:<40} {results[f'{name}.us_per_call']:9.2f} us/call")
+
+    if args.save_baseline:
+        print(f"Saved baseline to {baseline.save('micro', results)}")
+    if args.compare and baseline.compare("micro", results, set(), args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
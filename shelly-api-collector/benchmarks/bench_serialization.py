@@ -0,0 +1,82 @@
+import argparse
+import time
+import tracemalloc
+from fixtures import ReplayTransport, make_fleet
+
+try:
+    from influxdb_client import Point
+except ImportError:
+    Point = None
+
+
+
+'''
+Compares the point dictionary path (to_points() then the influxdb-client
+Point serialization it runs on write) with the direct line protocol path
+(write_lines() with per-device prefixes) for whole-fleet batches.
+
+Usage: python bench_serialization.py --devices 1000 --repeat 20
+'''
+
+
+
+def dict_path(fleet: list) -> int:
+    points = []
+    for device in fleet:
+        points.extend(device.to_points())
+    if Point is None:
+        return len(points)
+    # What the InfluxDB client does with dictionaries before sending them
+    body = "\n".join(Point.from_dict(point).to_line_protocol() for point in points)
+    return len(body)
+
+
+def line_path(fleet: list, lines: list) -> int:
+    lines.clear()
+    for device in fleet:
+        device.write_lines(lines)
+    body = "\n".join(lines)
+    return len(body)
+
+
+def measure(name: str, function, repeat: int) -> None:
+    # CPU time
+    function()
+    start = time.process_time()
+    for _ in range(repeat):
+        function()
+    cpu = (time.process_time() - start) / repeat
+
+    # Allocations of a single batch
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    print(f"{name:<6} {cpu * 1000:9.2f} ms/batch  peak {peak / 1024:9.1f} KiB  live blocks {blocks}")
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark point serialization")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    transport = ReplayTransport()
+    fleet = make_fleet(args.devices, transport)
+    for device in fleet:
+        device.poll()
+
+    if Point is None:
+        print("influxdb-client is not installed, the dict path only builds the dictionaries")
+    print(f"{args.devices} devices, {args.repeat} batches")
+    lines = []
+    dict_cpu = measure("dict", lambda: dict_path(fleet), args.repeat)
+    line_cpu = measure("line", lambda: line_path(fleet, lines), args.repeat)
+    print(f"line protocol path is {dict_cpu / line_cpu:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
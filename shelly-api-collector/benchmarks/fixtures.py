@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+# Benchmarks import the collector modules from src/
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from devices.shelly3em import Shelly3EM
+from devices.gen2 import ShellyGen2
+from services.modelspec import load_specs, DEFAULT_MODELS_DIR
+
+
+
+'''
+Recorded device payloads and a transport that replays them without a network,
+so benchmarks measure the collector's own CPU work.
+'''
+
+
+
+PAYLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+SPECS = load_specs([DEFAULT_MODELS_DIR])
+
+
+def load_payload(name: str) -> str:
+    with open(os.path.join(PAYLOADS_DIR, f"{name}.json"), "r") as file:
+        return file.read()
+
+
+# Request path -> recorded payload (raw JSON text, decoded on every request like a real response)
+ROUTES = {
+    "/shelly?shelly3em": load_payload("shelly3em_shelly"),
+    "/status": load_payload("shelly3em_status"),
+    "/shelly?shellypro1pm": load_payload("shellypro1pm_shelly"),
+    "/rpc/Shelly.GetStatus": load_payload("shellypro1pm_shelly_getstatus"),
+    "/rpc/Shelly.GetConfig": load_payload("shellypro1pm_shelly_getconfig")
+}
+# The per-component Pro 1 PM methods (single_call=False) answer with their part of Shelly.GetStatus/GetConfig
+_STATUS = json.loads(ROUTES["/rpc/Shelly.GetStatus"])
+_CONFIG = json.loads(ROUTES["/rpc/Shelly.GetConfig"])
+ROUTES.update({
+    "/rpc/Sys.GetStatus": json.dumps(_STATUS["sys"]),
+    "/rpc/WiFi.GetStatus": json.dumps(_STATUS["wifi"]),
+    "/rpc/Input.GetStatus?id=0": json.dumps(_STATUS["input:0"]),
+    "/rpc/Input.GetStatus?id=1": json.dumps(_STATUS["input:1"]),
+    "/rpc/Switch.GetStatus?id=0": json.dumps(_STATUS["switch:0"]),
+    "/rpc/Switch.GetConfig?id=0": json.dumps(_CONFIG["switch:0"])
+})
+
+
+
+class ReplayResponse:
+    def __init__(self, text: str):
+        self.status_code = 200
+        self.text = text
+
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+    def json(self):
+        return json.loads(self.text)
+
+
+
+class ReplayTransport:
+    '''
+    Stands in for services.transport.Transport, serving the recorded payloads.
+    Hosts listed in pro1pm_hosts answer /shelly as a Pro 1 PM, others as a 3EM.
+    '''
+    def __init__(self):
+        self.requests: int = 0
+        self.pro1pm_hosts: set = set()
+
+
+    def get(self, url: str, **kwargs) -> ReplayResponse:
+        self.requests += 1
+        parts = urlsplit(url)
+        path = parts.path
+        if path == "/shelly":
+            path += "?shellypro1pm" if parts.netloc in self.pro1pm_hosts else "?shelly3em"
+        elif parts.query:
+            path += f"?{parts.query}"
+        return ReplayResponse(ROUTES[path])
+
+
+    def close_host(self, host: str) -> None:
+        pass
+
+
+
+def make_fleet(count: int, transport: ReplayTransport) -> list:
+    '''
+    Builds a fleet of half Shelly 3EM and half Shelly Pro 1 PM device classes.
+
+    Args:
+        count (int): The number of devices
+        transport (ReplayTransport): The transport serving the payloads
+
+    Returns:
+        list: The device classes
+    '''
+    fleet = []
+    for index in range(count):
+        ip = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+        if index % 2:
+            transport.pro1pm_hosts.add(ip)
+            fleet.append(ShellyGen2(ip, f"pro1pm {index}", SPECS["shellypro1pm"], transport=transport))
+        else:
+            fleet.append(Shelly3EM(ip, f"3em {index}", transport=transport))
+    return fleet
+
+
+
+class NullSink:
+    '''
+    Stands in for services.influx.InfluxSink, counting the records instead of writing them.
+    '''
+    def __init__(self):
+        self.records: int = 0
+        self.writes: int = 0
+
+
+    def write(self, records: list) -> None:
+        self.records += len(records)
+        self.writes += 1
+
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,74 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from services.parquet import scan, downsample, compact, export, pa
+
+
+
+'''
+Reads the Parquet archive written by the parquet sink (see services.parquet).
+Only the files of the requested days and devices are opened and only the requested fields are read,
+so months of a few fields scan in seconds. The points, or with --every their per-bucket count, mean,
+min and max, are written as CSV to stdout or to --output (.csv or .parquet).
+--compact merges the part files of the finished days into one file per device and day,
+run it daily (e.g. from cron) to keep scans of long ranges fast.
+
+Usage: python archive.py --measurement shellypro1pm --start 2026-01-01 --end 2026-07-01 [--devices 30C6F7000001] [--fields switch_0_apower] [--every 3600]
+       python archive.py --compact
+'''
+
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Read or compact the Parquet archive.")
+    parser.add_argument("--dir", type=str, default=os.getenv("PARQUET_DIR", "output/parquet"), help="The archive directory")
+    parser.add_argument("--measurement", type=str, default="", help="The measurement to read, e.g. shelly3em or shellypro1pm")
+    parser.add_argument("--start", type=str, default="", help="First UTC day to read, YYYY-MM-DD")
+    parser.add_argument("--end", type=str, default="", help="UTC day to stop before, YYYY-MM-DD")
+    parser.add_argument("--devices", type=str, default="", help="Comma separated device MACs (or IPs), every device when blank")
+    parser.add_argument("--fields", type=str, default="", help="Comma separated fields and tags to read, every column when blank")
+    parser.add_argument("--every", type=int, default=0, help="Aggregate the numeric fields into buckets of this many seconds")
+    parser.add_argument("--by", type=str, default="", help="Comma separated tags grouped on next to the device with --every, e.g. component,index")
+    parser.add_argument("--output", type=str, default="", help="Write to this .csv or .parquet file instead of stdout")
+    parser.add_argument("--compact", action="store_true", help="Merge the files of the days that ended more than a day ago")
+    parser.add_argument("--compression", type=str, default=os.getenv("PARQUET_COMPRESSION", "zstd"), help="Compression of the compacted files")
+    return parser.parse_args()
+
+
+def split(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main():
+    load_dotenv()
+    args = parse_args()
+    if pa is None:
+        print("Error: the archive needs pyarrow, pip install pyarrow.")
+        return
+
+    started_at = time.perf_counter()
+    if args.compact:
+        # The collector still writes the previous day until its buffers rotate
+        before = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        merged = compact(args.dir, before, args.compression)
+        print(f"Compacted {merged} files of the days before {before} in {time.perf_counter() - started_at:.1f} s.")
+        return
+    if not args.measurement:
+        print("Error: set --measurement or --compact.")
+        return
+
+    by = split(args.by)
+    columns = split(args.fields)
+    table = scan(args.dir, args.measurement, args.start, args.end, split(args.devices), columns + by if columns else None)
+    rows = table.num_rows
+    if args.every and rows:
+        table = downsample(table, args.every, by)
+    export(table, args.output)
+    print(f"Read {rows} points of {args.measurement} in {time.perf_counter() - started_at:.2f} s.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import requests
+import json
+import time
+from services.infocache import StaticInfoCache
+from services.modelspec import ModelSpec, lookup
+from services.transport import Transport, DEFAULT_TRANSPORT
+from services.lineprotocol import render_prefix, render_fields, append_line
+
+
+
+'''
+Shelly Gen2 device class (Pro 1 PM, Pro 4 PM, ...)
+The fields come from the model spec (src/models/<model>.json), see services/modelspec.py
+'''
+
+
+
+class ShellyGen2:
+    # Gen2, streams status notifications over the /rpc WebSocket
+    supports_push = True
+
+
+    def __init__(
+            self,
+            ip: str,
+            name: str,
+            spec: ModelSpec,
+            info_cache: StaticInfoCache = None,
+            transport: Transport = None,
+            single_call: bool = True
+        ):
+        self.ip_address = ip
+        self.name = name
+        self.spec = spec
+        self.model = spec.model
+        self.info_cache = info_cache or StaticInfoCache()
+        self.transport = transport or DEFAULT_TRANSPORT
+        # Collect with Shelly.GetStatus (+ Shelly.GetConfig when the config changes)
+        # instead of one request per component
+        self.single_call = single_call
+        self.fields = None
+        self.config_fields = None
+        self._config_rev = None
+        # Latest Shelly.GetStatus document, kept up to date by push notifications
+        self.status = None
+        self.polled_at = None
+        # Line protocol prefix, rendered once per /shelly info
+        self._prefix = None
+        self._prefix_info = None
+
+
+    def poll(self):
+        if not self.get_all():
+            return False
+        self.polled_at = time.time_ns()
+        return True
+
+
+    @property
+    def key(self):
+        return (self.model, self.ip_address)
+
+
+    def to_points(self, deadband=None):
+        self.create_point()
+        self.point["time"] = self.polled_at
+        if deadband:
+            self.point["fields"] = deadband.filter((self.key, "device", None), self.point["fields"])
+            if not self.point["fields"]:
+                return []
+        return [self.point]
+
+
+    def get_point(self):
+        if not self.get_all():
+            return None
+        self.create_point()
+        return self.point
+
+
+    def get_points(self):
+        point = self.get_point()
+        return [point] if point else []
+
+
+    def get_all(self):
+        try:
+            if self.single_call:
+                self.apply_status(self.rpc("Shelly.GetStatus"))
+            else:
+                self.apply_status(self.get_components(self.spec.status_methods))
+            self.all = {
+                'info': self.info,
+                'fields': self.fields,
+                'config_fields': self.config_fields
+            }
+            return True
+        except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Error fetching {self.model} data: {e}")
+            return False
+
+
+    def get_components(self, methods: dict):
+        '''
+        Assembles a Shelly.GetStatus/GetConfig shaped document with one request per component.
+
+        Args:
+           methods (dict): Component key -> RPC method, e.g. "switch:0" -> "Switch.GetStatus?id=0"
+
+        Returns:
+            dict: The document
+        '''
+        return {component: self.rpc(method) for component, method in methods.items()}
+
+
+    def apply_status(self, status: dict):
+        '''
+        Updates the readings from a Shelly.GetStatus document, polled or
+        assembled from WebSocket notifications.
+        The config is only requested again when the config revision changed.
+
+        Args:
+           status (dict): The Shelly.GetStatus response
+
+        Returns:
+            None
+        '''
+        self.status = status
+        self.fields = self.spec.extract_status(status)
+        self.info = self.get_cached_info(status["sys"]["cfg_rev"], status["sys"]["uptime"])
+        if self.config_fields is None or self._config_rev != status["sys"]["cfg_rev"]:
+            if self.single_call:
+                config = self.rpc("Shelly.GetConfig")
+            else:
+                config = self.get_components(self.spec.config_methods)
+            self.config_fields = self.spec.extract_config(config)
+            self._config_rev = status["sys"]["cfg_rev"]
+
+
+    def mqtt_prefix(self):
+        '''
+        The default Gen2 MQTT topic prefix (the device id), known once /shelly was fetched.
+
+        Args:
+           None
+
+        Returns:
+            str: The topic prefix, None if not known yet
+        '''
+        info = self.info_cache.info
+        return info["id"] if info else None
+
+
+    def energy_counters(self):
+        '''
+        The cumulative Wh counters for the energy series, per channel of the spec.
+
+        Args:
+           None
+
+        Returns:
+            tuple: (tags, uptime, [(channel, total Wh, returned Wh)]), None before the first poll
+        '''
+        if self.polled_at is None or not self.spec.energy:
+            return None
+        channels = []
+        for channel, component, total, returned in self.spec.energy:
+            data = self.status[component]
+            channels.append((channel, lookup(data, total, 0.0), lookup(data, returned) if returned else None))
+        return {"model": self.model, "mac": self.info["mac"]}, self.status["sys"]["uptime"], channels
+
+
+    def series(self, components: tuple = None):
+        '''
+        The latest reading as (component, index, fields), one "device" series like create_point().
+
+        Args:
+           components (tuple): Unused, Gen2 devices have a single series
+
+        Returns:
+            list: The series
+        '''
+        return [("device", None, {**self.fields, **self.config_fields})]
+
+
+    def rpc(self, method: str):
+        '''
+        Calls a Gen2 RPC method on the /rpc endpoint.
+
+        Args:
+           method (str): The RPC method and query, e.g. "Switch.GetStatus?id=0"
+
+        Returns:
+            dict: The JSON response data
+        '''
+        response = self.transport.get(f"http://{self.ip_address}/rpc/{method}")
+        response.raise_for_status()
+        return response.json()
+
+
+    def get_cached_info(self, revision: int, uptime: int):
+        '''
+        Returns the /shelly info from the cache, only fetching it again when
+        the config revision changed, the device rebooted or the cache expired.
+
+        Args:
+           revision (int): The config revision (sys.cfg_rev)
+           uptime (int): The uptime in seconds (sys.uptime)
+
+        Returns:
+            dict: The /shelly info
+        '''
+        if self.info_cache.is_stale(revision, uptime):
+            self.info_cache.update(self.get_info(), revision, uptime)
+        else:
+            self.info_cache.seen(uptime)
+        return self.info_cache.info
+
+
+    def get_info(self):
+        '''
+        Fetches the basic information from the /shelly endpoint, the keys listed in the spec become tags.
+
+        Args:
+           None
+
+        Returns:
+            dict: The JSON response from the /shelly endpoint.
+        '''
+        response = self.transport.get(f"http://{self.ip_address}/shelly")
+        response.raise_for_status()
+        data = response.json()
+        return {
+            "ip" : self.ip_address,
+            "user_defined_name" : self.name,
+            **{key: data[key] for key in self.spec.info_fields}
+        }
+
+
+    def create_point(self):
+        '''
+        Constructs a dictionary in the InfluxDB Flux point structure\n
+        stored in self.point
+
+        Args:
+           None
+
+        Returns:
+            None
+        '''
+        self.point =  {
+            "measurement": self.spec.measurement,
+            "tags": {
+                **self.info
+            },
+            "fields": {
+                **self.fields,
+                **self.config_fields
+            }
+        }
+
+
+    def write_lines(self, lines: list, deadband=None):
+        '''
+        Appends the same point as create_point() to a line protocol buffer.
+        The escaped measurement and tags are only rendered when the info changes.
+
+        Args:
+           lines (list): The line protocol buffer
+           deadband (DeadbandFilter): Only emits the fields that changed, optional
+
+        Returns:
+            None
+        '''
+        if self._prefix_info is not self.info:
+            self._prefix = render_prefix(self.spec.measurement, self.info)
+            self._prefix_info = self.info
+        if deadband:
+            fields = {**self.fields, **self.config_fields}
+            append_line(lines, self._prefix, render_fields(deadband.filter((self.key, "device", None), fields)), self.polled_at)
+            return
+        fields = ",".join(filter(None, (render_fields(self.fields), render_fields(self.config_fields))))
+        append_line(lines, self._prefix, fields, self.polled_at)
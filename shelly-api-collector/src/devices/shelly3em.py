@@ -1,15 +1,172 @@
 import requests
+import time
+from services.infocache import StaticInfoCache
+from services.transport import DEFAULT_TRANSPORT
+from services.lineprotocol import render_prefix, render_fields, append_line
 
 
 
 
 class Shelly3EM:
-    def __init__(self, ip_address):
+    def __init__(self, ip_address, name=None, info_cache=None, transport=None):
         self.ip_address = ip_address
+        self.name = name
+        self.model = "shelly3em"
+        self.info_cache = info_cache or StaticInfoCache()
+        self.transport = transport or DEFAULT_TRANSPORT
+        # Latest poll
+        self.status = None
+        self.polled_at = None
+        # Line protocol prefixes per component, rendered once per tag set
+        self._prefixes = {}
+        self._prefix_source = None
+
+    def get_points(self):
+        if not self.poll():
+            return []
+        return self.format_data_to_influx(self.info_cache.info, self.status)
+
+    def poll(self):
+        try:
+            self.apply_status(self.get_status())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error fetching Shelly 3EM data from {self.ip_address}: {e}")
+            return False
+        self.polled_at = time.time_ns()
+        return True
+
+    def apply_status(self, status):
+        # Polled /status or the same document published to MQTT
+        # Only fetch /shelly again when the config or firmware changed
+        revision = (status.get("cfg_changed_cnt"), status.get("update", {}).get("old_version"))
+        if self.info_cache.is_stale(revision, status.get("uptime")):
+            self.info_cache.update(self.get_info(), revision, status.get("uptime"))
+        else:
+            self.info_cache.seen(status.get("uptime"))
+        self.status = status
+
+    def energy_counters(self):
+        # Cumulative Wh per emeter for the energy series: (tags, uptime, [(channel, total, returned)])
+        info = self.info_cache.info
+        if self.status is None or info is None:
+            return None
+        channels = [(f"emeter_{index}", emeter["total"], emeter["total_returned"]) for index, emeter in enumerate(self.status["emeters"])]
+        return {"model": self.model, "mac": info["mac"]}, self.status.get("uptime"), channels
+
+    def mqtt_prefix(self):
+        # Default Gen1 topic prefix, known once /shelly was fetched
+        info = self.info_cache.info
+        return f"shellies/shellyem3-{info['mac']}" if info else None
+
+    def to_points(self, deadband=None, components=None):
+        points = self.format_data_to_influx(self.info_cache.info, self.status)
+        # (point, component of its deadband state)
+        selected = []
+        for point in points:
+            component = point["tags"]["component"]
+            if not components or component in components:
+                selected.append((point, component))
+            elif component == "common" and "total_power" in components:
+                # Only the common field a CoIoT packet carries, with its own deadband state
+                point["fields"] = {"total_power": point["fields"]["total_power"]}
+                selected.append((point, "total_power"))
+        for point, _ in selected:
+            point["time"] = self.polled_at
+        if deadband:
+            for point, component in selected:
+                point["fields"] = deadband.filter((self.key, component, point["tags"].get("index")), point["fields"])
+        return [point for point, _ in selected if point["fields"]]
+
+    @property
+    def key(self):
+        return (self.model, self.ip_address)
+
+    def _fields(self, deadband, component, index, fields):
+        if deadband:
+            fields = deadband.filter((self.key, component, index), fields)
+        return render_fields(fields)
+
+    def _prefix(self, component, index=None):
+        info = self.info_cache.info
+        source = (info["type"], info["mac"], info["fw"], self.status["wifi_sta"]["ip"])
+        if source != self._prefix_source:
+            self._prefixes = {}
+            self._prefix_source = source
+        prefix = self._prefixes.get((component, index))
+        if prefix is None:
+            tags = {
+                "type": source[0],
+                "mac": source[1],
+                "fw": source[2],
+                "ip": source[3],
+                "component": component
+            }
+            if index is not None:
+                tags["index"] = index
+            prefix = render_prefix(self.model, tags)
+            self._prefixes[(component, index)] = prefix
+        return prefix
+
+    def write_lines(self, lines, deadband=None, components=None):
+        # Same series and fields as format_data_to_influx, written as line protocol
+        # components limits the series, e.g. to the ones a CoIoT status packet updated
+        data = self.status
+        timestamp = self.polled_at
+        if not components or "relay" in components:
+            for index, relay in enumerate(data["relays"]):
+                append_line(lines, self._prefix("relay", index), self._fields(deadband, "relay", index, relay), timestamp)
+        if not components or "emeter" in components:
+            for index, emeter in enumerate(data["emeters"]):
+                append_line(lines, self._prefix("emeter", index), self._fields(deadband, "emeter", index, emeter), timestamp)
+        if not components or "emeter_n" in components:
+            append_line(lines, self._prefix("emeter_n"), self._fields(deadband, "emeter_n", None, data["emeter_n"]), timestamp)
+        if not components or "common" in components:
+            common = {
+                "total_power": data["total_power"],
+                "ram_total": data["ram_total"],
+                "ram_free": data["ram_free"],
+                "uptime": data["uptime"]
+            }
+            append_line(lines, self._prefix("common"), self._fields(deadband, "common", None, common), timestamp)
+        elif "total_power" in components:
+            # Only the common field a CoIoT packet carries, with its own deadband state
+            append_line(lines, self._prefix("common"), self._fields(deadband, "total_power", None, {"total_power": data["total_power"]}), timestamp)
+        if not components or "wifi" in components:
+            append_line(lines, self._prefix("wifi"), self._fields(deadband, "wifi", None, data["wifi_sta"]), timestamp)
+
+    def series(self, components=None):
+        # (component, index, fields) of the latest reading, the same series as write_lines
+        data = self.status
+        series = []
+        if not components or "relay" in components:
+            series.extend(("relay", index, relay) for index, relay in enumerate(data["relays"]))
+        if not components or "emeter" in components:
+            series.extend(("emeter", index, emeter) for index, emeter in enumerate(data["emeters"]))
+        if not components or "emeter_n" in components:
+            series.append(("emeter_n", None, data["emeter_n"]))
+        if not components or "common" in components:
+            common = {
+                "total_power": data["total_power"],
+                "ram_total": data["ram_total"],
+                "ram_free": data["ram_free"],
+                "uptime": data["uptime"]
+            }
+            series.append(("common", None, common))
+        elif "total_power" in components:
+            series.append(("common", None, {"total_power": data["total_power"]}))
+        if not components or "wifi" in components:
+            series.append(("wifi", None, data["wifi_sta"]))
+        return series
+
+    def get_info(self):
+        url = f"http://{self.ip_address}/shelly"
+        response = self.transport.get(url)
+        response.raise_for_status()
+        return response.json()
 
     def get_status(self):
         url = f"http://{self.ip_address}/status"
-        response = requests.get(url)
+        response = self.transport.get(url)
         if response.status_code == 200:
             return response.json()
         else:
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dotenv import load_dotenv
+from services.discovery import Discovery, merge_inventory
+from services.modelspec import load_specs, DEFAULT_MODELS_DIR
+from services.registry import DeviceRegistry
+from utils.loaddevices import FromJson
+
+
+
+'''
+Discovers the Shelly devices on the LAN and writes them to devices.json.
+Scans the given subnets with concurrent /shelly probes and listens for mDNS announcements,
+then merges the supported devices into the devices file (see services.discovery).
+A running collector picks up the new file on its next reload.
+
+Usage: python discover.py --subnets 192.168.1.0/24,10.0.0.0/16 [--mdns-seconds 5] [--output devices.json]
+'''
+
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Discover Shelly devices and write them to devices.json.")
+    parser.add_argument("--subnets", type=str, default=os.getenv("DISCOVERY_SUBNETS", ""), help="Comma separated subnets to scan, e.g. 192.168.1.0/24")
+    parser.add_argument("--port", type=int, default=80, help="HTTP port of the devices")
+    parser.add_argument("--concurrency", type=int, default=1024, help="Probes in flight, capped by the open files limit")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Seconds per probe, connect included")
+    parser.add_argument("--mdns-seconds", type=float, default=5.0, help="Seconds to listen for mDNS announcements, 0 disables mDNS")
+    parser.add_argument("--output", type=str, default=os.getenv("JSON_FILE", "devices.json"), help="The devices file to merge the devices into")
+    parser.add_argument("--prune", action="store_true", help="Remove the devices that were not found from the devices file")
+    parser.add_argument("--dry-run", action="store_true", help="Print the devices instead of writing the devices file")
+    return parser.parse_args()
+
+
+def load_existing(file_path: str, specs: dict) -> list:
+    '''
+    Loads the current devices file, an invalid entry is kept as is but reported.
+
+    Args:
+        file_path (str): The devices file
+        specs (dict): The Gen2 model specs, MODELS_DIR included, {model: ModelSpec}
+
+    Returns:
+        list: The devices of the file, empty without one
+
+    Raises:
+        ValueError: If the file is not valid JSON or not a list
+    '''
+    if not os.path.exists(file_path):
+        return []
+    devices = FromJson(file_path, [*DeviceRegistry.MODEL_FACTORIES, *specs])
+    if not isinstance(devices.devices, list):
+        raise ValueError("expected a list of devices")
+    devices.validate_devices()
+    for device in devices.invalid_devices:
+        print(f"Keeping invalid entry {device} of {file_path}")
+    return devices.devices
+
+
+def write_devices(file_path: str, devices: list) -> None:
+    # Replaced in one step, so a collector reloading the file never reads it half written
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(devices, file, indent=4)
+    os.replace(temporary_path, file_path)
+
+
+def main():
+    load_dotenv()
+    args = parse_args()
+    networks = [subnet.strip() for subnet in args.subnets.split(",") if subnet.strip()]
+    if not networks and args.mdns_seconds <= 0:
+        print("Error: nothing to do, set --subnets and/or --mdns-seconds.")
+        return
+
+    specs = load_specs([DEFAULT_MODELS_DIR, os.getenv("MODELS_DIR", "")])
+    existing = []
+    if not args.dry_run:
+        # Read before the scan, a broken devices file is reported without scanning for nothing
+        try:
+            existing = load_existing(args.output, specs)
+        except ValueError as e:
+            # json.JSONDecodeError included
+            print(f"Error: {args.output} is not a valid devices file, fix or remove it first: {e}")
+            sys.exit(1)
+    discovery = Discovery(specs, port=args.port, concurrency=args.concurrency, timeout=args.timeout)
+    print(f"Scanning {', '.join(networks) or 'no subnets'} with {discovery.concurrency} concurrent probes" + (f", listening for mDNS for {args.mdns_seconds:.0f} seconds" if args.mdns_seconds > 0 else ""))
+    found = asyncio.run(discovery.run(networks, args.mdns_seconds))
+    print(f"Discovery: {discovery.summary()}")
+
+    if args.dry_run:
+        print(json.dumps(found, indent=4))
+        return
+    devices, added, moved = merge_inventory(existing, found, args.prune)
+    write_devices(args.output, devices)
+    print(f"Wrote {len(devices)} devices to {args.output}: {added} added, {moved} moved to a new IP.")
+
+
+if __name__ == "__main__":
+    main()
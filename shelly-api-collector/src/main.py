@@ -1,145 +1,160 @@
-import requests
-import json
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
 from dotenv import load_dotenv
 import os
-import time
-# Device classes
-from devices.shelly3em import Shelly3EM
-from devices.shellypro1pm import ShellyPro1Pm
+import asyncio
+import signal
+# Services
+from services.collector import Collector
+from services.influx import InfluxSink
+from services.filesinks import NdjsonSink, CsvSink
+from services.remotewrite import RemoteWriteSink
+from services.parquet import ParquetSink
+from services.writer import BatchWriter
+from services.fanout import FanOut
+from services.spool import Spool
+from services.devicesfile import DevicesFile
+from services.supervisor import Supervisor
+from services.metrics import Metrics, MetricsServer
 
 
 
 
-def get_devices(file_path):
+def get_influx_settings():
     """
-    Reads the devices list from a JSON file.
-    
-    Args:
-        file_path (str): The path to the devices.json file.
+    Loads InfluxDB connection settings from a .env file.
 
     Returns:
-        list: A list of devices with their IPs and models.
+        dict: A dictionary containing InfluxDB settings.
     """
-    try:
-        with open(file_path, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return []
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {e}")
-        return []
-
-
-def get_shelly_info(base_url):
-    '''
-    Fetches the basic information from the /shelly endpoint.
-    
-    Args:
-        base_url (str): The base URL of the Shelly device (e.g., http://192.168.1.100).
-
-    Returns:
-        dict: The JSON response from the /shelly endpoint.
-    '''
-    try:
-        response = requests.get(f"{base_url}/shelly")
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching Shelly info: {e}")
-        return None
+    load_dotenv()
+    return {
+        "url": os.getenv("INFLUXDB_URL"),
+        "token": os.getenv("INFLUXDB_TOKEN"),
+        "org": os.getenv("INFLUXDB_ORG"),
+        "bucket": os.getenv("INFLUXDB_BUCKET")
+    }
 
 
-def get_meter_status(base_url):
+def get_sink_settings():
     """
-    Fetches the meter statuses from the /status endpoint.
-    
-    Args:
-        base_url (str): The base URL of the Shelly device (e.g., http://192.168.1.100).
+    Loads the output sink settings from a .env file.
 
     Returns:
-        dict: The JSON response from the /status endpoint.
+        dict: A dictionary containing the sink settings.
     """
-    try:
-        response = requests.get(f"{base_url}/status")
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching meter status: {e}")
-        return None
+    load_dotenv()
+    return {
+        "sinks": [sink.strip().lower() for sink in os.getenv("SINKS", "influx").split(",") if sink.strip()],
+        "ndjson_dir": os.getenv("NDJSON_DIR", "output/ndjson"),
+        "csv_dir": os.getenv("CSV_DIR", "output/csv"),
+        "file_rotate_bytes": int(os.getenv("FILE_ROTATE_BYTES", str(64 * 1024 * 1024))),
+        "file_rotate_seconds": float(os.getenv("FILE_ROTATE_SECONDS", "3600")),
+        "file_keep": int(os.getenv("FILE_KEEP", "168")),
+        "remote_write_url": os.getenv("REMOTE_WRITE_URL", ""),
+        "remote_write_token": os.getenv("REMOTE_WRITE_TOKEN", ""),
+        "remote_write_timeout": float(os.getenv("REMOTE_WRITE_TIMEOUT", "10")),
+        "parquet_dir": os.getenv("PARQUET_DIR", "output/parquet"),
+        "parquet_rotate_bytes": int(os.getenv("PARQUET_ROTATE_BYTES", str(64 * 1024 * 1024))),
+        "parquet_rotate_seconds": float(os.getenv("PARQUET_ROTATE_SECONDS", "3600")),
+        "parquet_compression": os.getenv("PARQUET_COMPRESSION", "zstd")
+    }
 
 
-def get_influx_settings():
+def create_sinks(sink_settings, influx_settings):
     """
-    Loads InfluxDB connection settings from a .env file.
+    Creates the output sinks listed in SINKS.
 
     Returns:
-        dict: A dictionary containing InfluxDB settings.
+        dict: Sink name -> sink, empty if a sink is unknown or not configured.
     """
-    load_dotenv()
-    return {
-        "url": os.getenv("INFLUXDB_URL"),
-        "token": os.getenv("INFLUXDB_TOKEN"),
-        "org": os.getenv("INFLUXDB_ORG"),
-        "bucket": os.getenv("INFLUXDB_BUCKET")
-    }
+    sinks = {}
+    for name in sink_settings["sinks"]:
+        if name == "influx":
+            sinks[name] = InfluxSink(**influx_settings)
+        elif name == "ndjson":
+            sinks[name] = NdjsonSink(sink_settings["ndjson_dir"], sink_settings["file_rotate_bytes"], sink_settings["file_rotate_seconds"], sink_settings["file_keep"])
+        elif name == "csv":
+            sinks[name] = CsvSink(sink_settings["csv_dir"], sink_settings["file_rotate_bytes"], sink_settings["file_rotate_seconds"], sink_settings["file_keep"])
+        elif name == "remote_write":
+            if not sink_settings["remote_write_url"]:
+                print("Error: REMOTE_WRITE_URL environment variable not set.")
+                return {}
+            sinks[name] = RemoteWriteSink(sink_settings["remote_write_url"], sink_settings["remote_write_token"], sink_settings["remote_write_timeout"])
+        elif name == "parquet":
+            try:
+                sinks[name] = ParquetSink(sink_settings["parquet_dir"], sink_settings["parquet_rotate_bytes"], sink_settings["parquet_rotate_seconds"], sink_settings["parquet_compression"])
+            except ImportError as e:
+                print(f"Error: {e}.")
+                return {}
+        else:
+            print(f"Error: unknown sink {name} in SINKS, expected influx, ndjson, csv, remote_write or parquet.")
+            return {}
+    return sinks
 
 
-def format_data_to_influx(info, data, model):
+def get_collector_settings():
     """
-    Formats Shelly data into InfluxDB point format.
-
-    Args:
-        info (dict): The info to format.
-        data (dict): The data to format.
-        model (str): The model of the Shell device.
+    Loads the collector polling settings from a .env file.
 
     Returns:
-        list: A list of InfluxDB Point objects.
+        dict: A dictionary containing the collector settings.
     """
-    # Blank points list to append points 
-    points = []
-    
-    # Common tags for all points
-    common_tags = {
-        "type": info["type"],
-        "mac": info["mac"],
-        "fw" : info["fw"],
-        "ip" : data["wifi_sta"]["ip"]
+    load_dotenv()
+    return {
+        "poll_interval_seconds": float(os.getenv("POLL_INTERVAL_SECONDS", "10")),
+        "scheduler_tick_seconds": float(os.getenv("SCHEDULER_TICK_SECONDS", "0.05")),
+        "serialization": os.getenv("SERIALIZATION", "line").lower(),
+        "deadband_file": os.getenv("DEADBAND_FILE", ""),
+        "models_dir": os.getenv("MODELS_DIR", ""),
+        "energy_windows": os.getenv("ENERGY_WINDOWS", "1m,15m,1h"),
+        "history_seconds": float(os.getenv("HISTORY_SECONDS", "0")),
+        "history_max_samples": int(os.getenv("HISTORY_MAX_SAMPLES", "100000")),
+        "history_fields": [pattern.strip() for pattern in os.getenv("HISTORY_FIELDS", "*").split(",") if pattern.strip()],
+        "ingestion": os.getenv("INGESTION_MODE", "poll").lower(),
+        "ws_reconnect_seconds": float(os.getenv("WS_RECONNECT_SECONDS", "5")),
+        "mqtt_host": os.getenv("MQTT_HOST", "localhost"),
+        "mqtt_port": int(os.getenv("MQTT_PORT", "1883")),
+        "mqtt_username": os.getenv("MQTT_USERNAME", ""),
+        "mqtt_password": os.getenv("MQTT_PASSWORD", ""),
+        "mqtt_topics": [topic.strip() for topic in os.getenv("MQTT_TOPICS", "shellies/+/info,+/status/+,+/events/rpc").split(",") if topic.strip()],
+        "mqtt_stale_seconds": float(os.getenv("MQTT_STALE_SECONDS", "90")),
+        "coiot_enabled": os.getenv("COIOT_ENABLED", "false").lower() == "true",
+        "coiot_bind": os.getenv("COIOT_BIND", "0.0.0.0"),
+        "coiot_port": int(os.getenv("COIOT_PORT", "5683")),
+        "coiot_group": os.getenv("COIOT_GROUP", "224.0.1.187"),
+        "metrics_port": int(os.getenv("METRICS_PORT", "0")),
+        "metrics_bind": os.getenv("METRICS_BIND", "0.0.0.0"),
+        "state_port": int(os.getenv("STATE_PORT", "0")),
+        "state_bind": os.getenv("STATE_BIND", "0.0.0.0"),
+        "workers": int(os.getenv("WORKERS", "1")),
+        "devices_reload_seconds": float(os.getenv("DEVICES_RELOAD_SECONDS", "2")),
+        "breaker_failures": int(os.getenv("BREAKER_FAILURES", "3")),
+        "breaker_backoff_seconds": float(os.getenv("BREAKER_BACKOFF_SECONDS", "30")),
+        "breaker_max_backoff_seconds": float(os.getenv("BREAKER_MAX_BACKOFF_SECONDS", "600")),
+        "max_concurrency": int(os.getenv("MAX_CONCURRENCY", "64")),
+        "info_ttl_seconds": float(os.getenv("INFO_TTL_SECONDS", "3600")),
+        "http_connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "2")),
+        "http_read_timeout": float(os.getenv("HTTP_READ_TIMEOUT", "5")),
+        "write_batch_size": int(os.getenv("WRITE_BATCH_SIZE", "5000")),
+        "write_flush_interval": float(os.getenv("WRITE_FLUSH_INTERVAL", "1")),
+        "write_max_pending": int(os.getenv("WRITE_MAX_PENDING", "100000")),
+        "write_max_retries": int(os.getenv("WRITE_MAX_RETRIES", "5")),
+        "spool_dir": os.getenv("SPOOL_DIR", ""),
+        "spool_max_bytes": int(os.getenv("SPOOL_MAX_BYTES", str(1024 * 1024 * 1024))),
+        "spool_segment_bytes": int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024))),
+        "spool_fsync_interval": float(os.getenv("SPOOL_FSYNC_INTERVAL", "1"))
     }
-    
-    #################################
-    # Process the "shelly3em" model #
-    #################################
-    if model == "shelly3em":
-        shelly_device = Shelly3EM(info["ip"])
-        points = shelly_device.format_data_to_influx(info, data)
-        
-    return points
-            
-
-def upload_to_influx(influx_settings, points):
-    """
-    Uploads data to an InfluxDB v2 server.
 
-    Args:
-        influx_settings (dict): The InfluxDB connection settings.
-        points (list): The points data to upload.
+
+def stop(signum, frame):
     """
-    try:
-        with InfluxDBClient(url=influx_settings["url"], token=influx_settings["token"], org=influx_settings["org"], verify_ssl=False) as client:
-            write_api = client.write_api(write_options=SYNCHRONOUS)
-            write_api.write(bucket=influx_settings["bucket"], record=points)
-            print(f"Wrote {len(points)} points to InfluxDB.")
-    except Exception as e:
-        print(f"Error uploading to InfluxDB: {e}")
+    Stops the collector on SIGTERM (docker stop) like on Ctrl+C, so the queued points are flushed.
+    A second SIGTERM does not interrupt the flush.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
 
 
 def main():
-    # TODO: Update to proper logging service
-    # TODO: Update environment loading service
     load_dotenv()
     devices_file = os.getenv("JSON_FILE", "devices.json")
     if not devices_file:
@@ -147,61 +162,71 @@ def main():
         return
 
     print("Fetching devices from devices.json...")
-    devices = get_devices(devices_file)
+    devices_watcher = DevicesFile(devices_file)
+    devices = devices_watcher.load()
 
     if not devices:
         print("No devices found. Exiting.")
         return
 
     influx_settings = get_influx_settings()
+    settings = get_collector_settings()
 
-    # Initialize InfluxDB client
-    # TODO: Make the influx connection and methods a class
-    influx_client = InfluxDBClient(url=influx_settings["url"], token=influx_settings["token"], org=influx_settings["org"])
-    write_api = influx_client.write_api(write_options=SYNCHRONOUS)
-
-    while True:
-        all_points = []
-        for device in devices:
-            # TODO: Initialize classes of each device once then do the get_point() method periodically
-            
-            ###############
-            # Shelly 3 EM #
-            ###############
-            # TODO: Self contain the shelly 3 em class the same as shelly pro 1 pm
-            if device["model"] == "shelly3em":
-                device_class = Shelly3EM(device["ip"])
-
-                print(f"Processing shelly3em at {device_class.ip_address}...")
-
-                print("Fetching Shelly basic info...")
-                shelly_info = get_shelly_info(f"http://{device_class.ip_address}")
-
-                print("Fetching meter statuses...")
-                meter_status = device_class.get_status()
-                if meter_status and shelly_info:
-                    points = device_class.format_data_to_influx(shelly_info, meter_status)
-                    all_points.extend(points)
-
-            ###################
-            # Shelly Pro 1 PM #
-            ###################               
-            elif device["model"] == "shellypro1pm":
-                device_class = ShellyPro1Pm(device["ip"], device["name"])
-                point = device_class.get_point()
-                if point:
-                    all_points.append(point)
-                
-        # Upload all points to InfluxDB
-        if all_points:
-            try:
-                write_api.write(bucket=influx_settings["bucket"], record=all_points)
-                print(f"Wrote {len(all_points)} points to InfluxDB.")
-            except Exception as e:
-                print(f"Error uploading to InfluxDB: {e}")
-
-        print("Sleeping for 10 seconds...")
-        time.sleep(10)
+    # Points are written to every sink in batches on a background thread per sink
+    # and spooled to disk while InfluxDB is unavailable
+    sinks = create_sinks(get_sink_settings(), influx_settings)
+    if not sinks:
+        print("No sinks to write to. Exiting.")
+        return
+    spool = None
+    if settings["spool_dir"] and "influx" in sinks:
+        spool = Spool(
+            settings["spool_dir"],
+            segment_bytes=settings["spool_segment_bytes"],
+            max_bytes=settings["spool_max_bytes"],
+            fsync_interval=settings["spool_fsync_interval"]
+        )
+    # Self-instrumentation, served on /metrics when METRICS_PORT is set
+    metrics = Metrics()
+    metrics_server = None
+    if settings["metrics_port"]:
+        metrics_server = MetricsServer(metrics, settings["metrics_bind"], settings["metrics_port"])
+        metrics_server.start()
+    writers = [
+        BatchWriter(
+            sink,
+            metrics=metrics,
+            spool=spool if name == "influx" else None,
+            batch_size=settings["write_batch_size"],
+            flush_interval=settings["write_flush_interval"],
+            max_pending=settings["write_max_pending"],
+            max_retries=settings["write_max_retries"],
+            name=name
+        )
+        for name, sink in sinks.items()
+    ]
+    # A single sink taking the points as they are needs no fan-out
+    writer = writers[0] if len(writers) == 1 and not writers[0].sink.encoding else FanOut(writers)
+    writer.start()
+    signal.signal(signal.SIGTERM, stop)
+    workers = settings["workers"] or os.cpu_count()
+    try:
+        if workers > 1:
+            # Large fleets are sharded across worker processes sharing this writer
+            Supervisor(settings, devices_watcher, writer, workers).run(devices)
+        else:
+            # devices.json changes are applied while running
+            collector = Collector(settings, writer, metrics, devices_watcher)
+            collector.load(devices)
+            asyncio.run(collector.run())
+    except KeyboardInterrupt:
+        print("Stopping, writing the queued points.")
+    finally:
+        writer.close()
+        for sink in sinks.values():
+            sink.close()
+        if metrics_server:
+            metrics_server.close()
 
 
 if __name__ == "__main__":
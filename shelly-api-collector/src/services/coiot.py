@@ -0,0 +1,270 @@
+import asyncio
+import json
+import socket
+import struct
+import time
+import requests
+from services.poller import Poller
+
+
+
+'''
+CoIoT listener for Gen1 status pushes (Shelly 3EM).
+Gen1 devices multicast compact CoAP status packets (/cit/s) to 224.0.1.187:5683 about once
+a second and on every change. The payload only carries [channel, sensor id, value] triples,
+the sensors are described once per device by its /cit/d endpoint.
+The values are written into the device's polled /status document (relays, emeters
+and total_power) and emitted right away, the other fields keep coming from polls.
+'''
+
+
+
+URI_PATH = 11
+STATUS_CODE = 30
+# Seconds before describing a device again after /cit/d failed
+DESCRIBE_RETRY_SECONDS = 60
+
+# /cit/d sensor description -> /status field
+FIELDS = {
+    "output": "ison",
+    "overpower": "overpower",
+    "power": "power",
+    "voltage": "voltage",
+    "current": "current",
+    "powerFactor": "pf",
+    "energy": "total",
+    "returnedEnergy": "total_returned"
+}
+# /cit/d block description prefix -> /status list
+BLOCKS = {
+    "relay": "relays",
+    "emeter": "emeters"
+}
+CONFIG_CHANGED = "cfgChanged"
+
+
+def parse_coap(data: bytes) -> tuple[int, dict, bytes] | None:
+    '''
+    Parses a CoAP message.
+
+    Args:
+        data (bytes): The UDP datagram
+
+    Returns:
+        tuple[int, dict, bytes] | None: The code, options (number -> list of values) and payload, None if malformed
+    '''
+    if len(data) < 4 or data[0] >> 6 != 1:
+        return None
+    token_length = data[0] & 0x0F
+    code = data[1]
+    position = 4 + token_length
+    options = {}
+    number = 0
+    while position < len(data) and data[position] != 0xFF:
+        delta, length = data[position] >> 4, data[position] & 0x0F
+        position += 1
+        # 13 and 14 extend the delta and length by one or two bytes
+        values = []
+        for nibble in (delta, length):
+            if nibble == 13:
+                values.append(data[position] + 13)
+                position += 1
+            elif nibble == 14:
+                values.append(struct.unpack_from("!H", data, position)[0] + 269)
+                position += 2
+            elif nibble == 15:
+                return None
+            else:
+                values.append(nibble)
+        number += values[0]
+        options.setdefault(number, []).append(data[position:position + values[1]])
+        position += values[1]
+    payload = data[position + 1:] if position < len(data) else b""
+    return code, options, payload
+
+
+def sensor_map(description: dict) -> tuple[dict, int]:
+    '''
+    Maps the sensor ids of a /cit/d description to /status fields.
+
+    Args:
+        description (dict): The /cit/d response
+
+    Returns:
+        tuple[dict, int]: {sensor id: (list name, index, field)} and the id of the cfgChanged sensor
+    '''
+    blocks = {}
+    for block in description.get("blk", []):
+        name, _, index = block["D"].rpartition("_")
+        if name in BLOCKS and index.isdigit():
+            blocks[block["I"]] = (BLOCKS[name], int(index))
+    sensors = {}
+    config_sensor = None
+    for sensor in description.get("sen", []):
+        if sensor["D"] == CONFIG_CHANGED:
+            config_sensor = sensor["I"]
+        links = sensor["L"] if isinstance(sensor["L"], list) else [sensor["L"]]
+        field = FIELDS.get(sensor["D"])
+        for link in links:
+            if field and link in blocks:
+                sensors[sensor["I"]] = (*blocks[link], field)
+    return sensors, config_sensor
+
+
+
+class CoiotProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener):
+        self.listener = listener
+
+
+    def datagram_received(self, data: bytes, address: tuple) -> None:
+        self.listener.received(data, address[0])
+
+
+
+class CoiotListener:
+    # The series the status packets cover, of the common series only total_power:
+    # its other fields come from polls and are not re-written with every packet
+    COMPONENTS = ("relay", "emeter", "total_power")
+
+
+    def __init__(self, on_update, poller: Poller, bind: str = "0.0.0.0", port: int = 5683, group: str = "224.0.1.187"):
+        self.on_update = on_update
+        self.poller = poller
+        self.bind = bind
+        self.port = port
+        self.group = group
+        # Stats
+        self.packets: int = 0
+        self.applied: int = 0
+        self.unknown: int = 0
+        # Source IP -> device, sensor maps per device
+        self._devices: dict = {}
+        self._sensors: dict = {}
+        self._config: dict = {}
+        self._revisions: dict = {}
+        self._describing: set = set()
+        self._retry_at: dict = {}
+        self._transport = None
+
+
+    def add(self, key: tuple, device, config: dict) -> None:
+        if device.model != "shelly3em":
+            return
+        self._devices[device.ip_address.partition(":")[0]] = device
+
+
+    def remove(self, key: tuple) -> None:
+        for host, device in list(self._devices.items()):
+            if device.key == key:
+                del self._devices[host]
+                self._sensors.pop(host, None)
+                self._config.pop(host, None)
+                self._revisions.pop(host, None)
+                self._retry_at.pop(host, None)
+
+
+    async def start(self) -> None:
+        '''
+        Binds the UDP socket and joins the multicast group. Must run on the event loop.
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.bind, self.port))
+        if self.group:
+            membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton("0.0.0.0"))
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            except OSError as e:
+                print(f"Could not join CoIoT multicast group {self.group}, only unicast packets are received: {e}")
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: CoiotProtocol(self), sock=sock)
+        print(f"Listening for CoIoT status packets on {self.bind}:{self.port}")
+
+
+    def _describe(self, host: str, device) -> None:
+        '''
+        Fetches the device's /cit/d sensor description. Runs on the poller's worker pool.
+        '''
+        try:
+            response = device.transport.get(f"http://{device.ip_address}/cit/d")
+            response.raise_for_status()
+            self._sensors[host], self._config[host] = sensor_map(response.json())
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"Error fetching the CoIoT description of {device.ip_address}: {e}")
+            self._retry_at[host] = time.monotonic() + DESCRIBE_RETRY_SECONDS
+        finally:
+            self._describing.discard(host)
+
+
+    def received(self, data: bytes, host: str) -> None:
+        self.packets += 1
+        device = self._devices.get(host)
+        message = parse_coap(data) if device else None
+        if message is None:
+            self.unknown += 1
+            return
+        code, options, payload = message
+        if code != STATUS_CODE or b"/".join(options.get(URI_PATH, [])) != b"cit/s":
+            return
+        sensors = self._sensors.get(host)
+        if sensors is None:
+            if host not in self._describing and time.monotonic() >= self._retry_at.get(host, 0):
+                self._describing.add(host)
+                asyncio.ensure_future(self.poller.call(self._describe, host, device))
+            return
+        try:
+            values = json.loads(payload)["G"]
+        except (ValueError, KeyError):
+            return
+        config = self._config_revision(host, values)
+        if config is not None and config != self._revisions.setdefault(host, config):
+            # Sensors may have changed with the config, describe again
+            self._revisions[host] = config
+            self._sensors.pop(host, None)
+            return
+        if device.status is None:
+            # Not polled yet, the other fields come from the first poll
+            return
+        self.apply(device, sensors, values)
+        self.applied += 1
+        self.on_update(device, self.COMPONENTS)
+
+
+    def _config_revision(self, host: str, values: list):
+        config_sensor = self._config.get(host)
+        for _, sensor, value in values:
+            if sensor == config_sensor:
+                return value
+        return None
+
+
+    def apply(self, device, sensors: dict, values: list) -> None:
+        '''
+        Writes the sensor values into the device's /status document.
+
+        Args:
+            device (Shelly3EM): The device
+            sensors (dict): Its sensor map
+            values (list): The [channel, sensor id, value] triples of a status packet
+        '''
+        status = device.status
+        for _, sensor, value in values:
+            target = sensors.get(sensor)
+            # -1 marks an invalid reading
+            if target is None or value == -1:
+                continue
+            name, index, field = target
+            components = status.get(name)
+            if components and index < len(components):
+                components[index][field] = bool(value) if field in ("ison", "overpower") else value
+        status["total_power"] = round(sum(emeter["power"] for emeter in status["emeters"]), 2)
+        device.polled_at = time.time_ns()
+
+
+    def summary(self) -> str:
+        return f"{self.packets} packets, {self.applied} applied, {self.unknown} from unknown devices, {len(self._sensors)}/{len(self._devices)} described"
+
+
+    def close(self) -> None:
+        if self._transport:
+            self._transport.close()
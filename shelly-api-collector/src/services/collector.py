@@ -0,0 +1,394 @@
+import asyncio
+import time
+from services.poller import Poller
+from services.registry import DeviceRegistry
+from services.modelspec import load_specs, DEFAULT_MODELS_DIR
+from services.scheduler import Scheduler, ScheduleEntry
+from services.transport import Transport
+from services.writer import BatchWriter
+from services.deadband import DeadbandFilter
+from services.push import PushIngestor
+from services.mqtt import MqttIngestor
+from services.coiot import CoiotListener
+from services.metrics import Metrics, POINTS_BUCKETS
+from services.health import HealthTracker
+from services.energy import EnergyAccumulator, parse_windows
+from services.devicesfile import DevicesFile
+from services.history import History
+from services.stateapi import StateCache, StateServer
+
+
+
+'''
+Collector run loop.
+Dispatches device polls from the fixed-rate scheduler, serializes the readings
+of each batch and queues them for the background writer. A summary is printed once per report interval.
+With INGESTION_MODE=push, Gen2 devices stream their changes over a WebSocket instead,
+with INGESTION_MODE=mqtt devices are read from an MQTT broker. Either way a device is
+only polled while it is not streaming.
+Cumulative energy counters are also written as 1 m, 15 m and 1 h Wh deltas (services.energy).
+With HISTORY_SECONDS set the recent readings are also kept in memory for local queries (services.history).
+With STATE_PORT set the latest state of every device is served over HTTP from memory (services.stateapi).
+Devices that keep failing are skipped by their circuit breaker (services.health) between probes.
+With COIOT_ENABLED, Shelly 3EM power readings also arrive from CoIoT status packets between polls.
+When started with its devices file, changes to devices.json are applied while running:
+only the added, removed and changed devices are touched.
+'''
+
+
+
+class Collector:
+    def __init__(self, settings: dict, writer: BatchWriter, metrics: Metrics = None, devices_file: DevicesFile = None):
+        self.settings = settings
+        self.writer = writer
+        # Watched for changes while running, optional
+        self.devices_file = devices_file
+        self.metrics = metrics or Metrics()
+        self.metrics.histogram("collector_cycle_seconds", "Duration of a poll batch, from dispatch to queued points")
+        self.metrics.histogram("collector_cycle_points", "Points serialized per poll batch", buckets=POINTS_BUCKETS)
+        self.metrics.counter("collector_polls_total", "Device polls by result", ("result",))
+        self.metrics.counter("collector_streamed_updates_total", "Readings streamed by push, MQTT or CoIoT")
+        self.metrics.counter("collector_missed_deadlines_total", "Polls skipped because the previous poll was still running")
+        self.transport = Transport(settings["http_connect_timeout"], settings["http_read_timeout"], metrics=self.metrics)
+        # Device classes are built once and reused for every poll
+        # Gen2 models come from the bundled specs, MODELS_DIR adds or overrides models
+        self.specs = load_specs([DEFAULT_MODELS_DIR, settings["models_dir"]])
+        self.registry = DeviceRegistry(self.transport, settings["info_ttl_seconds"], self.specs)
+        self.poller = Poller(settings["max_concurrency"])
+        self.scheduler = Scheduler(settings["poll_interval_seconds"])
+        # Unreachable devices are skipped between probes
+        self.health = HealthTracker(settings["breaker_failures"], settings["breaker_backoff_seconds"], settings["breaker_max_backoff_seconds"])
+        self.metrics.gauge("collector_unhealthy_devices", "Devices by health state, the others are healthy", self.health_counts, ("state",))
+        # CoIoT status packets from Gen1 devices, optional
+        self.coiot = None
+        if settings["coiot_enabled"]:
+            self.coiot = CoiotListener(self._on_update, self.poller, settings["coiot_bind"], settings["coiot_port"], settings["coiot_group"])
+        # Pre-integrated energy series, optional
+        windows = parse_windows(settings["energy_windows"])
+        self.energy = EnergyAccumulator(windows) if windows else None
+        # Recent readings in memory, optional
+        self.history = None
+        if settings["history_seconds"]:
+            self.history = History(
+                settings["history_seconds"],
+                settings["poll_interval_seconds"],
+                max_samples=settings["history_max_samples"],
+                fields=settings["history_fields"]
+            )
+            self.metrics.gauge("collector_history_bytes", "Memory of the in-memory history columns", lambda: {(): self.history.nbytes()})
+        # Latest state served over HTTP, optional
+        self.state = None
+        self.state_server = None
+        if settings["state_port"]:
+            self.state = StateCache()
+            self.state_server = StateServer(self.state, settings["state_bind"], settings["state_port"], self.history)
+        # Change-only emission, optional
+        self.deadband = DeadbandFilter.from_file(settings["deadband_file"]) if settings["deadband_file"] else None
+        # Streaming ingestion, optional
+        self.ingestor = None
+        if settings["ingestion"] == "push":
+            self.ingestor = PushIngestor(
+                self._on_update,
+                self.poller,
+                connect_timeout=settings["http_connect_timeout"],
+                reconnect_seconds=settings["ws_reconnect_seconds"]
+            )
+        elif settings["ingestion"] == "mqtt":
+            self.ingestor = MqttIngestor(
+                self._on_update,
+                self.poller,
+                host=settings["mqtt_host"],
+                port=settings["mqtt_port"],
+                username=settings["mqtt_username"],
+                password=settings["mqtt_password"],
+                topics=settings["mqtt_topics"],
+                stale_seconds=settings["mqtt_stale_seconds"]
+            )
+        # Report stats
+        self._polled: int = 0
+        self._streamed: int = 0
+        self._points: int = 0
+        self._tasks: set = set()
+        # Reusable line protocol buffer for a whole batch
+        self._lines: list = []
+
+
+    def load(self, devices: list) -> tuple[int, int, int]:
+        '''
+        Registers the devices and schedules them on their own interval and phase.
+        Called again with a new list, only the differences are applied.
+
+        Args:
+            devices (list): The devices loaded from devices.json
+
+        Returns:
+            tuple[int, int, int]: The number of added, removed and changed devices
+        '''
+        return self.apply(self.registry.diff(devices))
+
+
+    def apply(self, changes: tuple[list, list, list]) -> tuple[int, int, int]:
+        '''
+        Applies the changes found by DeviceRegistry.diff(), in O(changed devices).
+
+        Args:
+            changes (tuple[list, list, list]): The added entries, removed keys and changed entries
+
+        Returns:
+            tuple[int, int, int]: The number of added, removed and changed devices
+        '''
+        added, removed, updated = self.registry.apply(changes)
+        for device_class in removed:
+            self.scheduler.remove(self.registry.key_of(device_class))
+            self.health.remove(self.registry.key_of(device_class))
+            if self.energy:
+                self.energy.remove(self.registry.key_of(device_class))
+            if self.history:
+                self.history.remove(self.registry.key_of(device_class))
+            if self.state:
+                self.state.remove(self.registry.key_of(device_class))
+            if self.deadband:
+                self.deadband.forget(self.registry.key_of(device_class))
+            if self.ingestor:
+                self.ingestor.remove(self.registry.key_of(device_class))
+            if self.coiot:
+                self.coiot.remove(self.registry.key_of(device_class))
+        for device_class in added:
+            key = self.registry.key_of(device_class)
+            config = self.registry.get_config(key)
+            self.scheduler.add(key, device_class, config.get("interval_seconds"), config.get("phase_seconds"))
+            if self.history:
+                self.history.add(key, config.get("interval_seconds"))
+            if self.ingestor:
+                self.ingestor.add(key, device_class, config)
+            if self.coiot:
+                self.coiot.add(key, device_class, config)
+        for device_class, previous in updated:
+            key = self.registry.key_of(device_class)
+            config = self.registry.get_config(key)
+            if (config.get("interval_seconds"), config.get("phase_seconds")) != (previous.get("interval_seconds"), previous.get("phase_seconds")):
+                self.scheduler.add(key, device_class, config.get("interval_seconds"), config.get("phase_seconds"))
+                if self.history:
+                    self.history.add(key, config.get("interval_seconds"))
+            if self.ingestor and config.get("mqtt_prefix") != previous.get("mqtt_prefix"):
+                self.ingestor.remove(key)
+                self.ingestor.add(key, device_class, config)
+        return len(added), len(removed), len(updated)
+
+
+    def _read_changes(self) -> tuple[list, list, list] | None:
+        devices = self.devices_file.changed()
+        return None if devices is None else self.registry.diff(devices)
+
+
+    async def _reload(self) -> None:
+        '''
+        Applies the changes of the devices file. Reading, parsing and comparing
+        the whole file happens off the event loop, only the changes are applied on it.
+        A file that cannot be applied keeps the current devices, collection goes on.
+        '''
+        try:
+            changes = await asyncio.to_thread(self._read_changes)
+            if changes is None:
+                return
+            start = time.perf_counter()
+            added, removed, updated = self.apply(changes)
+        except Exception as e:
+            print(f"Error reloading {self.devices_file.path}, keeping the current devices: {type(e).__name__}: {e}")
+            return
+        print(
+            f"Reloaded {self.devices_file.path}: {added} added, {removed} removed, {updated} changed, "
+            f"{len(self.registry)} devices, applied in {(time.perf_counter() - start) * 1000:.1f} ms."
+        )
+
+
+    async def _poll_entry(self, entry: ScheduleEntry) -> int | None:
+        '''
+        Polls a device and frees its slot as soon as it returns, so a slow device
+        does not make the others of its batch miss their next deadline.
+
+        Returns:
+            int | None: The time of the new reading, None if the poll failed
+        '''
+        try:
+            return entry.device.polled_at if await self.poller.poll_device(entry.device) else None
+        finally:
+            entry.in_flight = False
+
+
+    async def _poll_batch(self, entries: list[ScheduleEntry]) -> None:
+        start = time.perf_counter()
+        for entry in entries:
+            entry.in_flight = True
+        readings = await asyncio.gather(*(self._poll_entry(entry) for entry in entries))
+        succeeded = 0
+        polled = []
+        for entry, polled_at in zip(entries, readings):
+            if self.registry.get_device(entry.key) is not entry.device:
+                # Removed from devices.json while its poll was in flight, its state is gone for good
+                continue
+            self.health.record(entry.key, polled_at is not None, f"{entry.device.model} at {entry.device.ip_address}")
+            if polled_at is None:
+                if self.state:
+                    # A failed device keeps its last reading, with its new health
+                    self.state.update(entry.device, self.health.state(entry.key))
+                continue
+            succeeded += 1
+            # A device polled again while the batch waited is serialized by that poll's batch
+            if entry.device.polled_at == polled_at:
+                polled.append(entry.device)
+        self._polled += succeeded
+        points = self.serialize(polled)
+        self._points += len(points)
+        if points and not self.writer.submit(points):
+            print(f"Writer queue full, dropped {len(points)} points.")
+        self.metrics.inc("collector_polls_total", ("ok",), succeeded)
+        if succeeded < len(entries):
+            self.metrics.inc("collector_polls_total", ("failed",), len(entries) - succeeded)
+        self.metrics.observe("collector_cycle_points", (), len(points))
+        self.metrics.observe("collector_cycle_seconds", (), time.perf_counter() - start)
+
+
+    def serialize(self, devices: list, components: tuple = None, streamed: bool = False) -> list:
+        '''
+        Serializes the latest readings of the polled devices.
+
+        Args:
+            devices (list): The polled device classes
+            components (tuple): Only these series of a Shelly 3EM, default all
+            streamed (bool): Streamed readings, thinned to one per poll interval in the history
+
+        Returns:
+            list: Line protocol strings, or point dictionaries when SERIALIZATION=dict
+        '''
+        if self.settings["serialization"] == "dict":
+            points = []
+            for device in devices:
+                points.extend(device.to_points(self.deadband, components) if components else device.to_points(self.deadband))
+                if self.energy:
+                    self.energy.update(device, points, dicts=True)
+                if self.history:
+                    self.history.update(device, components, streamed)
+                if self.state:
+                    self.state.update(device, self.health.state(device.key))
+            return points
+        lines = self._lines
+        lines.clear()
+        for device in devices:
+            if components:
+                device.write_lines(lines, self.deadband, components)
+            else:
+                device.write_lines(lines, self.deadband)
+            if self.energy:
+                self.energy.update(device, lines)
+            if self.history:
+                self.history.update(device, components, streamed)
+            if self.state:
+                self.state.update(device, self.health.state(device.key))
+        return lines
+
+
+    def _on_update(self, device, components: tuple = None) -> None:
+        '''
+        Queues the readings of a device that streamed a change.
+        '''
+        self._streamed += 1
+        self.metrics.inc("collector_streamed_updates_total")
+        points = self.serialize([device], components, streamed=True)
+        self._points += len(points)
+        if points and not self.writer.submit(points):
+            print(f"Writer queue full, dropped {len(points)} points.")
+
+
+    def _dispatch(self) -> None:
+        '''
+        Starts a poll for every due device. A device still being polled from
+        its previous slot misses this one, a device streaming its changes is skipped.
+        '''
+        batch = []
+        for entry in self.scheduler.pop_due():
+            if self.ingestor and self.ingestor.is_streaming(entry.key):
+                continue
+            if entry.in_flight:
+                self.scheduler.mark_missed(entry)
+                self.metrics.inc("collector_missed_deadlines_total")
+            elif not self.health.allow(entry.key):
+                self.metrics.inc("collector_polls_total", ("skipped",))
+            else:
+                batch.append(entry)
+        if batch:
+            task = asyncio.create_task(self._poll_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+    def health_counts(self) -> dict:
+        return {(state,): count for state, count in self.health.counts().items()}
+
+
+    def _report(self, elapsed: float) -> None:
+        print(
+            f"Polled {self._polled} devices ({self._points} points) in the last {elapsed:.1f} seconds, "
+            f"{self.scheduler.missed} missed deadlines, max lateness {self.scheduler.max_lateness * 1000:.0f} ms."
+        )
+        if self.ingestor:
+            print(f"Streamed {self._streamed} updates: {self.ingestor.summary()}")
+        if self.coiot:
+            print(f"CoIoT: {self.coiot.summary()}")
+        print(f"Health: {self.health.summary()}")
+        print(f"Connection reuse: {self.transport.summary()}")
+        print(f"Writer: {self.writer.summary()}")
+        if self.deadband:
+            print(f"Deadband: {self.deadband.summary()}")
+        if self.energy:
+            print(f"Energy: {self.energy.summary()}")
+        if self.history:
+            print(f"History: {self.history.summary()}")
+        if self.state:
+            print(f"State API: {self.state.summary()}")
+        self._polled = 0
+        self._streamed = 0
+        self._points = 0
+        self.scheduler.reset_stats()
+
+
+    async def run(self) -> None:
+        '''
+        Runs the scheduler loop until cancelled.
+        '''
+        tick = self.settings["scheduler_tick_seconds"]
+        report_interval = self.settings["poll_interval_seconds"]
+        last_report = time.monotonic()
+        reload_interval = self.settings["devices_reload_seconds"]
+        last_reload = time.monotonic()
+        if self.ingestor:
+            self.ingestor.start()
+        if self.coiot:
+            await self.coiot.start()
+        if self.state_server:
+            self.state_server.start()
+        try:
+            while True:
+                self._dispatch()
+                now = time.monotonic()
+                if (now - last_report) >= report_interval:
+                    self._report(now - last_report)
+                    last_report = now
+                if self.devices_file and reload_interval and (now - last_reload) >= reload_interval:
+                    last_reload = now
+                    await self._reload()
+                next_due = self.scheduler.next_due()
+                delay = report_interval if next_due is None else next_due - time.monotonic()
+                # Devices due within the same tick are dispatched together
+                await asyncio.sleep(min(max(delay, tick), report_interval, reload_interval or report_interval))
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            if self.ingestor:
+                self.ingestor.close()
+            if self.coiot:
+                self.coiot.close()
+            if self.state_server:
+                self.state_server.close()
+            self.poller.close()
+            self.transport.close()
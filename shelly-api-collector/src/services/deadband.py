@@ -0,0 +1,128 @@
+import fnmatch
+import json
+import time
+
+
+
+'''
+Deadband / change-only filter for device fields.
+Keeps the last value sent per series and field, and only emits a field when it
+moved beyond its threshold (numbers) or changed (anything else).
+A full heartbeat of every field is emitted periodically per series.
+
+Thresholds are configured per field name, glob patterns are allowed:
+{
+    "heartbeat_seconds": 300,
+    "default": null,
+    "fields": {"switch_*_power_limit": 0, "switch_*_apower": 5}
+}
+A threshold of 0 emits on any change. Fields without a threshold
+(and no default) are always emitted.
+'''
+
+
+
+_MISSING = object()
+
+
+
+class DeadbandFilter:
+    def __init__(self, thresholds: dict = None, default_threshold: float = None, heartbeat_seconds: float = 300):
+        self.default_threshold = default_threshold
+        self.heartbeat_seconds = heartbeat_seconds
+        self._exact: dict = {}
+        self._patterns: list[tuple[str, float]] = []
+        for field, threshold in (thresholds or {}).items():
+            if any(char in field for char in "*?["):
+                self._patterns.append((field, threshold))
+            else:
+                self._exact[field] = threshold
+        # Field name -> resolved threshold
+        self._resolved: dict = {}
+        # Series -> {field: last value sent}
+        self._last: dict = {}
+        self._heartbeats: dict = {}
+        # Stats
+        self.received: int = 0
+        self.emitted: int = 0
+
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "DeadbandFilter":
+        with open(file_path, "r") as file:
+            config = json.load(file)
+        return cls(config.get("fields"), config.get("default"), config.get("heartbeat_seconds", 300))
+
+
+    def threshold(self, field: str):
+        '''
+        The threshold of a field, exact names take precedence over patterns.
+        '''
+        threshold = self._resolved.get(field, _MISSING)
+        if threshold is _MISSING:
+            threshold = self._exact.get(field, _MISSING)
+            if threshold is _MISSING:
+                threshold = self.default_threshold
+                for pattern, pattern_threshold in self._patterns:
+                    if fnmatch.fnmatchcase(field, pattern):
+                        threshold = pattern_threshold
+                        break
+            self._resolved[field] = threshold
+        return threshold
+
+
+    @staticmethod
+    def _changed(value, previous, threshold: float) -> bool:
+        numeric = (int, float)
+        if isinstance(value, numeric) and isinstance(previous, numeric) \
+                and not isinstance(value, bool) and not isinstance(previous, bool):
+            return abs(value - previous) > threshold
+        return value != previous
+
+
+    def filter(self, series, fields: dict, now: float = None) -> dict:
+        '''
+        Returns the fields of a series that should be emitted.
+
+        Args:
+            series (Any): Key of the series, e.g. (device key, component, index)
+            fields (dict): The current fields
+            now (float): The monotonic time, defaults to now
+
+        Returns:
+            dict: The fields to emit, empty if nothing changed
+        '''
+        now = time.monotonic() if now is None else now
+        self.received += len(fields)
+        last = self._last.get(series)
+        if last is None or (now - self._heartbeats[series]) >= self.heartbeat_seconds:
+            self._last[series] = dict(fields)
+            self._heartbeats[series] = now
+            self.emitted += len(fields)
+            return fields
+        emitted = {}
+        for field, value in fields.items():
+            threshold = self.threshold(field)
+            if threshold is None:
+                emitted[field] = value
+                continue
+            previous = last.get(field, _MISSING)
+            if previous is _MISSING or self._changed(value, previous, threshold):
+                emitted[field] = value
+                last[field] = value
+        self.emitted += len(emitted)
+        return emitted
+
+
+    def forget(self, device_key) -> None:
+        '''
+        Drops the state of every series of a device, e.g. when it is removed.
+        '''
+        for series in [series for series in self._last if series[0] == device_key]:
+            del self._last[series]
+            del self._heartbeats[series]
+
+
+    def summary(self) -> str:
+        ratio = (self.emitted / self.received * 100) if self.received else 100
+        return f"{self.emitted} of {self.received} fields emitted ({ratio:.0f}%)"
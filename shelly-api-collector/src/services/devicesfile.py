@@ -0,0 +1,70 @@
+import json
+import os
+
+
+
+'''
+devices.json watcher.
+Reloads the device list when the file's modification time changes.
+A file that is missing or not valid JSON (e.g. half written) keeps the previous list,
+an empty list removes every device. Entries that are not objects with a text model and ip are skipped.
+'''
+
+
+
+class DevicesFile:
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime: float = None
+
+
+    def _mtime_now(self) -> float | None:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+
+    def load(self) -> list | None:
+        '''
+        Loads the device list and remembers the file's modification time.
+
+        Returns:
+            list | None: The devices, None if the file is missing or invalid
+        '''
+        self._mtime = self._mtime_now()
+        try:
+            with open(self.path, "r") as file:
+                devices = json.load(file)
+        except FileNotFoundError:
+            print(f"Error: File not found at {self.path}")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON: {e}")
+            return None
+        if not isinstance(devices, list):
+            print(f"Error: {self.path} is not a list of devices")
+            return None
+        return [device for device in devices if self._is_entry(device)]
+
+
+    def _is_entry(self, device) -> bool:
+        if isinstance(device, dict) and isinstance(device.get("model"), str) and isinstance(device.get("ip"), str):
+            return True
+        print(f"Skipping invalid entry {device!r} of {self.path}, expected an object with a model and an ip")
+        return False
+
+
+    def changed(self) -> list | None:
+        '''
+        Checks the file for changes.
+
+        Returns:
+            list | None: The new device list if the file changed and is valid, None otherwise.
+                An empty list is valid and removes every device
+        '''
+        mtime = self._mtime_now()
+        if mtime is None or mtime == self._mtime:
+            return None
+        # An invalid file is read again once it changes (e.g. finished writing)
+        return self.load()
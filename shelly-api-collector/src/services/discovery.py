@@ -0,0 +1,468 @@
+import asyncio
+import ipaddress
+import json
+import resource
+import socket
+import struct
+import time
+
+
+
+'''
+LAN discovery of Shelly devices.
+Every host of the configured subnets is probed with GET /shelly by a fixed number of
+concurrent probe coroutines on one event loop (plain asyncio streams, no thread per request),
+so a /16 (65534 hosts) takes about hosts / concurrency * timeout, a minute or two, instead of hours.
+mDNS announcements (_shelly._tcp / _http._tcp with a shelly host name) are answered by probing the
+announced host the same way. The /shelly response tells the generation and model:
+Gen1 devices answer with their "type", Gen2 devices with "gen" and "app".
+'''
+
+
+
+MDNS_GROUP = "224.0.0.251"
+MDNS_PORT = 5353
+MDNS_SERVICES = ("_shelly._tcp.local", "_http._tcp.local")
+# DNS record types
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_SRV = 33
+# Gen1 /shelly "type" -> collector model
+GEN1_TYPES = {
+    "SHEM-3": "shelly3em"
+}
+MAX_RESPONSE_BYTES = 64 * 1024
+
+
+def raise_open_files_limit() -> int:
+    '''
+    Raises the open files limit to the hard limit, every probe in flight is a socket.
+
+    Returns:
+        int: The open files limit
+    '''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+def classify(info: dict, specs: dict) -> tuple[str | None, int, str]:
+    '''
+    Identifies a device from its /shelly response.
+
+    Args:
+        info (dict): The /shelly response
+        specs (dict): The Gen2 model specs, {model: ModelSpec}
+
+    Returns:
+        tuple[str | None, int, str]: The collector model (None if not supported), the generation and
+            the device type (Gen1 "type", Gen2 "app")
+    '''
+    if "gen" in info:
+        app = info.get("app")
+        for spec in specs.values():
+            if spec.app and spec.app == app:
+                return spec.model, info["gen"], app
+        return None, info["gen"], app
+    device_type = info.get("type")
+    return GEN1_TYPES.get(device_type), 1, device_type
+
+
+def hosts(networks: list) -> iter:
+    '''
+    The host addresses of the networks, e.g. ["192.168.1.0/24"]. A single address is probed as is.
+    '''
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        if network.num_addresses == 1:
+            yield str(network.network_address)
+        else:
+            yield from (str(host) for host in network.hosts())
+
+
+async def fetch_json(host: str, port: int, path: str, timeout: float):
+    '''
+    GET request over a plain asyncio stream.
+
+    Args:
+        host (str): The IP address
+        port (int): The HTTP port
+        path (str): The request path
+        timeout (float): Seconds for the whole request
+
+    Returns:
+        Any: The decoded JSON body, None if the host did not answer with a 200 JSON response
+    '''
+    writer = None
+    try:
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            if len(lines[0].split(" ")) < 2 or lines[0].split(" ")[1] != "200":
+                return None
+            length = None
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value.strip())
+            if length is not None:
+                body = await reader.readexactly(min(length, MAX_RESPONSE_BYTES))
+            else:
+                body = await reader.read(MAX_RESPONSE_BYTES)
+        return json.loads(body)
+    except (OSError, TimeoutError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return None
+    finally:
+        if writer:
+            writer.close()
+
+
+def encode_query(names: tuple) -> bytes:
+    '''
+    An mDNS query for the PTR records of the service names.
+    '''
+    packet = struct.pack("!6H", 0, 0, len(names), 0, 0, 0)
+    for name in names:
+        packet += b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\x00"
+        packet += struct.pack("!2H", TYPE_PTR, 1)
+    return packet
+
+
+def decode_name(data: bytes, offset: int) -> tuple[str, int]:
+    '''
+    Reads a DNS name, following compression pointers.
+
+    Returns:
+        tuple[str, int]: The name and the offset after it
+    '''
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        labels.append(data[offset + 1:offset + 1 + length].decode("utf-8", "replace"))
+        offset += 1 + length
+    return ".".join(labels), end if end is not None else offset
+
+
+def parse_records(data: bytes) -> list[tuple[str, int, object]]:
+    '''
+    Parses the resource records of a DNS message. A records decode to the address,
+    PTR to the name and SRV to (target, port), other records to their raw data.
+
+    Returns:
+        list[tuple[str, int, object]]: (name, type, data) per record
+    '''
+    _, _, questions, answers, authorities, additionals = struct.unpack_from("!6H", data)
+    offset = 12
+    for _ in range(questions):
+        _, offset = decode_name(data, offset)
+        offset += 4
+    records = []
+    for _ in range(answers + authorities + additionals):
+        name, offset = decode_name(data, offset)
+        record_type, _, _, length = struct.unpack_from("!2HIH", data, offset)
+        offset += 10
+        rdata = data[offset:offset + length]
+        if record_type == TYPE_A and length == 4:
+            value = socket.inet_ntoa(rdata)
+        elif record_type == TYPE_PTR:
+            value = decode_name(data, offset)[0]
+        elif record_type == TYPE_SRV:
+            value = (decode_name(data, offset + 6)[0], struct.unpack_from("!H", data, offset + 4)[0])
+        else:
+            value = rdata
+        records.append((name, record_type, value))
+        offset += length
+    return records
+
+
+def shelly_hosts(records: list, source: str) -> dict:
+    '''
+    The Shelly hosts announced in an mDNS message: a host is a Shelly when one of the
+    message's names or targets contains "shelly" (e.g. shellypro1pm-30c6f7000001.local).
+
+    Args:
+        records (list): The parsed records
+        source (str): The IP the message came from, used when it has no A record
+
+    Returns:
+        dict: {IP: HTTP port}
+    '''
+    names = [name.lower() for name, _, _ in records]
+    names += [value.lower() for _, record_type, value in records if record_type == TYPE_PTR]
+    names += [value[0].lower() for _, record_type, value in records if record_type == TYPE_SRV]
+    if not any("shelly" in name for name in names):
+        return {}
+    ports = {value[0].lower(): value[1] for _, record_type, value in records if record_type == TYPE_SRV}
+    found = {}
+    for name, record_type, value in records:
+        if record_type == TYPE_A:
+            found[value] = ports.get(name.lower(), 80)
+    return found or {source: next(iter(ports.values()), 80)}
+
+
+
+class MdnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, browser):
+        self.browser = browser
+
+
+    def datagram_received(self, data: bytes, address: tuple) -> None:
+        self.browser.received(data, address[0])
+
+
+
+class MdnsBrowser:
+    '''
+    Listens for mDNS announcements and queries for the Shelly services.
+    '''
+    def __init__(self, on_found, bind: str = "0.0.0.0", port: int = MDNS_PORT, group: str = MDNS_GROUP):
+        self.on_found = on_found
+        self.bind = bind
+        self.port = port
+        self.group = group
+        # Stats
+        self.packets: int = 0
+        self.invalid: int = 0
+        self._transport = None
+
+
+    async def start(self) -> None:
+        '''
+        Binds the UDP socket, joins the mDNS group and sends the query. Must run on the event loop.
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Shared with the system's mDNS responder
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.bind, self.port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton("0.0.0.0"))
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        except OSError as e:
+            print(f"Could not join mDNS multicast group {self.group}, only unicast answers are received: {e}")
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: MdnsProtocol(self), sock=sock)
+        self.query()
+
+
+    def query(self) -> None:
+        try:
+            self._transport.sendto(encode_query(MDNS_SERVICES), (self.group, MDNS_PORT))
+        except OSError as e:
+            print(f"Could not send the mDNS query: {e}")
+
+
+    def received(self, data: bytes, source: str) -> None:
+        self.packets += 1
+        try:
+            records = parse_records(data)
+        except (struct.error, IndexError):
+            self.invalid += 1
+            return
+        for host, port in shelly_hosts(records, source).items():
+            self.on_found(host, port)
+
+
+    def close(self) -> None:
+        if self._transport:
+            self._transport.close()
+
+
+
+class Discovery:
+    def __init__(self, specs: dict, port: int = 80, concurrency: int = 1024, timeout: float = 1.0, report_seconds: float = 10.0):
+        self.specs = specs
+        self.port = port
+        # Every probe in flight holds a socket
+        self.concurrency = max(1, min(concurrency, raise_open_files_limit() - 64))
+        self.timeout = timeout
+        self.report_seconds = report_seconds
+        # Address -> found device
+        self.found: dict = {}
+        # Stats
+        self.probed: int = 0
+        self.answered: int = 0
+        self.unsupported: dict = {}
+        self._probing: set = set()
+        self._tasks: set = set()
+
+
+    @staticmethod
+    def address(host: str, port: int) -> str:
+        return host if port == 80 else f"{host}:{port}"
+
+
+    async def probe(self, host: str, port: int) -> dict | None:
+        '''
+        Probes a host's /shelly endpoint and records a Shelly.
+
+        Args:
+            host (str): The IP address
+            port (int): The HTTP port
+
+        Returns:
+            dict | None: The found device, None if the host is not a Shelly
+        '''
+        address = self.address(host, port)
+        if address in self.found or address in self._probing:
+            return self.found.get(address)
+        self._probing.add(address)
+        try:
+            info = await fetch_json(host, port, "/shelly", self.timeout)
+        finally:
+            self._probing.discard(address)
+            self.probed += 1
+        if not isinstance(info, dict) or "mac" not in info:
+            return None
+        self.answered += 1
+        model, gen, device_type = classify(info, self.specs)
+        if model is None:
+            self.unsupported[device_type] = self.unsupported.get(device_type, 0) + 1
+            return None
+        device = {
+            "name": info.get("name") or info.get("id") or f"{model} {info['mac']}",
+            "ip": address,
+            "model": model,
+            "mac": info["mac"].upper(),
+            "gen": gen,
+            "type": device_type
+        }
+        self.found[address] = device
+        return device
+
+
+    def on_announced(self, host: str, port: int) -> None:
+        '''
+        Probes a host announced over mDNS.
+        '''
+        task = asyncio.create_task(self.probe(host, port))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+    async def _probe_worker(self, addresses) -> None:
+        for host in addresses:
+            await self.probe(host, self.port)
+
+
+    async def _report(self, total: int, start: float) -> None:
+        while True:
+            await asyncio.sleep(self.report_seconds)
+            print(f"Probed {self.probed}/{total} hosts in {time.monotonic() - start:.0f} seconds, {len(self.found)} devices found.")
+
+
+    async def scan(self, networks: list) -> None:
+        '''
+        Probes every host of the networks, concurrency probes at a time.
+
+        Args:
+            networks (list): The subnets, e.g. ["192.168.1.0/24", "10.0.0.0/16"]
+        '''
+        total = sum(max(ipaddress.ip_network(network, strict=False).num_addresses - 2, 1) for network in networks)
+        # The workers share one iterator, so there are never more than concurrency sockets open
+        addresses = hosts(networks)
+        start = time.monotonic()
+        reporter = asyncio.create_task(self._report(total, start))
+        try:
+            await asyncio.gather(*(self._probe_worker(addresses) for _ in range(min(self.concurrency, total))))
+        finally:
+            reporter.cancel()
+
+
+    async def run(self, networks: list, mdns_seconds: float = 0.0) -> list:
+        '''
+        Scans the networks while listening for mDNS announcements.
+
+        Args:
+            networks (list): The subnets to scan
+            mdns_seconds (float): Seconds to listen for mDNS announcements at least, 0 disables mDNS
+
+        Returns:
+            list: The found devices, sorted by IP
+        '''
+        start = time.monotonic()
+        browser = None
+        if mdns_seconds > 0:
+            browser = MdnsBrowser(self.on_announced)
+            try:
+                await browser.start()
+            except OSError as e:
+                print(f"mDNS disabled, could not listen on port {MDNS_PORT}: {e}")
+                browser = None
+        try:
+            if networks:
+                await self.scan(networks)
+            if browser:
+                # Ask again, devices only answer a query once per second
+                browser.query()
+                await asyncio.sleep(max(mdns_seconds - (time.monotonic() - start), 0))
+            if self._tasks:
+                await asyncio.gather(*self._tasks)
+        finally:
+            if browser:
+                browser.close()
+        return sorted(self.found.values(), key=lambda device: ipaddress.ip_address(device["ip"].partition(":")[0]))
+
+
+    def summary(self) -> str:
+        unsupported = ", ".join(f"{count} {device_type}" for device_type, count in self.unsupported.items()) or "none"
+        return f"{self.probed} hosts probed, {self.answered} Shelly devices answered, {len(self.found)} supported, unsupported: {unsupported}"
+
+
+
+def merge_inventory(existing: list, found: list, prune: bool = False) -> tuple[list, int, int]:
+    '''
+    Merges discovered devices into a devices.json list.
+    Existing entries keep their name and settings (interval, mqtt_prefix...), a device is
+    matched by MAC first, so a device that moved to another IP is updated in place.
+
+    Args:
+        existing (list): The current devices.json entries
+        found (list): The discovered devices
+        prune (bool): Drop the entries of devices that were not found
+
+    Returns:
+        tuple[list, int, int]: The merged list, the number of added and moved devices
+    '''
+    by_mac = {device["mac"]: device for device in found}
+    by_address = {(device["model"], device["ip"]): device for device in found}
+    merged = []
+    seen = set()
+    moved = 0
+    for entry in existing:
+        if not isinstance(entry, dict):
+            # Kept as is, like any other entry that was not found
+            if not prune:
+                merged.append(entry)
+            continue
+        address = (entry.get("model"), entry.get("ip"))
+        device = by_mac.get(str(entry.get("mac", "")).upper()) or (by_address.get(address) if all(isinstance(part, str) for part in address) else None)
+        if device is None:
+            if not prune:
+                merged.append(entry)
+            continue
+        seen.add(device["mac"])
+        if entry.get("ip") != device["ip"]:
+            moved += 1
+        merged.append({**entry, "ip": device["ip"], "model": device["model"], "mac": device["mac"]})
+    added = [
+        {"name": device["name"], "ip": device["ip"], "model": device["model"], "mac": device["mac"]}
+        for device in found if device["mac"] not in seen
+    ]
+    return merged + added, len(added), moved
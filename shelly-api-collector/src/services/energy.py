@@ -0,0 +1,213 @@
+from services.lineprotocol import render_prefix, render_fields, append_line
+
+
+
+'''
+Pre-integrated energy series.
+The devices report cumulative Wh counters that start over when the device reboots
+(or its counters are reset). Every sample is turned into a Wh delta against the
+previous one, so a dashboard can sum the deltas instead of running difference() over raw data.
+An uptime that went backwards, or a counter that dropped to near zero, is a reset and the new
+reading is all new energy. A counter that passed COUNTER_MODULUS wraps and keeps counting,
+any other drop (a glitch of the reading) counts as 0 Wh.
+The deltas are summed into 1 m, 15 m and 1 h buckets (ENERGY_WINDOWS), a bucket is written
+as one "energy" row once a sample lands in the next bucket. O(1) work per sample.
+'''
+
+
+
+MEASUREMENT = "energy"
+NANOSECONDS = 1_000_000_000
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# Counters kept as unsigned 32-bit integers start over from 0 past 2**32
+COUNTER_MODULUS = 2 ** 32
+# A drop is a wrap when the counter went past the modulus by at most this share of it
+WRAP_MARGIN = 0.01
+# A drop is a reset when the new reading is at most this many Wh, or this share of the previous one
+RESET_WH = 10.0
+RESET_SHARE = 0.01
+
+
+def parse_windows(text: str) -> list[tuple[str, int]]:
+    '''
+    Parses a comma separated window list, e.g. "1m,15m,1h".
+
+    Args:
+        text (str): The windows
+
+    Returns:
+        list[tuple[str, int]]: The window names and lengths in seconds
+    '''
+    windows = []
+    for name in (part.strip() for part in text.split(",")):
+        if not name:
+            continue
+        if name[-1] not in UNITS or not name[:-1].isdigit() or int(name[:-1]) == 0:
+            raise ValueError(f"Invalid energy window {name}, expected e.g. 1m, 15m or 1h")
+        windows.append((name, int(name[:-1]) * UNITS[name[-1]]))
+    return windows
+
+
+
+def started_over(previous: float, current: float) -> bool:
+    '''
+    Whether a counter that dropped is a reset, the new reading being near zero.
+    '''
+    return current <= max(RESET_WH, previous * RESET_SHARE)
+
+
+
+class EnergyChannel:
+    __slots__ = ("total", "returned", "uptime", "time", "buckets")
+
+
+    def __init__(self, windows: int):
+        self.total: float = None
+        self.returned: float = None
+        self.uptime = None
+        self.time: int = None
+        # [bucket start, Wh, returned Wh, samples] per window
+        self.buckets: list = [None] * windows
+
+
+
+class EnergyAccumulator:
+    def __init__(self, windows: list[tuple[str, int]]):
+        self.windows = windows
+        self._lengths = [length * NANOSECONDS for _, length in windows]
+        self._channels: dict = {}
+        self._prefixes: dict = {}
+        # Stats
+        self.samples: int = 0
+        self.resets: int = 0
+        self.rows: int = 0
+
+
+    @staticmethod
+    def delta(previous: float, current: float, reset: bool) -> float:
+        '''
+        Wh consumed between two counter readings.
+        After a reset the counter started over from 0, so all of it is new.
+
+        Args:
+            previous (float): The previous reading, None on the first one
+            current (float): The new reading
+            reset (bool): The device uptime went backwards
+
+        Returns:
+            float: The Wh, 0 for a drop that is neither a reset nor a wrap
+        '''
+        if previous is None:
+            return 0.0
+        if reset:
+            return current
+        if current >= previous:
+            return current - previous
+        wrapped = (current - previous) % COUNTER_MODULUS
+        if wrapped <= COUNTER_MODULUS * WRAP_MARGIN:
+            return wrapped
+        if started_over(previous, current):
+            return current
+        return 0.0
+
+
+    def add(self, key, tags: dict, channel: str, total: float, returned: float, uptime, timestamp: int, output: list, dicts: bool = False) -> None:
+        '''
+        Integrates one counter sample and writes the buckets it completed.
+
+        Args:
+            key (Any): The device key
+            tags (dict): The device tags of the series (e.g. mac and model)
+            channel (str): The meter channel, e.g. "emeter_0" or "switch_0"
+            total (float): The cumulative consumed Wh
+            returned (float): The cumulative returned Wh, None if the channel has none
+            uptime (int): The device uptime in seconds, None if unknown
+            timestamp (int): The sample time in nanoseconds
+            output (list): Lines (or point dictionaries) the completed buckets are appended to
+            dicts (bool): Append point dictionaries instead of line protocol
+        '''
+        state = self._channels.get((key, channel))
+        if state is None:
+            state = self._channels[(key, channel)] = EnergyChannel(len(self.windows))
+        if state.time is not None and timestamp <= state.time:
+            # Same reading again (e.g. a streamed update without new counters)
+            return
+        reset = state.uptime is not None and uptime is not None and uptime < state.uptime
+        if state.total is not None and (reset or (total < state.total and started_over(state.total, total))):
+            self.resets += 1
+        energy = self.delta(state.total, total, reset)
+        returned_energy = self.delta(state.returned, returned, reset) if returned is not None else 0.0
+        previous_time = state.time
+        state.total, state.returned, state.uptime, state.time = total, returned, uptime, timestamp
+        self.samples += 1
+        for index, length in enumerate(self._lengths):
+            start = timestamp - timestamp % length
+            bucket = state.buckets[index]
+            if bucket is None:
+                state.buckets[index] = [start, energy, returned_energy, 1]
+                continue
+            if bucket[0] == start:
+                bucket[1] += energy
+                bucket[2] += returned_energy
+                bucket[3] += 1
+                continue
+            # Split the delta at the bucket boundary by time, the previous bucket is complete
+            share = 0.0
+            if previous_time is not None and timestamp > previous_time:
+                share = max(min((bucket[0] + length - previous_time) / (timestamp - previous_time), 1.0), 0.0)
+            bucket[1] += energy * share
+            bucket[2] += returned_energy * share
+            self._emit(key, tags, channel, index, bucket, output, dicts)
+            state.buckets[index] = [start, energy * (1 - share), returned_energy * (1 - share), 1]
+
+
+    def _emit(self, key, tags: dict, channel: str, index: int, bucket: list, output: list, dicts: bool) -> None:
+        window = self.windows[index][0]
+        fields = {
+            "energy_wh": round(bucket[1], 3),
+            "returned_energy_wh": round(bucket[2], 3),
+            "samples": bucket[3]
+        }
+        self.rows += 1
+        if dicts:
+            output.append({
+                "measurement": MEASUREMENT,
+                "tags": {**tags, "channel": channel, "window": window},
+                "fields": fields,
+                "time": bucket[0]
+            })
+            return
+        prefix = self._prefixes.get((key, channel, window))
+        if prefix is None:
+            prefix = self._prefixes[(key, channel, window)] = render_prefix(MEASUREMENT, {**tags, "channel": channel, "window": window})
+        append_line(output, prefix, render_fields(fields), bucket[0])
+
+
+    def update(self, device, output: list, dicts: bool = False) -> None:
+        '''
+        Integrates the energy counters of a polled or streamed device.
+
+        Args:
+            device (Shelly3EM | ShellyGen2): The device with its latest readings
+            output (list): Lines (or point dictionaries) the completed buckets are appended to
+            dicts (bool): Append point dictionaries instead of line protocol
+        '''
+        if device.polled_at is None:
+            return
+        counters = device.energy_counters()
+        if counters is None:
+            return
+        tags, uptime, channels = counters
+        for channel, total, returned in channels:
+            self.add(device.key, tags, channel, total, returned, uptime, device.polled_at, output, dicts)
+
+
+    def remove(self, key) -> None:
+        for channel_key in [channel_key for channel_key in self._channels if channel_key[0] == key]:
+            del self._channels[channel_key]
+        for prefix_key in [prefix_key for prefix_key in self._prefixes if prefix_key[0] == key]:
+            del self._prefixes[prefix_key]
+
+
+    def summary(self) -> str:
+        return f"{self.samples} samples, {self.rows} rows written, {self.resets} counter resets over {len(self._channels)} channels"
@@ -0,0 +1,139 @@
+import threading
+from collections import deque
+from services.lineprotocol import parse_line
+from services.writer import BatchWriter
+
+
+
+'''
+Output fan-out to several sinks (SINKS=influx,ndjson,csv,remote_write,parquet).
+Every sink has its own BatchWriter: its own queue, batching, retries and drops, so a slow
+or unavailable sink only fills its own queue and never holds up the others.
+The sinks taking the collector's points as they are (InfluxDB) are queued directly.
+For the others the cycles go to one encoder thread, which parses each cycle once and
+encodes it once per encoding. The sinks sharing an encoding queue the same encoded records.
+Stands in for the single BatchWriter: the collector and the supervisor only call submit().
+'''
+
+
+
+def structured(point) -> tuple:
+    '''
+    The parts of a point, from a line protocol string or a point dictionary.
+    Like render_prefix(), empty tags (e.g. a Gen2 device without a name) are dropped, so every sink gets the same tags.
+
+    Returns:
+        tuple: (measurement, tags, fields, timestamp in nanoseconds or None)
+    '''
+    if isinstance(point, str):
+        return parse_line(point)
+    tags = {key: value for key, value in point.get("tags", {}).items() if value is not None and value != ""}
+    return point["measurement"], tags, point["fields"], point.get("time")
+
+
+
+class FanOut:
+    def __init__(self, writers: list[BatchWriter], max_pending_cycles: int = 1000):
+        self.writers = writers
+        self.max_pending_cycles = max_pending_cycles
+        # Sinks without an encoding take the points as they are
+        self._direct = [writer for writer in writers if not getattr(writer.sink, "encoding", None)]
+        # Encoding -> (encode, writers), encoded once whatever the number of sinks using it
+        self._encodings: dict = {}
+        for writer in writers:
+            if writer not in self._direct:
+                encode, encoded_writers = self._encodings.setdefault(writer.sink.encoding, (writer.sink.encode, []))
+                encoded_writers.append(writer)
+        # Stats
+        self.dropped: int = 0
+        self.invalid: int = 0
+        # Internal
+        self._cycles: deque = deque()
+        self._condition = threading.Condition()
+        self._stopping: bool = False
+        self._thread = threading.Thread(target=self._run, name="fanout", daemon=True)
+
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(writer.queue_depth for writer in self.writers)
+
+
+    def start(self) -> None:
+        for writer in self.writers:
+            writer.start()
+        if self._encodings:
+            self._thread.start()
+
+
+    def submit(self, points: list) -> bool:
+        '''
+        Queues the points of a cycle for every sink without blocking.
+
+        Args:
+            points (list): Line protocol strings or point dictionaries
+
+        Returns:
+            bool: True if every sink accepted them, False if a queue was full
+        '''
+        accepted = True
+        for writer in self._direct:
+            accepted = writer.submit(points) and accepted
+        if not self._encodings:
+            return accepted
+        with self._condition:
+            if len(self._cycles) >= self.max_pending_cycles:
+                self.dropped += len(points)
+                return False
+            # Copied, the collector reuses its line buffer
+            self._cycles.append(list(points))
+            self._condition.notify()
+        return accepted
+
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._cycles and not self._stopping:
+                    self._condition.wait()
+                if not self._cycles:
+                    return
+                points = self._cycles.popleft()
+            self._encode(points)
+
+
+    def _encode(self, points: list) -> None:
+        '''
+        Parses a cycle once, then encodes it once per encoding for the sinks using it.
+        '''
+        parsed = []
+        for point in points:
+            try:
+                parsed.append(structured(point))
+            except (ValueError, KeyError, TypeError) as e:
+                self.invalid += 1
+                print(f"Skipping a point the sinks cannot encode: {e}")
+        for encode, writers in self._encodings.values():
+            records = [encode(point) for point in parsed]
+            for writer in writers:
+                writer.submit(records)
+
+
+    def summary(self) -> str:
+        summary = "; ".join(f"{writer.name}: {writer.summary()}" for writer in self.writers)
+        if self._encodings:
+            summary += f"; encoder: {len(self._cycles)} cycles queued, {self.dropped} points dropped, {self.invalid} invalid"
+        return summary
+
+
+    def close(self, timeout: float = 10.0) -> None:
+        '''
+        Encodes the queued cycles, then stops every writer after it flushed what is queued.
+        '''
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        for writer in self.writers:
+            writer.close(timeout)
@@ -0,0 +1,124 @@
+import json
+import os
+import time
+
+
+
+'''
+Rotating file sinks, for local archives and tools that read files rather than InfluxDB.
+NDJSON writes one {"measurement", "tags", "fields", "time"} object per point and line.
+CSV writes one row per field: time,measurement,tags,field,value, the tags as "key=value;...".
+A point is encoded to bytes once (see services.fanout), a batch is appended as the concatenation.
+A new file is started once the current one reaches FILE_ROTATE_BYTES or FILE_ROTATE_SECONDS,
+and only the newest FILE_KEEP files are kept.
+'''
+
+
+
+def encode_ndjson(point: tuple) -> bytes:
+    measurement, tags, fields, timestamp = point
+    return (json.dumps({"measurement": measurement, "tags": tags, "fields": fields, "time": timestamp}, separators=(",", ":")) + "\n").encode()
+
+
+def csv_cell(value) -> str:
+    # Quoted like the csv module, only when needed
+    text = str(value)
+    if "," in text or "\"" in text or "\n" in text or "\r" in text:
+        return "\"" + text.replace("\"", "\"\"") + "\""
+    return text
+
+
+def encode_csv(point: tuple) -> bytes:
+    measurement, tags, fields, timestamp = point
+    series = f"{timestamp},{csv_cell(measurement)},{csv_cell(';'.join(f'{key}={value}' for key, value in tags.items()))},"
+    return "".join(f"{series}{csv_cell(field)},{csv_cell(value)}\n" for field, value in fields.items()).encode()
+
+
+
+class RotatingFileSink:
+    encoding: str = None
+    suffix: str = ".txt"
+    header: bytes = b""
+
+
+    def __init__(self, directory: str, rotate_bytes: int = 64 * 1024 * 1024, rotate_seconds: float = 3600, keep: int = 168, prefix: str = "points"):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        # 0 keeps every file
+        self.keep = keep
+        self.prefix = prefix
+        self.rotations: int = 0
+        self._file = None
+        self._size: int = 0
+        self._opened_at: float = 0.0
+        self._sequence: int = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    def _files(self) -> list[str]:
+        # Named by UTC time then sequence, so the names sort oldest first
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(f"{self.prefix}-") and name.endswith(self.suffix)
+        )
+
+
+    def _rotate(self) -> None:
+        '''
+        Closes the current file, starts the next one and deletes the files beyond keep.
+        '''
+        if self._file:
+            self._file.close()
+            self.rotations += 1
+        self._sequence += 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{self._sequence:06d}{self.suffix}"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        self._file.write(self.header)
+        self._size = len(self.header)
+        self._opened_at = time.monotonic()
+        if self.keep:
+            for old in self._files()[:-self.keep]:
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError as e:
+                    print(f"Error removing {old}: {e}")
+
+
+    def write(self, records: list) -> None:
+        '''
+        Appends a batch of encoded points to the current file.
+
+        Args:
+            records (list): Points encoded to bytes by the sink's encode()
+
+        Raises:
+            OSError: If the file cannot be written
+        '''
+        if self._file is None or self._size >= self.rotate_bytes or (time.monotonic() - self._opened_at) >= self.rotate_seconds:
+            self._rotate()
+        data = b"".join(records)
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+
+class NdjsonSink(RotatingFileSink):
+    encoding = "ndjson"
+    encode = staticmethod(encode_ndjson)
+    suffix = ".ndjson"
+
+
+
+class CsvSink(RotatingFileSink):
+    encoding = "csv"
+    encode = staticmethod(encode_csv)
+    suffix = ".csv"
+    header = b"time,measurement,tags,field,value\n"
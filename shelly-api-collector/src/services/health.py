@@ -0,0 +1,124 @@
+import time
+
+
+
+'''
+Per-device health with circuit breakers.
+A device is healthy until a poll fails, degraded while it keeps failing (still
+polled at its normal rate) and its circuit opens after failure_threshold failures
+in a row. An open device is skipped until its backoff expires, then a single
+half-open probe poll decides: success closes the circuit, failure doubles the backoff.
+Dead devices cost nothing between probes and healthy devices keep their rate.
+'''
+
+
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+OPEN = "open"
+
+
+
+class CircuitBreaker:
+    __slots__ = ("failures", "backoff", "retry_at", "probing")
+
+
+    def __init__(self):
+        self.failures: int = 0
+        self.backoff: float = 0.0
+        self.retry_at: float = 0.0
+        self.probing: bool = False
+
+
+
+class HealthTracker:
+    def __init__(self, failure_threshold: int = 3, backoff_seconds: float = 30.0, max_backoff_seconds: float = 600.0):
+        self.failure_threshold = failure_threshold
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._breakers: dict = {}
+        # Stats
+        self.skipped: int = 0
+
+
+    def state(self, key) -> str:
+        breaker = self._breakers.get(key)
+        if breaker is None or breaker.failures == 0:
+            return HEALTHY
+        return OPEN if breaker.failures >= self.failure_threshold else DEGRADED
+
+
+    def allow(self, key, now: float = None) -> bool:
+        '''
+        Checks whether a device may be polled.
+        An open circuit lets one probe through once its backoff expired.
+
+        Args:
+            key (Any): The device key
+            now (float): The monotonic time, defaults to now
+
+        Returns:
+            bool: True if the device should be polled
+        '''
+        breaker = self._breakers.get(key)
+        if breaker is None or breaker.failures < self.failure_threshold:
+            return True
+        now = time.monotonic() if now is None else now
+        if breaker.probing or now < breaker.retry_at:
+            self.skipped += 1
+            return False
+        breaker.probing = True
+        return True
+
+
+    def record(self, key, ok: bool, device_name: str = None, now: float = None) -> None:
+        '''
+        Records a poll result and moves the device between states.
+
+        Args:
+            key (Any): The device key
+            ok (bool): True if the poll succeeded
+            device_name (str): Name to log state changes with, defaults to the key
+            now (float): The monotonic time, defaults to now
+        '''
+        breaker = self._breakers.get(key)
+        if ok:
+            if breaker is not None:
+                if breaker.failures >= self.failure_threshold:
+                    print(f"{device_name or key} is reachable again, circuit closed.")
+                del self._breakers[key]
+            return
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker()
+        breaker.failures += 1
+        breaker.probing = False
+        if breaker.failures < self.failure_threshold:
+            return
+        now = time.monotonic() if now is None else now
+        if breaker.failures == self.failure_threshold:
+            breaker.backoff = self.backoff_seconds
+            print(f"{device_name or key} failed {breaker.failures} polls in a row, circuit open for {breaker.backoff:.0f} seconds.")
+        else:
+            # Failed half-open probe
+            breaker.backoff = min(breaker.backoff * 2, self.max_backoff_seconds)
+        breaker.retry_at = now + breaker.backoff
+
+
+    def remove(self, key) -> None:
+        self._breakers.pop(key, None)
+
+
+    def counts(self) -> dict:
+        '''
+        Devices per unhealthy state, every device not listed is healthy.
+        '''
+        counts = {DEGRADED: 0, OPEN: 0}
+        # Copied, the metrics endpoint reads this from another thread
+        for breaker in list(self._breakers.values()):
+            counts[OPEN if breaker.failures >= self.failure_threshold else DEGRADED] += 1
+        return counts
+
+
+    def summary(self) -> str:
+        counts = self.counts()
+        return f"{counts[DEGRADED]} degraded, {counts[OPEN]} open circuits, {self.skipped} polls skipped"
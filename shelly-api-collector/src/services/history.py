@@ -0,0 +1,278 @@
+import array
+import bisect
+import fnmatch
+import math
+import time
+
+
+
+'''
+In-memory history of the recent readings, for local consumers (rules, hot dashboards)
+that would otherwise query InfluxDB for what the collector just wrote.
+Every series (device, component, index) is a ring of fixed-size columns: one array('q')
+of timestamps and one array('d') per numeric field, sized once from HISTORY_SECONDS and the
+device's poll interval, so memory is capacity * 8 bytes per field and does not grow.
+Streamed readings (CoIoT, WebSocket, MQTT) arrive faster than the poll interval, they are thinned
+to one per interval so a ring still covers HISTORY_SECONDS.
+Booleans are stored as 0/1, text fields are not kept. A reading without a field keeps the
+field's previous value. Window queries slice the columns and aggregate them with the
+C builtins (min, max, math.fsum), no per-sample Python code.
+'''
+
+
+
+NANOSECONDS = 1_000_000_000
+
+
+class SeriesRing:
+    __slots__ = ("capacity", "times", "columns", "since", "head", "written")
+
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = array.array("q", bytes(8 * capacity))
+        # Field -> values, aligned with times
+        self.columns: dict = {}
+        # Field -> number of readings written before the field first appeared
+        self.since: dict = {}
+        self.head: int = 0
+        self.written: int = 0
+
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+
+    def append(self, timestamp: int, fields: dict, projected) -> None:
+        '''
+        Writes one reading, overwriting the oldest once the ring is full.
+
+        Args:
+            timestamp (int): The reading time in nanoseconds
+            fields (dict): The reading's fields
+            projected (callable): Tells if a new field should be kept
+        '''
+        index = self.head
+        previous = (index - 1) % self.capacity
+        self.times[index] = timestamp
+        columns = self.columns
+        written = 0
+        for name, value in fields.items():
+            column = columns.get(name)
+            if column is None:
+                if value is None or isinstance(value, (str, list, dict)) or not projected(name):
+                    continue
+                column = columns[name] = array.array("d", bytes(8 * self.capacity))
+                self.since[name] = self.written
+            try:
+                column[index] = value
+            except TypeError:
+                # None or a value of another type, keeps the previous value
+                column[index] = column[previous]
+            written += 1
+        if written < len(columns):
+            for name, column in columns.items():
+                if name not in fields:
+                    column[index] = column[previous]
+        self.head = (index + 1) % self.capacity
+        self.written += 1
+
+
+    def _segments(self, name: str, start: int) -> list[tuple[int, int]]:
+        '''
+        The index ranges of the readings since start (nanoseconds), oldest first.
+        Sorted runs of the ring: [head, capacity) then [0, head) once it wrapped.
+        '''
+        count = min(self.written - self.since[name], self.capacity)
+        first = (self.head - count) % self.capacity
+        if first + count <= self.capacity:
+            runs = [(first, first + count)]
+        else:
+            runs = [(first, self.capacity), (0, self.head)]
+        segments = []
+        for low, high in runs:
+            low = bisect.bisect_left(self.times, start, low, high)
+            if low < high:
+                segments.append((low, high))
+        return segments
+
+
+    def last(self, name: str) -> tuple[int, float] | None:
+        column = self.columns.get(name)
+        if column is None or not self.written:
+            return None
+        index = (self.head - 1) % self.capacity
+        return self.times[index], column[index]
+
+
+    def window(self, name: str, start: int) -> tuple[array.array, array.array]:
+        '''
+        The timestamps and values of a field since start (nanoseconds), oldest first.
+        '''
+        times = array.array("q")
+        values = array.array("d")
+        column = self.columns.get(name)
+        if column is None:
+            return times, values
+        for low, high in self._segments(name, start):
+            times += self.times[low:high]
+            values += column[low:high]
+        return times, values
+
+
+    def aggregate(self, name: str, start: int) -> dict | None:
+        '''
+        Last, min, max and mean of a field since start (nanoseconds).
+
+        Returns:
+            dict | None: The aggregates and the number of readings, None without readings
+        '''
+        column = self.columns.get(name)
+        if column is None:
+            return None
+        segments = [column[low:high] for low, high in self._segments(name, start)]
+        count = sum(len(segment) for segment in segments)
+        if not count:
+            return None
+        return {
+            "last": segments[-1][-1],
+            "min": min(min(segment) for segment in segments),
+            "max": max(max(segment) for segment in segments),
+            "mean": math.fsum(math.fsum(segment) for segment in segments) / count,
+            "count": count
+        }
+
+
+    def nbytes(self) -> int:
+        return (len(self.columns) + 1) * 8 * self.capacity
+
+
+
+class History:
+    def __init__(self, retention_seconds: float, default_interval: float, max_samples: int = 100000, fields: list = None):
+        self.retention_seconds = retention_seconds
+        self.default_interval = default_interval
+        self.max_samples = max_samples
+        # Glob patterns of the fields to keep, all numeric fields by default
+        self.fields = fields or ["*"]
+        self._capacities: dict = {}
+        # Device key -> poll interval in nanoseconds, the spacing of the streamed readings kept
+        self._intervals: dict = {}
+        # Device key -> {(component, index): SeriesRing}
+        self._series: dict = {}
+        self._projected: dict = {}
+
+
+    def capacity(self, interval: float = None) -> int:
+        '''
+        Readings per series to cover the retention at the poll interval.
+        '''
+        return max(1, min(math.ceil(self.retention_seconds / (interval or self.default_interval)), self.max_samples))
+
+
+    def add(self, key, interval: float = None) -> None:
+        '''
+        Sizes the rings of a device from its poll interval. A new interval starts its history over.
+        '''
+        capacity = self.capacity(interval)
+        if self._capacities.get(key) != capacity:
+            self.remove(key)
+        self._capacities[key] = capacity
+        self._intervals[key] = int((interval or self.default_interval) * NANOSECONDS)
+
+
+    def remove(self, key) -> None:
+        self._capacities.pop(key, None)
+        self._intervals.pop(key, None)
+        self._series.pop(key, None)
+
+
+    def projected(self, name: str) -> bool:
+        kept = self._projected.get(name)
+        if kept is None:
+            kept = self._projected[name] = any(fnmatch.fnmatchcase(name, pattern) for pattern in self.fields)
+        return kept
+
+
+    def update(self, device, components: tuple = None, streamed: bool = False) -> None:
+        '''
+        Writes the latest readings of a polled or streamed device.
+
+        Args:
+            device (Shelly3EM | ShellyGen2): The device with its latest readings
+            components (tuple): Only these series of a Shelly 3EM, default all
+            streamed (bool): A streamed update, kept only once the poll interval passed since the series' last reading
+        '''
+        if device.polled_at is None:
+            return
+        rings = self._series.get(device.key)
+        if rings is None:
+            rings = self._series[device.key] = {}
+        # A polled reading only has to be newer than the last
+        spacing = self._intervals.get(device.key, int(self.default_interval * NANOSECONDS)) if streamed else 1
+        for component, index, fields in device.series(components):
+            ring = rings.get((component, index))
+            if ring is None:
+                ring = rings[(component, index)] = SeriesRing(self._capacities.get(device.key) or self.capacity())
+            if ring.written and device.polled_at - ring.times[(ring.head - 1) % ring.capacity] < spacing:
+                # Same reading again, or a streamed one within the interval
+                continue
+            ring.append(device.polled_at, fields, self.projected)
+
+
+    def series(self, key, component: str = "device", index: int = None) -> SeriesRing | None:
+        return self._series.get(key, {}).get((component, index))
+
+
+    def last(self, key, component: str, index: int, name: str) -> tuple[int, float] | None:
+        '''
+        The latest value of a field.
+
+        Args:
+            key (tuple): The device key (model, ip)
+            component (str): The series, "device" for Gen2 devices, e.g. "emeter" for a Shelly 3EM
+            index (int): The channel of the series, None if it has none
+            name (str): The field
+
+        Returns:
+            tuple[int, float] | None: The timestamp in nanoseconds and the value, None if unknown
+        '''
+        ring = self.series(key, component, index)
+        return ring.last(name) if ring else None
+
+
+    def aggregate(self, key, component: str, index: int, name: str, seconds: float, now: float = None) -> dict | None:
+        '''
+        Last, min, max and mean of a field over the last seconds.
+
+        Args:
+            key (tuple): The device key (model, ip)
+            component (str): The series, "device" for Gen2 devices, e.g. "emeter" for a Shelly 3EM
+            index (int): The channel of the series, None if it has none
+            name (str): The field
+            seconds (float): The window length
+            now (float): The window end as a Unix time, defaults to now
+
+        Returns:
+            dict | None: {"last", "min", "max", "mean", "count"}, None without readings in the window
+        '''
+        ring = self.series(key, component, index)
+        if ring is None:
+            return None
+        now = time.time() if now is None else now
+        return ring.aggregate(name, int((now - seconds) * NANOSECONDS))
+
+
+    def rings(self) -> list[SeriesRing]:
+        # Copied, the metrics endpoint reads this from another thread
+        return [ring for rings in list(self._series.values()) for ring in list(rings.values())]
+
+
+    def nbytes(self) -> int:
+        return sum(ring.nbytes() for ring in self.rings())
+
+
+    def summary(self) -> str:
+        rings = self.rings()
+        readings = sum(len(ring) for ring in rings)
+        return f"{len(rings)} series, {readings} readings kept, {sum(ring.nbytes() for ring in rings) / 1024 / 1024:.1f} MiB"
@@ -0,0 +1,40 @@
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+
+
+'''
+InfluxDB v2 sink.
+Owns the client and write API so a single connection is reused for every write.
+'''
+
+
+
+class InfluxSink:
+    # Takes the collector's line protocol or point dictionaries as they are
+    encoding = None
+
+
+    def __init__(self, url: str, token: str, org: str, bucket: str):
+        self.bucket = bucket
+        self.client = InfluxDBClient(url=url, token=token, org=org)
+        # Writes happen on the writer thread, so a blocking write is fine here
+        self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
+
+
+    def write(self, records: list) -> None:
+        '''
+        Writes records to the bucket.
+
+        Args:
+            records (list): Point dictionaries or line protocol strings
+
+        Raises:
+            Exception: Any error from the InfluxDB client
+        '''
+        self.write_api.write(bucket=self.bucket, record=records)
+
+
+    def close(self) -> None:
+        self.write_api.close()
+        self.client.close()
@@ -0,0 +1,63 @@
+import time
+
+
+
+'''
+Cache of a device's static /shelly identity, refreshed only when it could have changed.
+'''
+
+
+
+class StaticInfoCache:
+    '''
+    Cache of a device's static /shelly identity (mac, model, firmware...).
+    Stale when the TTL expires, the revision changes (config or firmware)
+    or the device uptime goes backwards (a reboot, e.g. after a firmware update).
+    '''
+    def __init__(self, ttl_seconds: float = 3600):
+        self.ttl_seconds = ttl_seconds
+        self.info: dict = None
+        self._fetched_at: float = 0.0
+        self._revision = None
+        self._uptime: int = None
+
+
+    def is_stale(self, revision=None, uptime: int = None) -> bool:
+        '''
+        Checks if the cached info needs to be fetched again.
+
+        Args:
+            revision (Any): The device's current config/firmware revision
+            uptime (int): The device's current uptime in seconds
+
+        Returns:
+            bool: True if the info should be refreshed
+        '''
+        if self.info is None:
+            return True
+        if (time.monotonic() - self._fetched_at) > self.ttl_seconds:
+            return True
+        if revision is not None and revision != self._revision:
+            return True
+        if uptime is not None and self._uptime is not None and uptime < self._uptime:
+            return True
+        return False
+
+
+    def update(self, info: dict, revision=None, uptime: int = None) -> None:
+        self.info = info
+        self._fetched_at = time.monotonic()
+        self._revision = revision
+        self.seen(uptime)
+
+
+    def seen(self, uptime: int = None) -> None:
+        '''
+        Records the latest uptime so a reboot can be detected on the next poll.
+        '''
+        if uptime is not None:
+            self._uptime = uptime
+
+
+    def invalidate(self) -> None:
+        self.info = None
@@ -0,0 +1,205 @@
+import math
+import re
+
+
+
+'''
+InfluxDB line protocol serialization.
+The escaped measurement and tag set of a series is rendered once into a prefix,
+then each reading only renders its field values and timestamp.
+Types and escaping follow the influxdb-client Point serialization so the
+series written are identical to the dict path.
+parse_line() reads a line back into its parts for the sinks with other encodings.
+'''
+
+
+
+_ESCAPE_MEASUREMENT = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+_ESCAPE_KEY = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+_ESCAPE_STRING = str.maketrans({"\"": r"\"", "\\": r"\\"})
+
+
+
+def escape_key(key) -> str:
+    return str(key).translate(_ESCAPE_KEY)
+
+
+def render_prefix(measurement: str, tags: dict) -> str:
+    '''
+    Renders the escaped "measurement,tag=value,... " prefix of a series.
+    Tags are sorted by key and empty tags are skipped.
+
+    Args:
+        measurement (str): The measurement name
+        tags (dict): The tags of the series
+
+    Returns:
+        str: The prefix, including the trailing space before the fields
+    '''
+    parts = [str(measurement).translate(_ESCAPE_MEASUREMENT)]
+    for key, value in sorted(tags.items()):
+        if value is None:
+            continue
+        key = escape_key(key)
+        value = escape_key(value)
+        if key and value:
+            parts.append(f"{key}={value}")
+    return ",".join(parts) + " "
+
+
+def _render_float(value: float) -> str | None:
+    if not math.isfinite(value):
+        return None
+    text = repr(value)
+    return text[:-2] if text.endswith(".0") else text
+
+
+_RENDERERS = {
+    bool: lambda value: "true" if value else "false",
+    int: lambda value: f"{value}i",
+    float: _render_float,
+    str: lambda value: "\"" + value.translate(_ESCAPE_STRING) + "\""
+}
+# Escaped "key=" per field key, field keys repeat every reading
+_FIELD_KEYS: dict[str, str] = {}
+
+
+def render_value(value) -> str | None:
+    '''
+    Renders a field value, None if the value cannot be written.
+    '''
+    renderer = _RENDERERS.get(type(value))
+    if renderer is None:
+        # Subclasses, e.g. IntEnum
+        for value_type in (bool, int, float, str):
+            if isinstance(value, value_type):
+                return _RENDERERS[value_type](value)
+        return None
+    return renderer(value)
+
+
+def render_fields(fields: dict) -> str:
+    '''
+    Renders "key=value,..." for the writable fields of a dictionary.
+
+    Args:
+        fields (dict): The fields
+
+    Returns:
+        str: The rendered fields, empty if none are writable
+    '''
+    parts = []
+    for key, value in fields.items():
+        value = render_value(value)
+        if value is None:
+            continue
+        field_key = _FIELD_KEYS.get(key)
+        if field_key is None:
+            field_key = _FIELD_KEYS[key] = escape_key(key) + "="
+        parts.append(field_key + value)
+    return ",".join(parts)
+
+
+def append_line(lines: list, prefix: str, fields: str, timestamp: int = None) -> None:
+    '''
+    Appends one line to the buffer. Lines without fields are skipped.
+
+    Args:
+        lines (list): The buffer of lines
+        prefix (str): The series prefix from render_prefix
+        fields (str): The fields from render_fields
+        timestamp (int): The timestamp in nanoseconds
+    '''
+    if not fields:
+        return
+    if timestamp is None:
+        lines.append(prefix + fields)
+    else:
+        lines.append(f"{prefix}{fields} {timestamp}")
+
+
+def point_to_line(point: dict) -> str | None:
+    '''
+    Serializes a point dictionary, for records that do not have a prefix cache.
+    '''
+    fields = render_fields(point["fields"])
+    if not fields:
+        return None
+    lines = []
+    append_line(lines, render_prefix(point["measurement"], point.get("tags", {})), fields, point.get("time"))
+    return lines[0]
+
+
+# Up to the first unescaped space, and up to the first unescaped comma
+_PREFIX = re.compile(r"[^ \\]*(?:\\.[^ \\]*)*")
+_MEASUREMENT = re.compile(r"[^,\\]*(?:\\.[^,\\]*)*")
+# Escaped "key=value" pairs, string field values are quoted
+_TAG_PAIR = re.compile(r'([^,=\\]*(?:\\.[^,=\\]*)*)=([^,\\]*(?:\\.[^,\\]*)*)')
+_FIELD_PAIR = re.compile(r'([^,=\\]*(?:\\.[^,=\\]*)*)=("[^"\\]*(?:\\.[^"\\]*)*"|[^,]*)')
+_KEY_UNESCAPES = (("\\,", ","), ("\\=", "="), ("\\ ", " "), ("\\n", "\n"), ("\\t", "\t"), ("\\r", "\r"))
+# Prefix -> (measurement, tags), the same series come back every cycle
+_PREFIXES: dict[str, tuple[str, dict]] = {}
+_MAX_PREFIXES = 100000
+
+
+def _unescape_key(key: str) -> str:
+    if "\\" not in key:
+        return key
+    for escaped, character in _KEY_UNESCAPES:
+        key = key.replace(escaped, character)
+    return key
+
+
+def _parse_value(value: str):
+    if value.startswith("\""):
+        return value[1:-1].replace("\\\"", "\"").replace("\\\\", "\\")
+    if value.endswith("i"):
+        return int(value[:-1])
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    return float(value)
+
+
+def _parse_prefix(prefix: str) -> tuple[str, dict]:
+    parsed = _PREFIXES.get(prefix)
+    if parsed is None:
+        measurement = _MEASUREMENT.match(prefix).group()
+        tags = {_unescape_key(key): _unescape_key(value) for key, value in _TAG_PAIR.findall(prefix, len(measurement) + 1)}
+        if len(_PREFIXES) >= _MAX_PREFIXES:
+            _PREFIXES.clear()
+        parsed = _PREFIXES[prefix] = (_unescape_key(measurement), tags)
+    return parsed
+
+
+def parse_line(line: str) -> tuple[str, dict, dict, int | None]:
+    '''
+    Parses a line rendered by this module back into its parts, for the sinks
+    that encode points differently (services.fanout). The parsed tag sets are cached.
+
+    Args:
+        line (str): One line protocol line
+
+    Returns:
+        tuple: (measurement, tags, fields, timestamp in nanoseconds or None). The tags are shared, do not modify them
+    '''
+    if "\\" in line:
+        prefix = _PREFIX.match(line).group()
+    else:
+        prefix = line[:line.index(" ")]
+    measurement, tags = _parse_prefix(prefix)
+    rest = line[len(prefix) + 1:]
+    timestamp = None
+    head, _, tail = rest.rpartition(" ")
+    # A space inside a string field is followed by the closing quote, never by digits only
+    if head and tail.lstrip("-").isdigit():
+        rest, timestamp = head, int(tail)
+    if "\"" not in rest and "\\" not in rest:
+        fields = {}
+        for pair in rest.split(","):
+            key, _, value = pair.partition("=")
+            fields[key] = _parse_value(value)
+    else:
+        fields = {_unescape_key(key): _parse_value(value) for key, value in _FIELD_PAIR.findall(rest)}
+    return measurement, tags, fields, timestamp
@@ -0,0 +1,194 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+
+'''
+Self-instrumentation metrics, served in the Prometheus text format on /metrics.
+Counters and histograms are kept per thread: the poller threads, the event loop and
+the writer thread only update their own dictionaries, without locks. A scrape sums
+the threads' values. Gauges (e.g. the writer queue depth) are read when scraped.
+'''
+
+
+
+# Seconds, from a fast LAN response to the read timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POINTS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+
+class Metrics:
+    def __init__(self):
+        # Name -> (type, help, label names, buckets)
+        self._families: dict = {}
+        # Name -> callables returning a value or {label values: value}
+        self._readers: dict = {}
+        self._local = threading.local()
+        # Every thread's (counters, histograms), the lock only guards adding a thread
+        self._stores: list = []
+        self._lock = threading.Lock()
+
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> None:
+        self._families[name] = ("counter", help, labels, None)
+
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> None:
+        self._families[name] = ("histogram", help, labels, buckets)
+
+
+    def gauge(self, name: str, help: str, read, labels: tuple = (), kind: str = "gauge") -> None:
+        '''
+        Registers a metric read at scrape time.
+
+        Args:
+            name (str): The metric name
+            help (str): The help text
+            read (callable): Returns the value, or {label values: value} with labels
+            labels (tuple): The label names
+            kind (str): The metric type, "counter" for totals kept elsewhere
+        Registering a name again adds a reader, the values of all readers are merged.
+        '''
+        self._families[name] = (kind, help, labels, None)
+        # Several readers of a family (e.g. one per sink) are merged
+        self._readers.setdefault(name, []).append(read)
+
+
+    def _store(self) -> tuple:
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = ({}, {})
+            with self._lock:
+                self._stores.append(store)
+        return store
+
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1) -> None:
+        counters = self._store()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        histograms = self._store()[1]
+        key = (name, labels)
+        buckets = self._families[name][3]
+        counts = histograms.get(key)
+        if counts is None:
+            # One count per bucket, +Inf, then the sum
+            counts = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+
+    def _merged(self) -> tuple[dict, dict]:
+        counters, histograms = {}, {}
+        with self._lock:
+            stores = list(self._stores)
+        for thread_counters, thread_histograms in stores:
+            # Copies are atomic, the owning thread may be updating its dictionaries
+            for key, value in thread_counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, counts in thread_histograms.copy().items():
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = list(counts)
+                else:
+                    for index, count in enumerate(counts):
+                        merged[index] += count
+        return counters, histograms
+
+
+    def render(self) -> str:
+        '''
+        Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The /metrics response body
+        '''
+        counters, histograms = self._merged()
+        series: dict = {}
+        for (name, labels), value in counters.items():
+            series.setdefault(name, []).append((labels, value))
+        for (name, labels), counts in histograms.items():
+            series.setdefault(name, []).append((labels, counts))
+        for name, readers in self._readers.items():
+            values = {}
+            for read in readers:
+                try:
+                    value = read()
+                except Exception as e:
+                    print(f"Error reading metric {name}: {e}")
+                    continue
+                values.update(value if isinstance(value, dict) else {(): value})
+            series[name] = list(values.items())
+        lines = []
+        for name, (kind, help, label_names, buckets) in self._families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.get(name, []), key=lambda item: item[0]):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(label_names, labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), value):
+                    cumulative += count
+                    bucket = format_labels(label_names, labels, 'le="' + str(bound) + '"')
+                    lines.append(f"{name}_bucket{bucket} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(label_names, labels)} {value[-1]}")
+                lines.append(f"{name}_count{format_labels(label_names, labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics: Metrics = None
+
+
+    def do_GET(self) -> None:
+        if self.path.partition("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+
+class MetricsServer:
+    def __init__(self, metrics: Metrics, host: str = "0.0.0.0", port: int = 9464):
+        handler = type("Handler", (MetricsHandler,), {"metrics": metrics})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+
+
+    def start(self) -> None:
+        self._thread.start()
+        print(f"Serving metrics on http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,214 @@
+import fnmatch
+import json
+import os
+
+
+
+'''
+Declarative Gen2 device models.
+A model spec (src/models/<model>.json) lists the components of the Shelly.GetStatus and
+Shelly.GetConfig documents, the JSON path, name and type of every field, the channels
+(switch:0..n, input:0..n) the components repeat for and include/exclude globs on the field names.
+Each spec is compiled once into flat Python extractors: one function per document with a local
+per component and a direct subscript per field, so a poll runs no interpretation of the spec.
+A new multi-channel model (e.g. the Pro 4PM) is a new spec file, not a new device class.
+'''
+
+
+
+DEFAULT_MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+CASTS = ("int", "float", "bool", "str")
+OPS = ("contains", "elapsed", "remaining")
+
+
+def lookup(document, path: tuple, default=None):
+    '''
+    Reads a nested value, default if any part of the path is missing.
+    '''
+    for part in path:
+        try:
+            document = document[part]
+        except (KeyError, IndexError, TypeError):
+            return default
+    return default if document is None else document
+
+
+def elapsed(now, start, default):
+    if now is None or start is None:
+        return default
+    return now - start
+
+
+def remaining(now, start, duration, default):
+    if now is None or start is None or duration is None:
+        return default
+    return duration - (now - start)
+
+
+def split_path(path: str) -> tuple:
+    return tuple(int(part) if part.isdigit() else part for part in path.split("."))
+
+
+
+class ModelSpec:
+    def __init__(self, spec: dict, source: str = "<spec>"):
+        self.spec = spec
+        self.source = source
+        self.model: str = spec["model"]
+        self.measurement: str = spec.get("measurement", self.model)
+        # The "app" of /shelly, identifies the model during discovery
+        self.app: str = spec.get("app")
+        self.info_fields: list = spec.get("info", [])
+        self.channels: dict = spec.get("channels", {})
+        self._include: list = spec.get("include", [])
+        self._exclude: list = spec.get("exclude", [])
+        # Component key -> RPC method, for collecting one request per component
+        self.status_methods: dict = self._methods(spec.get("status", []))
+        self.config_methods: dict = self._methods(spec.get("config", []))
+        self.status_fields, self.status_code, self.extract_status = self._compile("extract_status", spec.get("status", []))
+        self.config_fields, self.config_code, self.extract_config = self._compile("extract_config", spec.get("config", []))
+        self.energy: list = self._energy(spec.get("energy"))
+
+
+    def _ids(self, group: dict) -> range:
+        channel = group.get("channel")
+        return range(self.channels[channel]) if channel else range(1)
+
+
+    def _methods(self, groups: list) -> dict:
+        methods = {}
+        for group in groups:
+            for channel_id in self._ids(group):
+                if group.get("method"):
+                    methods[group["component"].format(id=channel_id)] = group["method"].format(id=channel_id)
+        return methods
+
+
+    def _projected(self, name: str) -> bool:
+        if self._include and not any(fnmatch.fnmatchcase(name, pattern) for pattern in self._include):
+            return False
+        return not any(fnmatch.fnmatchcase(name, pattern) for pattern in self._exclude)
+
+
+    def _expression(self, field: dict, local: str, channel_id: int, constants: list) -> str:
+        '''
+        Renders the Python expression reading one field.
+        Paths are relative to the component, "$." paths to the document root.
+        Required values are plain subscripts, optional ones a dict.get() or a lookup() of nested paths.
+        '''
+        optional = "default" in field
+        default = field.get("default")
+
+        def reference(path: str, optional: bool, default=None) -> str:
+            base = local
+            if path.startswith("$."):
+                base, path = "document", path[2:]
+            parts = split_path(path.format(id=channel_id))
+            if not optional:
+                return base + "".join(f"[{part!r}]" for part in parts)
+            if len(parts) == 1 and isinstance(parts[0], str):
+                return f"{base}.get({parts[0]!r}, {default!r})"
+            constants.append(parts)
+            return f"lookup({base}, _c{len(constants) - 1}, {default!r})"
+
+        op = field.get("op")
+        if op == "contains":
+            expression = f"({field['value']!r} in {reference(field['path'], True, ())})"
+        elif op == "elapsed":
+            expression = f"elapsed({reference(field['now'], False)}, {reference(field['path'], True)}, {default!r})"
+        elif op == "remaining":
+            expression = f"remaining({reference(field['now'], False)}, {reference(field['start'], True)}, {reference(field['path'], True)}, {default!r})"
+        elif op is None:
+            expression = reference(field["path"], optional, default)
+        else:
+            raise ValueError(f"{self.source}: unknown op {op} of {field['name']}, expected one of {OPS}")
+        cast = field.get("type")
+        if cast is None:
+            return expression
+        if cast not in CASTS:
+            raise ValueError(f"{self.source}: unknown type {cast} of {field['name']}, expected one of {CASTS}")
+        if optional and default is None:
+            # A missing value stays None (the field is left out) instead of failing the cast
+            return f"_cast({cast}, {expression})"
+        return f"{cast}({expression})"
+
+
+    def _compile(self, function_name: str, groups: list) -> tuple:
+        '''
+        Compiles the groups of one document into a flat extractor function.
+
+        Returns:
+            tuple: The field names, the generated source and the function (document -> fields dict)
+        '''
+        constants = []
+        locals_code = []
+        items = []
+        names = []
+        for group in groups:
+            for channel_id in self._ids(group):
+                fields = [field for field in group["fields"] if self._projected(field["name"].format(id=channel_id))]
+                if not fields:
+                    continue
+                local = f"c{len(locals_code)}"
+                locals_code.append(f"    {local} = document[{group['component'].format(id=channel_id)!r}]")
+                for field in fields:
+                    name = field["name"].format(id=channel_id)
+                    if name in names:
+                        raise ValueError(f"{self.source}: duplicate field {name}")
+                    names.append(name)
+                    items.append(f"        {name!r}: {self._expression(field, local, channel_id, constants)},")
+        source = "\n".join([f"def {function_name}(document):", *locals_code, "    return {", *items, "    }"]) + "\n"
+        namespace = {
+            "lookup": lookup,
+            "elapsed": elapsed,
+            "remaining": remaining,
+            "_cast": lambda cast, value: value if value is None else cast(value)
+        }
+        namespace.update({f"_c{index}": constant for index, constant in enumerate(constants)})
+        exec(compile(source, f"<{self.source} {function_name}>", "exec"), namespace)
+        return names, source, namespace[function_name]
+
+
+    def _energy(self, energy: dict) -> list:
+        '''
+        The energy counters per channel: (channel name, component, total path, returned path).
+        '''
+        if not energy:
+            return []
+        counters = []
+        for channel_id in self._ids(energy):
+            counters.append((
+                energy["name"].format(id=channel_id),
+                energy["component"].format(id=channel_id),
+                split_path(energy["total"]),
+                split_path(energy["returned"]) if energy.get("returned") else None
+            ))
+        return counters
+
+
+    @classmethod
+    def from_file(cls, path: str) -> "ModelSpec":
+        with open(path, "r") as file:
+            return cls(json.load(file), os.path.basename(path))
+
+
+
+def load_specs(directories: list) -> dict:
+    '''
+    Loads and compiles every model spec. A later directory overrides a model of an earlier one.
+
+    Args:
+        directories (list): Directories of <model>.json specs
+
+    Returns:
+        dict: {model: ModelSpec}
+    '''
+    specs = {}
+    for directory in directories:
+        if not directory or not os.path.isdir(directory):
+            continue
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(".json"):
+                spec = ModelSpec.from_file(os.path.join(directory, file_name))
+                specs[spec.model] = spec
+    return specs
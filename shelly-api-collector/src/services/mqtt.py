@@ -0,0 +1,251 @@
+import asyncio
+import json
+import time
+from collections import deque
+import paho.mqtt.client as mqtt
+from services.poller import Poller
+from services.push import merge_status
+
+
+
+'''
+MQTT ingestion.
+A single subscription receives what the devices publish to the broker:
+Gen1 devices (Shelly 3EM) publish their /status document to <prefix>/info,
+Gen2 devices (Shelly Pro 1 PM) publish each component to <prefix>/status/<component>
+and NotifyStatus/NotifyFullStatus frames to <prefix>/events/rpc.
+Payloads are assembled into the same status documents the devices poll, so they produce
+the same points. Messages are queued by the client thread and applied in batches,
+coalescing several messages for a device into one update.
+A device counts as streaming while it published within stale_seconds, it is polled otherwise.
+'''
+
+
+
+class MqttIngestor:
+    def __init__(
+            self,
+            on_update,
+            poller: Poller,
+            host: str = "localhost",
+            port: int = 1883,
+            username: str = "",
+            password: str = "",
+            topics: list[str] = None,
+            stale_seconds: float = 90.0
+        ):
+        self.on_update = on_update
+        self.poller = poller
+        self.host = host
+        self.port = port
+        self.topics = topics or ["shellies/+/info", "+/status/+", "+/events/rpc"]
+        self.stale_seconds = stale_seconds
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"shelly-api-collector-{time.time_ns()}")
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.reconnect_delay_set(1, 60)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        # Stats
+        self.messages: int = 0
+        self.unrouted: int = 0
+        self.incomplete: int = 0
+        # Topic prefix -> (key, device), devices without a known prefix wait in _pending
+        self._routes: dict = {}
+        self._pending: dict = {}
+        self._devices: dict = {}
+        self._prefixes: dict = {}
+        # Status documents assembled from the messages
+        self._documents: dict = {}
+        self._last_seen: dict = {}
+        self._last_resolve: float = 0.0
+        # Messages from the client thread
+        self._queue: deque = deque()
+        self._wake: asyncio.Event = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._wake_pending: bool = False
+        self._task: asyncio.Task = None
+
+
+    def add(self, key: tuple, device, config: dict) -> None:
+        '''
+        Routes a device's topics. The prefix comes from the "mqtt_prefix" of its config,
+        or the device's default prefix once its /shelly info is known.
+        '''
+        self._devices[key] = device
+        prefix = config.get("mqtt_prefix")
+        if prefix:
+            self._route(key, device, prefix)
+        else:
+            self._pending[key] = device
+
+
+    def _route(self, key: tuple, device, prefix: str) -> None:
+        self._routes[prefix] = (key, device)
+        self._prefixes[key] = prefix
+        self._pending.pop(key, None)
+
+
+    def remove(self, key: tuple) -> None:
+        self._devices.pop(key, None)
+        self._pending.pop(key, None)
+        self._documents.pop(key, None)
+        self._last_seen.pop(key, None)
+        prefix = self._prefixes.pop(key, None)
+        if prefix:
+            self._routes.pop(prefix, None)
+
+
+    def is_streaming(self, key: tuple) -> bool:
+        last_seen = self._last_seen.get(key)
+        return last_seen is not None and time.monotonic() - last_seen < self.stale_seconds
+
+
+    def start(self) -> None:
+        '''
+        Connects to the broker and starts applying messages. Must run on the event loop.
+        '''
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._consume())
+        self.client.connect_async(self.host, self.port, keepalive=60)
+        self.client.loop_start()
+
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties) -> None:
+        if reason_code.is_failure:
+            print(f"MQTT connection to {self.host}:{self.port} failed: {reason_code}")
+            return
+        # Subscribed again on every reconnect
+        client.subscribe([(topic, 0) for topic in self.topics])
+        print(f"Connected to MQTT broker {self.host}:{self.port}, subscribed to {', '.join(self.topics)}")
+
+
+    def _on_message(self, client, userdata, message) -> None:
+        # Client thread, only queue the message and wake the consumer once per batch
+        self._queue.append((message.topic, message.payload))
+        if not self._wake_pending:
+            self._wake_pending = True
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+
+    async def _consume(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            self._wake_pending = False
+            batch = []
+            while self._queue:
+                batch.append(self._queue.popleft())
+            try:
+                updated = await self.poller.call(self._apply_batch, batch)
+            except Exception as e:
+                print(f"Error applying MQTT messages: {e}")
+                continue
+            for device in updated:
+                self.on_update(device)
+
+
+    def _resolve_pending(self) -> None:
+        '''
+        Routes the devices whose default prefix became known, at most once per second.
+        '''
+        now = time.monotonic()
+        if not self._pending or now - self._last_resolve < 1.0:
+            return
+        self._last_resolve = now
+        for key, device in list(self._pending.items()):
+            prefix = device.mqtt_prefix()
+            if prefix:
+                self._route(key, device, prefix)
+
+
+    def _lookup(self, topic: str) -> tuple | None:
+        '''
+        Splits a topic into its device route, kind and component.
+
+        Returns:
+            tuple | None: (key, device, kind, component), None if not a known device topic
+        '''
+        if topic.endswith("/info"):
+            prefix, kind, component = topic[:-5], "info", None
+        elif topic.endswith("/events/rpc"):
+            prefix, kind, component = topic[:-11], "rpc", None
+        else:
+            prefix, separator, component = topic.rpartition("/status/")
+            if not separator:
+                return None
+            kind = "status"
+        route = self._routes.get(prefix)
+        if route is None:
+            return None
+        return (*route, kind, component)
+
+
+    def _apply_batch(self, batch: list) -> list:
+        '''
+        Applies a batch of messages. Runs on the poller's worker pool,
+        as a config or /shelly info change makes the device fetch them.
+
+        Returns:
+            list: The updated devices
+        '''
+        self._resolve_pending()
+        changed = {}
+        timestamps = {}
+        for topic, payload in batch:
+            route = self._lookup(topic)
+            if route is None:
+                self.unrouted += 1
+                continue
+            key, device, kind, component = route
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                continue
+            self.messages += 1
+            if kind == "info":
+                self._documents[key] = data
+            elif kind == "status":
+                self._documents.setdefault(key, {})[component] = data
+            elif data.get("method") == "NotifyFullStatus":
+                self._documents[key] = data["params"]
+            elif data.get("method") == "NotifyStatus":
+                merge_status(self._documents.setdefault(key, {}), data["params"])
+            else:
+                continue
+            if isinstance(data, dict) and "params" in data and "ts" in data["params"]:
+                timestamps[key] = data["params"]["ts"]
+            changed[key] = device
+
+        updated = []
+        for key, device in changed.items():
+            try:
+                device.apply_status(self._documents[key])
+            except KeyError:
+                # A Gen2 document is complete once every component was published
+                self.incomplete += 1
+                continue
+            except Exception as e:
+                print(f"Error applying MQTT status of {device.model} at {device.ip_address}: {e}")
+                continue
+            timestamp = timestamps.get(key)
+            device.polled_at = int(timestamp * 1e9) if timestamp else time.time_ns()
+            self._last_seen[key] = time.monotonic()
+            updated.append(device)
+        return updated
+
+
+    def summary(self) -> str:
+        streaming = sum(1 for key in self._devices if self.is_streaming(key))
+        return (
+            f"{streaming}/{len(self._devices)} devices streaming, {self.messages} messages, "
+            f"{self.unrouted} unrouted, {self.incomplete} incomplete, queue depth {len(self._queue)}"
+        )
+
+
+    def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        self.client.loop_stop()
+        self.client.disconnect()
@@ -0,0 +1,362 @@
+import os
+import sys
+import time
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as csv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+
+'''
+Columnar Parquet archive, for keeping years of readings without keeping them in InfluxDB.
+Needs pyarrow 14 or later (pip install pyarrow), only when the sink or the reader is used.
+Every batch the writer flushes is converted to one Arrow record batch per measurement, UTC day
+and device (MAC, or IP without one), a pyarrow conversion per column, so the buffered points live
+in Arrow memory and PARQUET_ROTATE_BYTES is checked against their real size (nbytes).
+A rotation concatenates each partition's batches and writes them as one compressed file:
+
+    <PARQUET_DIR>/<measurement>/date=2026-10-18/device=C45BBE000001/part-20261018T100000Z-<pid>-000001.parquet
+
+date and device are Hive partitions, so scan() only opens the files of the requested days and devices
+and only reads the requested columns. compact() merges a finished day's parts into one day.parquet.
+Numbers are stored as doubles so a field keeps one type across files, a field named like a tag
+(the 3EM wifi "ip") is stored as "<name>_field".
+'''
+
+
+
+DAY_NS = 86400 * 1_000_000_000
+TIME_TYPE = pa.timestamp("ns", tz="UTC") if pa else None
+
+
+def field_array(values: list) -> "pa.Array":
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types, e.g. a field that is sometimes text
+        return pa.array([None if value is None else str(value) for value in values], pa.string())
+    if pa.types.is_integer(array.type):
+        # Unchecked, counters beyond 2**53 round like they do in InfluxDB
+        return array.cast(pa.float64(), safe=False)
+    return array
+
+
+def tag_array(values: list) -> "pa.Array":
+    try:
+        return pa.array(values, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    try:
+        # Point dictionaries can have numeric tags, written as text like InfluxDB does
+        return pa.array(values).cast(pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+
+def record_batch(rows: list, tags: set) -> "pa.RecordBatch":
+    '''
+    Converts the rows of a partition to a record batch, one pyarrow conversion per column.
+
+    Args:
+        rows (list): Row dictionaries built by ParquetSink.encode(), a column missing from a row is null
+        tags (set): The tag names among the columns, stored as text
+
+    Returns:
+        pa.RecordBatch: The rows
+    '''
+    names = dict.fromkeys(name for row in rows for name in row)
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if name == "time":
+            columns[name] = pa.array(values, TIME_TYPE)
+        else:
+            columns[name] = tag_array(values) if name in tags else field_array(values)
+    return pa.RecordBatch.from_pydict(columns)
+
+
+def merge(batches: list) -> "pa.Table":
+    '''
+    Concatenates the batches of a partition, a column missing from a batch is null.
+    A field that is a number in some batches and text in others is stored as text, as field_array() does.
+    '''
+    tables = [pa.Table.from_batches([batch]) for batch in batches]
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    types: dict[str, set] = {}
+    for table in tables:
+        for field in table.schema:
+            if not pa.types.is_null(field.type):
+                types.setdefault(field.name, set()).add(field.type)
+    mixed = {name for name, kinds in types.items() if len(kinds) > 1}
+    tables = [
+        pa.table({name: column.cast(pa.string()) if name in mixed else column for name, column in zip(table.column_names, table.columns)})
+        for table in tables
+    ]
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def partitioning() -> "ds.Partitioning":
+    return ds.partitioning(pa.schema([("date", pa.string()), ("device", pa.string())]), flavor="hive")
+
+
+
+class ParquetSink:
+    encoding = "parquet"
+    # Batches kept per partition before they are merged into one, bounds the per-batch overhead
+    MERGE_BATCHES = 64
+
+
+    def __init__(self, directory: str, rotate_bytes: int = 64 * 1024 * 1024, rotate_seconds: float = 3600, compression: str = "zstd"):
+        if pa is None:
+            raise ImportError("the parquet sink needs pyarrow, pip install pyarrow")
+        self.directory = directory
+        # Arrow memory of the buffered batches
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compression = compression
+        self.files: int = 0
+        # (measurement, date, device) -> record batches
+        self._batches: dict[tuple, list] = {}
+        self._nbytes: int = 0
+        self._started_at: float = time.monotonic()
+        self._sequence: int = 0
+        # Bounds of the UTC day of the latest point, encode() runs on the fan-out encoder thread
+        self._day: tuple = (0, 0, "")
+        os.makedirs(directory, exist_ok=True)
+
+
+    def encode(self, point: tuple) -> tuple:
+        '''
+        Keys a point by its partition and flattens it into a row.
+
+        Args:
+            point (tuple): (measurement, tags, fields, timestamp in nanoseconds or None)
+
+        Returns:
+            tuple: ((measurement, date, device), tags, row with the time, tags and fields)
+        '''
+        measurement, tags, fields, timestamp = point
+        if timestamp is None:
+            timestamp = time.time_ns()
+        start, end, date = self._day
+        if not start <= timestamp < end:
+            start = timestamp - timestamp % DAY_NS
+            date = time.strftime("%Y-%m-%d", time.gmtime(start // 1_000_000_000))
+            self._day = (start, start + DAY_NS, date)
+        device = tags.get("mac") or tags.get("ip") or "unknown"
+        row = {"time": timestamp, **tags}
+        if row.keys() & fields.keys():
+            row.update((f"{name}_field" if name in row else name, value) for name, value in fields.items())
+        else:
+            row.update(fields)
+        return (measurement, date, device), tags, row
+
+
+    def _due(self) -> bool:
+        return bool(self._batches) and (self._nbytes >= self.rotate_bytes or time.monotonic() - self._started_at >= self.rotate_seconds)
+
+
+    def idle(self) -> None:
+        '''
+        Writes the buffered batches once they are due while no points arrive, e.g. every device
+        removed or every value held back by the deadband, called by the writer when it has nothing to flush.
+
+        Raises:
+            OSError: If a file cannot be written
+        '''
+        if self._due():
+            self.rotate()
+
+
+    def write(self, records: list) -> None:
+        '''
+        Converts a batch to a record batch per partition, after writing the files when the buffered batches are due.
+        A failed rotation raises before the batch is buffered, so a retried batch is not buffered twice.
+
+        Args:
+            records (list): Points encoded by encode()
+
+        Raises:
+            OSError: If a file cannot be written
+        '''
+        if self._due():
+            self.rotate()
+        if not self._batches:
+            self._started_at = time.monotonic()
+        partitions: dict[tuple, tuple[list, set]] = {}
+        for key, tags, row in records:
+            partition = partitions.get(key)
+            if partition is None:
+                partition = partitions[key] = ([], set())
+            partition[0].append(row)
+            partition[1].update(tags)
+        for key, (rows, tags) in partitions.items():
+            batch = record_batch(rows, tags)
+            batches = self._batches.setdefault(key, [])
+            batches.append(batch)
+            self._nbytes += batch.nbytes
+            if len(batches) >= self.MERGE_BATCHES:
+                merged = merge(batches).combine_chunks().to_batches()
+                self._nbytes += sum(batch.nbytes for batch in merged) - sum(batch.nbytes for batch in batches)
+                batches[:] = merged
+
+
+    def rotate(self) -> None:
+        '''
+        Writes the batches of every partition as a new file of the partition.
+        A file is written under a hidden name then renamed, a scan never reads it half written.
+        '''
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        for key in list(self._batches):
+            measurement, date, device = key
+            directory = os.path.join(self.directory, quote(measurement, safe=""), f"date={date}", f"device={quote(device, safe='')}")
+            os.makedirs(directory, exist_ok=True)
+            self._sequence += 1
+            name = f"part-{stamp}-{os.getpid()}-{self._sequence:06d}.parquet"
+            batches = self._batches[key]
+            pq.write_table(merge(batches), os.path.join(directory, f".{name}"), compression=self.compression)
+            os.replace(os.path.join(directory, f".{name}"), os.path.join(directory, name))
+            # Only the written partitions are dropped, a failed rotation is retried with the rest
+            del self._batches[key]
+            self._nbytes -= sum(batch.nbytes for batch in batches)
+            self.files += 1
+
+
+    def close(self) -> None:
+        try:
+            self.rotate()
+        except OSError as e:
+            print(f"Error writing the buffered points to {self.directory}: {e}")
+
+
+
+def scan(directory: str, measurement: str, start: str = None, end: str = None, devices: list = None, columns: list = None) -> "pa.Table":
+    '''
+    Reads archived points, opening only the files of the requested days and devices.
+
+    Args:
+        directory (str): The archive directory (PARQUET_DIR)
+        measurement (str): The measurement, e.g. shellypro1pm
+        start (str): First UTC day, YYYY-MM-DD, inclusive
+        end (str): Last UTC day, YYYY-MM-DD, exclusive
+        devices (list): Device MACs (or IPs), every device when empty
+        columns (list): Columns to read, every column when empty. time and device are always read
+
+    Returns:
+        pa.Table: The points, with their date and device
+    '''
+    if pa is None:
+        raise ImportError("reading the archive needs pyarrow, pip install pyarrow")
+    base = os.path.join(directory, quote(measurement, safe=""))
+    selection = None
+    for expression in (
+        ds.field("date") >= start if start else None,
+        ds.field("date") < end if end else None,
+        ds.field("device").isin(devices) if devices else None
+    ):
+        if expression is not None:
+            selection = expression if selection is None else selection & expression
+    archive = ds.dataset(base, format="parquet", partitioning=partitioning()) if os.path.isdir(base) else None
+    fragments = list(archive.get_fragments(filter=selection)) if archive else []
+    if not fragments:
+        return pa.table({"time": pa.array([], pa.timestamp("ns", tz="UTC"))})
+    # Files of other days or firmware versions can have other fields, missing columns read as null.
+    # The fragments keep the footers read for their schema, the scan does not read them again
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in fragments] + [partitioning().schema],
+        promote_options="permissive"
+    )
+    dataset = ds.FileSystemDataset(fragments, schema, archive.format, archive.filesystem)
+    if columns:
+        columns = list(dict.fromkeys(["time", "device", *columns]))
+    return dataset.to_table(columns=columns, use_threads=True)
+
+
+def downsample(table: "pa.Table", every_seconds: int, by: list = None) -> "pa.Table":
+    '''
+    Aggregates the numeric fields per device (and tags) and time bucket.
+
+    Args:
+        table (pa.Table): Points read by scan()
+        every_seconds (int): Bucket size, buckets start on multiples from the epoch (UTC)
+        by (list): Tags grouped on next to the device, e.g. ["component", "index"] for the 3EM
+
+    Returns:
+        pa.Table: One row per group and bucket: time_count, then <field>_mean, _min and _max of every field
+    '''
+    keys = ["device", *(by or []), "time"]
+    fields = [
+        field.name for field in table.schema
+        if field.name not in keys and field.name != "date" and (pa.types.is_floating(field.type) or pa.types.is_boolean(field.type))
+    ]
+    table = table.set_column(table.schema.get_field_index("time"), "time", pc.floor_temporal(table["time"], multiple=every_seconds, unit="second"))
+    # Booleans average to the share of the bucket they were true
+    for field in fields:
+        if pa.types.is_boolean(table.schema.field(field).type):
+            table = table.set_column(table.schema.get_field_index(field), field, table[field].cast(pa.float64()))
+    aggregations = [("time", "count")] + [(field, function) for field in fields for function in ("mean", "min", "max")]
+    return table.group_by(keys).aggregate(aggregations).sort_by([(key, "ascending") for key in keys])
+
+
+def compact(directory: str, before: str, compression: str = "zstd") -> int:
+    '''
+    Merges the files of every day before the given one into a single day.parquet per device.
+    The merged file replaces day.parquet before the parts are removed, an interrupted compaction
+    leaves duplicates rather than losing points.
+
+    Args:
+        directory (str): The archive directory (PARQUET_DIR)
+        before (str): First UTC day not compacted, YYYY-MM-DD, a day still written to must not be compacted
+        compression (str): Parquet compression of the merged files
+
+    Returns:
+        int: The files merged
+    '''
+    if pa is None:
+        raise ImportError("compacting the archive needs pyarrow, pip install pyarrow")
+    merged = 0
+    if not os.path.isdir(directory):
+        return merged
+    for measurement in sorted(os.listdir(directory)):
+        for day in sorted(os.listdir(os.path.join(directory, measurement))):
+            if not day.startswith("date=") or day[5:] >= before:
+                continue
+            day_directory = os.path.join(directory, measurement, day)
+            for device in sorted(os.listdir(day_directory)):
+                device_directory = os.path.join(day_directory, device)
+                paths = [
+                    os.path.join(device_directory, name) for name in sorted(os.listdir(device_directory))
+                    if name.endswith(".parquet") and not name.startswith(".")
+                ]
+                if len(paths) < 2:
+                    continue
+                table = pa.concat_tables([pq.ParquetFile(path).read() for path in paths], promote_options="permissive")
+                table = table.sort_by("time")
+                temporary_path = os.path.join(device_directory, ".day.parquet")
+                pq.write_table(table, temporary_path, compression=compression)
+                os.replace(temporary_path, os.path.join(device_directory, "day.parquet"))
+                for path in paths:
+                    if os.path.basename(path) != "day.parquet":
+                        os.remove(path)
+                merged += len(paths)
+    return merged
+
+
+def export(table: "pa.Table", output: str = "") -> None:
+    '''
+    Writes a table as Parquet (a .parquet output), as CSV to the output file, or as CSV to stdout without one.
+    '''
+    if output.endswith(".parquet"):
+        pq.write_table(table, output, compression="zstd")
+    else:
+        csv.write_csv(table, output or sys.stdout.buffer)
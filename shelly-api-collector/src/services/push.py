@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+import websockets
+from services.poller import Poller
+
+
+
+'''
+Push ingestion from Gen2 device WebSocket notifications.
+Keeps one persistent WebSocket per device on ws://<ip>/rpc. The first frame requests
+Shelly.GetStatus, which also subscribes the connection to notifications.
+NotifyStatus deltas are merged into the device's status document and NotifyFullStatus replaces it,
+then the device is handed to a callback for emission.
+A device only counts as connected once its full status arrived, the collector keeps polling it otherwise.
+'''
+
+
+
+def merge_status(status: dict, delta: dict) -> None:
+    '''
+    Merges a NotifyStatus delta into a status document in place.
+    Nested component dictionaries are merged key by key, everything else is replaced.
+
+    Args:
+        status (dict): The Shelly.GetStatus document
+        delta (dict): The changed components and fields
+    '''
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(status.get(key), dict):
+            merge_status(status[key], value)
+        else:
+            status[key] = value
+
+
+
+class PushIngestor:
+    # "src" of our requests, devices send their notifications to it
+    SOURCE = "shelly-api-collector"
+
+
+    def __init__(
+            self,
+            on_update,
+            poller: Poller,
+            connect_timeout: float = 2.0,
+            reconnect_seconds: float = 5.0,
+            max_reconnect_seconds: float = 60.0,
+            ping_interval: float = 20.0
+        ):
+        self.on_update = on_update
+        self.poller = poller
+        self.connect_timeout = connect_timeout
+        self.reconnect_seconds = reconnect_seconds
+        self.max_reconnect_seconds = max_reconnect_seconds
+        self.ping_interval = ping_interval
+        # Keys of the devices with a live socket and a full status
+        self.connected: set = set()
+        # Stats
+        self.notifications: int = 0
+        self.reconnects: int = 0
+        # Internal
+        self._devices: dict = {}
+        self._tasks: dict = {}
+        self._started: bool = False
+
+
+    def add(self, key: tuple, device, config: dict) -> None:
+        '''
+        Starts streaming a Gen2 device, or once start() is called when not running yet.
+        Other devices stay on the poll schedule.
+        '''
+        if not getattr(device, "supports_push", False):
+            return
+        self._devices[key] = device
+        if self._started:
+            self._tasks[key] = asyncio.create_task(self._run(key, device))
+
+
+    def remove(self, key: tuple) -> None:
+        self._devices.pop(key, None)
+        self.connected.discard(key)
+        task = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+
+    def is_streaming(self, key: tuple) -> bool:
+        return key in self.connected
+
+
+    def start(self) -> None:
+        '''
+        Opens the sockets of the added devices. Must run on the event loop.
+        '''
+        self._started = True
+        for key, device in self._devices.items():
+            self._tasks[key] = asyncio.create_task(self._run(key, device))
+
+
+    def _apply(self, device, params: dict, replace: bool) -> bool:
+        '''
+        Applies a status or delta to the device. Runs on the poller's worker pool,
+        as a config or /shelly info change makes the device fetch them.
+
+        Returns:
+            bool: True if applied, False if there is no status to merge the delta into yet
+        '''
+        timestamp = params.get("ts")
+        params = {key: value for key, value in params.items() if key != "ts"}
+        if replace:
+            status = params
+        elif device.status is None:
+            return False
+        else:
+            status = device.status
+            merge_status(status, params)
+        device.apply_status(status)
+        device.polled_at = int(timestamp * 1e9) if timestamp else time.time_ns()
+        return True
+
+
+    async def _handle(self, key: tuple, device, frame: dict) -> None:
+        method = frame.get("method")
+        if frame.get("id") == 1 and "result" in frame:
+            applied = await self.poller.call(self._apply, device, frame["result"], True)
+            self.connected.add(key)
+        elif method == "NotifyFullStatus":
+            applied = await self.poller.call(self._apply, device, frame["params"], True)
+        elif method == "NotifyStatus" and key in self.connected:
+            applied = await self.poller.call(self._apply, device, frame["params"], False)
+        else:
+            return
+        if applied:
+            self.notifications += 1
+            self.on_update(device)
+
+
+    async def _run(self, key: tuple, device) -> None:
+        '''
+        Keeps the device's socket open, reconnecting with exponential backoff.
+        '''
+        url = f"ws://{device.ip_address}/rpc"
+        backoff = self.reconnect_seconds
+        while True:
+            try:
+                async with websockets.connect(url, open_timeout=self.connect_timeout, ping_interval=self.ping_interval) as socket:
+                    await socket.send(json.dumps({"id": 1, "src": self.SOURCE, "method": "Shelly.GetStatus"}))
+                    async for message in socket:
+                        await self._handle(key, device, json.loads(message))
+                        backoff = self.reconnect_seconds
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket error for {device.model} at {device.ip_address}, polling until reconnected: {e}")
+            finally:
+                self.connected.discard(key)
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_reconnect_seconds)
+
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.connected)}/{len(self._devices)} devices streaming, "
+            f"{self.notifications} notifications, {self.reconnects} reconnects"
+        )
+
+
+    def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self.connected.clear()
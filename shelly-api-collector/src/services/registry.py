@@ -0,0 +1,154 @@
+import functools
+from devices.shelly3em import Shelly3EM
+from devices.gen2 import ShellyGen2
+from services.infocache import StaticInfoCache
+from services.transport import Transport
+
+
+
+'''
+Long-lived device registry for the collector.
+Each device in devices.json is built once and kept between cycles,
+along with its static /shelly identity cache.
+Gen2 models are built from their compiled model spec (services.modelspec).
+'''
+
+
+
+class DeviceRegistry:
+    MODEL_FACTORIES = {
+        "shelly3em": Shelly3EM
+    }
+
+
+    def __init__(self, transport: Transport, info_ttl_seconds: float = 3600, specs: dict = None):
+        self.transport = transport
+        self.info_ttl_seconds = info_ttl_seconds
+        self.factories = dict(self.MODEL_FACTORIES)
+        for model, spec in (specs or {}).items():
+            self.factories[model] = functools.partial(ShellyGen2, spec=spec)
+        self._devices: dict = {}
+        self._configs: dict = {}
+
+
+    @staticmethod
+    def key(device: dict) -> tuple:
+        return (device.get("model"), device.get("ip"))
+
+
+    @staticmethod
+    def key_of(device_class) -> tuple:
+        return (device_class.model, device_class.ip_address)
+
+
+    def get_config(self, key: tuple) -> dict:
+        '''
+        The devices.json entry a device class was built from.
+        '''
+        return self._configs.get(key, {})
+
+
+    def get_device(self, key: tuple):
+        return self._devices.get(key)
+
+
+    @property
+    def devices(self) -> list:
+        return list(self._devices.values())
+
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+
+    def create_device(self, device: dict):
+        '''
+        Creates the device class for an entry in devices.json.
+
+        Args:
+            device (dict): The device entry with its IP, model and name
+
+        Returns:
+            Shelly3EM | ShellyGen2 | None: The device class, None if the model is unknown
+        '''
+        factory = self.factories.get(device.get("model"))
+        if not factory or not device.get("ip"):
+            print(f"Skipping unknown model {device.get('model')} at {device.get('ip')}")
+            return None
+        return factory(
+            device["ip"],
+            device.get("name"),
+            info_cache=StaticInfoCache(self.info_ttl_seconds),
+            transport=self.transport
+        )
+
+
+    def diff(self, devices: list) -> tuple[list, list, list]:
+        '''
+        Compares a devices list with the registered devices without changing anything.
+        O(devices), but safe to run off the event loop, so a reload of a large
+        devices.json only costs the changed devices on the loop (see apply()).
+
+        Args:
+            devices (list): The devices loaded from devices.json
+
+        Returns:
+            tuple[list, list, list]: The added entries, the removed keys and the changed entries
+        '''
+        configs = self._configs
+        wanted = {(device.get("model"), device.get("ip")): device for device in devices}
+        added = [device for key, device in wanted.items() if key not in configs]
+        removed = [key for key in configs if key not in wanted]
+        updated = [device for key, device in wanted.items() if configs.get(key, device) != device]
+        return added, removed, updated
+
+
+    def apply(self, changes: tuple[list, list, list]) -> tuple[list, list, list]:
+        '''
+        Applies the changes found by diff().
+        Unchanged devices keep their instance, cached state and connections.
+        A changed entry (e.g. a new name or interval) keeps its instance too, a new
+        name is written once the /shelly info was fetched again.
+
+        Args:
+            changes (tuple[list, list, list]): The added entries, removed keys and changed entries
+
+        Returns:
+            tuple[list, list, list]: The added and removed device classes,
+                (device class, previous entry) of the changed entries
+        '''
+        added_devices, removed_keys, updated_devices = changes
+        removed = []
+        for key in removed_keys:
+            device_class = self._devices.pop(key, None)
+            self._configs.pop(key, None)
+            if device_class:
+                self.transport.close_host(device_class.ip_address)
+                removed.append(device_class)
+        added = []
+        for device in added_devices:
+            device_class = self.create_device(device)
+            if device_class:
+                self._devices[self.key(device)] = device_class
+                self._configs[self.key(device)] = device
+                added.append(device_class)
+        updated = []
+        for device in updated_devices:
+            key = self.key(device)
+            device_class = self._devices.get(key)
+            if not device_class:
+                continue
+            previous = self._configs[key]
+            self._configs[key] = device
+            if previous.get("name") != device.get("name"):
+                device_class.name = device.get("name")
+                device_class.info_cache.invalidate()
+            updated.append((device_class, previous))
+        return added, removed, updated
+
+
+    def sync(self, devices: list) -> tuple[list, list, list]:
+        '''
+        Updates the registry to match the devices list, see diff() and apply().
+        '''
+        return self.apply(self.diff(devices))
@@ -0,0 +1,175 @@
+import math
+import re
+import struct
+import time
+import requests
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+
+
+'''
+Prometheus remote write sink.
+Every numeric field of a point becomes one sample of the series "<measurement>_<field>",
+labelled with the point's tags, e.g. shelly3em_power{component="emeter",index="0",mac="..."}.
+Booleans are written as 0/1, text fields are skipped.
+The WriteRequest protobuf is encoded by hand: a point encodes to its TimeSeries entries, and
+a batch is the concatenation of its points' entries, so points are encoded once whatever the batching.
+The body is snappy compressed with python-snappy when installed, otherwise as literal-only
+snappy blocks (valid for every decoder, just not smaller).
+'''
+
+
+
+CONTENT_HEADERS = {
+    "Content-Type": "application/x-protobuf",
+    "Content-Encoding": "snappy",
+    "X-Prometheus-Remote-Write-Version": "0.1.0"
+}
+_INVALID_METRIC = re.compile(r"[^a-zA-Z0-9_:]")
+_INVALID_LABEL = re.compile(r"[^a-zA-Z0-9_]")
+_DOUBLE = struct.Struct("<d")
+# (measurement, tags) -> {field: (sample size, encoded entry header and labels)}, the same series come back every cycle
+_LABELS: dict[tuple, dict[str, tuple[int, bytes]]] = {}
+_MAX_SERIES = 100000
+
+
+def varint(value: int) -> bytes:
+    data = bytearray()
+    while value > 0x7F:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def _length_delimited(field_tag: int, data: bytes) -> bytes:
+    return bytes((field_tag,)) + varint(len(data)) + data
+
+
+def sanitize(name: str, pattern: re.Pattern) -> str:
+    name = pattern.sub("_", name)
+    return "_" + name if not name or name[0].isdigit() else name
+
+
+def encode_labels(labels: dict) -> bytes:
+    '''
+    Encodes the Label messages of a TimeSeries (field 1), sorted by name as the receivers require.
+    '''
+    encoded = b""
+    for name, value in sorted(labels.items()):
+        label = _length_delimited(0x0A, name.encode()) + _length_delimited(0x12, value.encode())
+        encoded += _length_delimited(0x0A, label)
+    return encoded
+
+
+def _series_labels(measurement: str, tags: dict, field: str) -> bytes:
+    names = {sanitize(str(name), _INVALID_LABEL): str(value) for name, value in tags.items()}
+    names["__name__"] = sanitize(f"{measurement}_{field}", _INVALID_METRIC)
+    return encode_labels(names)
+
+
+def encode_point(point: tuple) -> bytes:
+    '''
+    Encodes a point as WriteRequest.timeseries entries (field 1), one TimeSeries per numeric field.
+
+    Args:
+        point (tuple): (measurement, tags, fields, timestamp in nanoseconds or None)
+
+    Returns:
+        bytes: The entries, empty without numeric fields
+    '''
+    measurement, tags, fields, timestamp = point
+    key = (measurement, tuple(tags.items()))
+    cached = _LABELS.get(key)
+    if cached is None:
+        if len(_LABELS) >= _MAX_SERIES:
+            _LABELS.clear()
+        cached = _LABELS[key] = {}
+    milliseconds = varint((timestamp if timestamp is not None else time.time_ns()) // 1_000_000)
+    # TimeSeries.samples (field 2): value (double, field 1) and timestamp (int64, field 2)
+    sample_head = b"\x12" + bytes((10 + len(milliseconds),)) + b"\x09"
+    sample_tail = b"\x10" + milliseconds
+    sample_size = 12 + len(milliseconds)
+    pack = _DOUBLE.pack
+    parts = []
+    for field, value in fields.items():
+        if isinstance(value, str) or value is None:
+            continue
+        value = float(value)
+        if not math.isfinite(value):
+            continue
+        # The entry header and labels of the series, until the sample size changes
+        entry = cached.get(field)
+        if entry is None or entry[0] != sample_size:
+            labels = _series_labels(measurement, tags, field)
+            entry = cached[field] = (sample_size, b"\x0a" + varint(len(labels) + sample_size) + labels)
+        parts += (entry[1], sample_head, pack(value), sample_tail)
+    return b"".join(parts)
+
+
+def snappy_literal(data: bytes) -> bytes:
+    '''
+    Snappy block format made only of literals: the uncompressed length then 64 KiB literal chunks.
+
+    Args:
+        data (bytes): The data
+
+    Returns:
+        bytes: A valid snappy block of data
+    '''
+    block = bytearray(varint(len(data)))
+    for start in range(0, len(data), 65536):
+        chunk = data[start:start + 65536]
+        size = len(chunk) - 1
+        if size < 60:
+            block.append(size << 2)
+        elif size < 256:
+            block += bytes((60 << 2, size))
+        else:
+            block += bytes((61 << 2,)) + size.to_bytes(2, "little")
+        block += chunk
+    return bytes(block)
+
+
+def compress(data: bytes) -> bytes:
+    return snappy.compress(data) if snappy else snappy_literal(data)
+
+
+
+class RemoteWriteSink:
+    encoding = "remote_write"
+    encode = staticmethod(encode_point)
+
+
+    def __init__(self, url: str, token: str = "", timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(CONTENT_HEADERS)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+
+    def write(self, records: list) -> None:
+        '''
+        Sends one WriteRequest with the encoded points.
+
+        Args:
+            records (list): Points encoded by encode_point()
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails or is rejected
+        '''
+        body = b"".join(records)
+        if not body:
+            return
+        response = self.session.post(self.url, data=compress(body), timeout=self.timeout)
+        response.raise_for_status()
+
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,142 @@
+import heapq
+import time
+import zlib
+
+
+
+'''
+Fixed-rate heap scheduler for device polls.
+Every device has its own interval and a phase offset within it, so polls are
+spread across the period instead of hitting the whole fleet in one burst.
+The next deadline is computed from the previous deadline, not from when the
+poll ran, so the period does not drift. Deadlines that could not be met are
+counted as missed and skipped instead of piling up.
+'''
+
+
+
+class ScheduleEntry:
+    __slots__ = ("key", "device", "interval", "phase", "due", "in_flight", "missed", "removed")
+
+
+    def __init__(self, key, device, interval: float, phase: float, due: float):
+        self.key = key
+        self.device = device
+        self.interval = interval
+        self.phase = phase
+        self.due = due
+        self.in_flight: bool = False
+        self.missed: int = 0
+        self.removed: bool = False
+
+
+    def __lt__(self, other: "ScheduleEntry") -> bool:
+        return self.due < other.due
+
+
+
+class Scheduler:
+    def __init__(self, default_interval: float = 10.0):
+        self.default_interval = default_interval
+        self._heap: list[ScheduleEntry] = []
+        self._entries: dict = {}
+        # Stats
+        self.missed: int = 0
+        self.max_lateness: float = 0.0
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    @staticmethod
+    def stable_phase(key, interval: float) -> float:
+        '''
+        Phase offset from a stable hash of the key, so the same device keeps
+        its slot across restarts and the fleet spreads evenly over the interval.
+        '''
+        return (zlib.crc32(repr(key).encode()) / 0xFFFFFFFF) * interval
+
+
+    def add(self, key, device, interval: float = None, phase: float = None) -> ScheduleEntry:
+        '''
+        Schedules a device on its fixed-rate grid.
+
+        Args:
+            key (Any): Unique key of the device
+            device (Any): The device (returned with the entry when due)
+            interval (float): Seconds between polls, defaults to default_interval
+            phase (float): Offset within the interval, defaults to a stable hash of the key
+
+        Returns:
+            ScheduleEntry: The scheduled entry
+        '''
+        self.remove(key)
+        interval = interval or self.default_interval
+        phase = (self.stable_phase(key, interval) if phase is None else phase) % interval
+        now = time.monotonic()
+        due = (now // interval) * interval + phase
+        if due < now:
+            due += interval
+        entry = ScheduleEntry(key, device, interval, phase, due)
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        return entry
+
+
+    def remove(self, key) -> None:
+        '''
+        Unschedules a device. The heap entry is discarded lazily when it comes due.
+        '''
+        entry = self._entries.pop(key, None)
+        if entry:
+            entry.removed = True
+
+
+    def next_due(self) -> float | None:
+        while self._heap and self._heap[0].removed:
+            heapq.heappop(self._heap)
+        return self._heap[0].due if self._heap else None
+
+
+    def pop_due(self, now: float = None) -> list[ScheduleEntry]:
+        '''
+        Pops every entry whose deadline has passed and reschedules it for its
+        next slot. Slots that already passed while waiting count as missed.
+
+        Args:
+            now (float): The monotonic time, defaults to now
+
+        Returns:
+            list[ScheduleEntry]: The due entries
+        '''
+        now = time.monotonic() if now is None else now
+        due = []
+        while self._heap and self._heap[0].due <= now:
+            entry = heapq.heappop(self._heap)
+            if entry.removed:
+                continue
+            lateness = now - entry.due
+            self.max_lateness = max(self.max_lateness, lateness)
+            skipped = int(lateness // entry.interval)
+            if skipped:
+                entry.missed += skipped
+                self.missed += skipped
+            entry.due += (skipped + 1) * entry.interval
+            heapq.heappush(self._heap, entry)
+            due.append(entry)
+        return due
+
+
+    def mark_missed(self, entry: ScheduleEntry) -> None:
+        '''
+        Counts a deadline missed because the previous poll is still running.
+        '''
+        entry.missed += 1
+        self.missed += 1
+
+
+    def reset_stats(self) -> None:
+        # Per report interval, every entry keeps its own total
+        self.missed = 0
+        self.max_lateness = 0.0
@@ -0,0 +1,36 @@
+import zlib
+
+
+
+'''
+Stable sharding of devices.json across worker processes.
+A device's shard only depends on its MAC (or IP when devices.json has no MAC)
+and the number of shards, so it stays on the same worker across restarts and
+adding or removing a device does not move any other device.
+'''
+
+
+
+def shard_key(device: dict) -> str:
+    return (device.get("mac") or device.get("ip") or "").lower()
+
+
+def shard_of(device: dict, shards: int) -> int:
+    return zlib.crc32(shard_key(device).encode()) % shards
+
+
+def split(devices: list, shards: int) -> list[list]:
+    '''
+    Splits the devices into shards.
+
+    Args:
+        devices (list): The devices from devices.json
+        shards (int): The number of shards
+
+    Returns:
+        list[list]: The devices of every shard
+    '''
+    result = [[] for _ in range(shards)]
+    for device in devices:
+        result[shard_of(device, shards)].append(device)
+    return result
@@ -0,0 +1,236 @@
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+
+
+
+'''
+Disk-backed write-ahead spool for points that could not be written to the sink.
+Points are appended to gzip compressed NDJSON segment files, fsynced on a schedule,
+and replayed oldest first in large batches once the sink is back.
+The total size on disk is capped by deleting the oldest segments.
+Memory use does not depend on how much is spooled.
+'''
+
+
+
+class Spool:
+    SEGMENT_PREFIX = "segment-"
+    SEGMENT_SUFFIX = ".ndjson.gz"
+
+
+    def __init__(
+            self,
+            directory: str,
+            segment_bytes: int = 16 * 1024 * 1024,
+            max_bytes: int = 1024 * 1024 * 1024,
+            fsync_interval: float = 1.0
+        ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        # 0 fsyncs on every append
+        self.fsync_interval = fsync_interval
+        # Stats
+        self.appended: int = 0
+        self.replayed: int = 0
+        self.discarded_segments: int = 0
+        # Internal
+        self._lock = threading.Lock()
+        self._segments: deque = deque()
+        self._sizes: dict[str, int] = {}
+        self._sequence: int = 0
+        self._raw = None
+        self._gzip = None
+        self._active: str = None
+        self._last_fsync: float = 0.0
+        # Replay position: the open oldest segment, read on across replay() calls,
+        # and its batch that failed to write, retried as is
+        self._reader: tuple = None
+        self._unwritten: tuple = None
+        os.makedirs(directory, exist_ok=True)
+        self._load_segments()
+
+
+    def _load_segments(self) -> None:
+        '''
+        Picks up segments left by a previous run so they get replayed.
+        '''
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX)
+        )
+        for name in names:
+            path = os.path.join(self.directory, name)
+            self._segments.append(path)
+            self._sizes[path] = os.path.getsize(path)
+            self._sequence = max(self._sequence, int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]))
+
+
+    @property
+    def size(self) -> int:
+        return sum(self._sizes.values())
+
+
+    @property
+    def has_data(self) -> bool:
+        return bool(self._segments)
+
+
+    def append(self, records: list) -> None:
+        '''
+        Appends records to the active segment.
+
+        Args:
+            records (list): JSON serializable records (point dictionaries or line protocol strings)
+
+        Raises:
+            OSError: If the records cannot be written to disk
+        '''
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+        with self._lock:
+            if self._gzip is None:
+                self._open_segment()
+            self._gzip.write(data)
+            self.appended += len(records)
+            if self.fsync_interval <= 0 or (time.monotonic() - self._last_fsync) >= self.fsync_interval:
+                self._sync()
+            if self._raw.tell() >= self.segment_bytes:
+                self._close_segment()
+            self._enforce_cap()
+
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        self._active = os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{self._sequence:012d}{self.SEGMENT_SUFFIX}")
+        self._raw = open(self._active, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._segments.append(self._active)
+        self._sizes[self._active] = 0
+
+
+    def _sync(self) -> None:
+        # A sync flush makes everything written so far readable after a crash
+        self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._sizes[self._active] = self._raw.tell()
+        self._last_fsync = time.monotonic()
+
+
+    def _close_segment(self) -> None:
+        if self._gzip is None:
+            return
+        self._gzip.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._sizes[self._active] = self._raw.tell()
+        self._raw.close()
+        self._gzip = None
+        self._raw = None
+        self._active = None
+
+
+    def _enforce_cap(self) -> None:
+        '''
+        Deletes the oldest segments while the spool is over max_bytes.
+        '''
+        while self.size > self.max_bytes and len(self._segments) > 1:
+            path = self._segments.popleft()
+            self._sizes.pop(path, None)
+            self._close_reader(path)
+            os.remove(path)
+            self.discarded_segments += 1
+            print(f"Spool over {self.max_bytes} bytes, discarded {path}")
+
+
+    def _close_reader(self, path: str = None) -> None:
+        '''
+        Forgets the replay position, only if it is in path when given.
+        '''
+        if self._reader is None or (path is not None and self._reader[0] != path):
+            return
+        self._reader[1].close()
+        self._reader = None
+        self._unwritten = None
+
+
+    def _read_batch(self, batch_size: int) -> tuple[list, bool]:
+        '''
+        Reads the next records of the open segment. A segment cut short by a crash
+        is read up to the last complete record.
+
+        Returns:
+            tuple[list, bool]: Up to batch_size records, True once the segment is read to its end
+        '''
+        path, file = self._reader
+        batch = []
+        try:
+            for line in file:
+                if not line.endswith("\n"):
+                    break
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    return batch, False
+        except (EOFError, gzip.BadGzipFile, zlib.error, json.JSONDecodeError) as e:
+            print(f"Spool segment {path} is truncated, replayed up to the damage: {e}")
+        return batch, True
+
+
+    def replay(self, write, batch_size: int = 5000, max_batches: int = 10) -> int:
+        '''
+        Replays spooled records oldest first. Fully replayed segments are deleted.
+        Stops at the first failed write so the records stay on disk.
+        The oldest segment stays open between calls, every record is decompressed and decoded once.
+
+        Args:
+            write (Callable[[list], None]): Writes a batch, raises on failure
+            batch_size (int): Records per write
+            max_batches (int): Maximum writes per call, so live points are not starved
+
+        Returns:
+            int: The number of records replayed
+
+        Raises:
+            Exception: Any error from write
+        '''
+        replayed = 0
+        batches = 0
+        while batches < max_batches:
+            with self._lock:
+                if not self._segments:
+                    break
+                # Seal the active segment so it can be read
+                if self._segments[0] == self._active:
+                    self._close_segment()
+                path = self._segments[0]
+                if self._reader is None or self._reader[0] != path:
+                    self._close_reader()
+                    self._reader = (path, gzip.open(path, "rt"))
+            if self._unwritten is None:
+                self._unwritten = self._read_batch(batch_size)
+            batch, finished = self._unwritten
+            if batch:
+                write(batch)
+                replayed += len(batch)
+                batches += 1
+            self._unwritten = None
+            if finished:
+                with self._lock:
+                    self._close_reader(path)
+                    if self._segments and self._segments[0] == path:
+                        self._segments.popleft()
+                        self._sizes.pop(path, None)
+                        os.remove(path)
+        self.replayed += replayed
+        return replayed
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_reader()
+            self._close_segment()
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote
+from services.history import History
+
+
+
+'''
+Local HTTP API serving the latest device state from the collector's cache, so dashboards
+and scripts read the collector instead of competing with it for the devices' few HTTP slots.
+A device's JSON document and its ETag are rendered once per reading, on the event loop.
+A request only looks up the stored bytes: any number of readers sends no device requests and
+serializes nothing. A request with a matching If-None-Match gets a 304 Not Modified.
+
+GET /devices                  Every device, joined from the stored documents once per change
+GET /devices/<model>/<ip>     One device
+GET /devices/<model>/<ip>/history?field=<field>[&seconds=<n>][&component=<series>&index=<n>]
+                              The latest value of a field, or with seconds its last, min, max and mean
+                              over the window, from the in-memory history (HISTORY_SECONDS)
+'''
+
+
+
+CONTENT_TYPE = "application/json"
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def matches(if_none_match: str, tag: str) -> bool:
+    # A list of tags, weak or strong, or "*"
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+
+class StateCache:
+    def __init__(self):
+        # Device key -> (body, ETag), replaced whole so a reader never sees a half updated document
+        self._documents: dict = {}
+        # Bumped on every change, the /devices document is rebuilt when it moved
+        self._generation: int = 0
+        self._index: tuple = (0, b"[]", etag(b"[]"))
+        self._lock = threading.Lock()
+
+
+    def update(self, device, health: str = None) -> None:
+        '''
+        Renders the document of a polled or streamed device, or of a failed poll with its last reading.
+
+        Args:
+            device (Shelly3EM | ShellyGen2): The device with its latest reading
+            health (str): The circuit breaker state of the device
+        '''
+        series = device.series() if device.polled_at is not None else []
+        document = {
+            "model": device.model,
+            "ip": device.ip_address,
+            "name": device.name,
+            "time": device.polled_at,
+            "health": health,
+            "info": device.info_cache.info,
+            "series": [{"component": component, "index": index, "fields": fields} for component, index, fields in series]
+        }
+        body = json.dumps(document, separators=(",", ":"), default=str).encode()
+        self._documents[device.key] = (body, etag(body))
+        self._generation += 1
+
+
+    def summary(self) -> str:
+        return f"{len(self._documents)} devices served"
+
+
+    def remove(self, key) -> None:
+        if self._documents.pop(key, None) is not None:
+            self._generation += 1
+
+
+    def get(self, key) -> tuple[bytes, str] | None:
+        return self._documents.get(key)
+
+
+    def index(self) -> tuple[bytes, str]:
+        '''
+        The /devices document, rebuilt at most once per change however many readers ask for it.
+        The device bodies are joined as they are and the ETag derives from theirs, nothing is re-encoded.
+
+        Returns:
+            tuple[bytes, str]: The body and its ETag
+        '''
+        generation = self._generation
+        if self._index[0] == generation:
+            return self._index[1], self._index[2]
+        with self._lock:
+            if self._index[0] != generation:
+                # Copied, the event loop updates the documents while this runs
+                documents = list(self._documents.values())
+                body = b"[" + b",".join(document[0] for document in documents) + b"]"
+                tag = etag("".join(document[1] for document in documents).encode())
+                self._index = (generation, body, tag)
+            return self._index[1], self._index[2]
+
+
+
+class StateHandler(BaseHTTPRequestHandler):
+    state: StateCache = None
+    history: History = None
+    # Keep-alive, a dashboard polling the API reuses its connection
+    protocol_version = "HTTP/1.1"
+
+
+    def do_GET(self) -> None:
+        path, _, query = self.path.partition("?")
+        parts = [unquote(part) for part in path.rstrip("/").split("/")]
+        if len(parts) == 5 and parts[1] == "devices" and parts[4] == "history":
+            self.send_history((parts[2], parts[3]), parse_qs(query))
+            return
+        if parts == ["", "devices"]:
+            document = self.state.index()
+        else:
+            document = self.state.get((parts[2], parts[3])) if len(parts) == 4 and parts[1] == "devices" else None
+        if document is None:
+            self.send_error(404)
+            return
+        body, tag = document
+        if matches(self.headers.get("If-None-Match", ""), tag):
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        self.send_body(body, tag)
+
+
+    def send_history(self, key: tuple, query: dict) -> None:
+        '''
+        Answers a history query, rendered per request since the history changes with every reading.
+
+        Args:
+            key (tuple): The device key (model, ip)
+            query (dict): The parsed query string, field is required
+        '''
+        if self.history is None:
+            self.send_error(404, "History disabled, set HISTORY_SECONDS")
+            return
+        field = query.get("field", [""])[0]
+        component = query.get("component", ["device"])[0]
+        try:
+            index = int(query["index"][0]) if "index" in query else None
+            seconds = float(query["seconds"][0]) if "seconds" in query else None
+        except ValueError:
+            self.send_error(400, "index and seconds must be numbers")
+            return
+        if not field or (seconds is not None and seconds <= 0):
+            self.send_error(400, "Set field, and seconds above 0")
+            return
+        document = {"model": key[0], "ip": key[1], "component": component, "index": index, "field": field}
+        if seconds is None:
+            last = self.history.last(key, component, index, field)
+            if last is None:
+                self.send_error(404)
+                return
+            document.update(time=last[0], value=last[1])
+        else:
+            aggregates = self.history.aggregate(key, component, index, field, seconds)
+            if aggregates is None:
+                self.send_error(404)
+                return
+            document.update(seconds=seconds, **aggregates)
+        body = json.dumps(document, separators=(",", ":")).encode()
+        self.send_body(body, etag(body))
+
+
+    def send_body(self, body: bytes, tag: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", tag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+
+class StateServer:
+    def __init__(self, state: StateCache, host: str = "0.0.0.0", port: int = 8080, history: History = None):
+        handler = type("Handler", (StateHandler,), {"state": state, "history": history})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="state", daemon=True)
+
+
+    def start(self) -> None:
+        self._thread.start()
+        print(f"Serving the device state on http://{self.server.server_address[0]}:{self.server.server_address[1]}/devices")
+
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
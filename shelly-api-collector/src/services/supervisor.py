@@ -0,0 +1,255 @@
+import asyncio
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from services.collector import Collector
+from services.devicesfile import DevicesFile
+from services.metrics import Metrics, MetricsServer
+from services.shards import split
+from services.writer import BatchWriter
+
+
+
+'''
+Multi-process collector for large fleets.
+devices.json is split across worker processes by a stable hash (see services.shards).
+Every worker runs its own collector on its shard and sends the serialized batches
+over a queue to the supervisor, where the single shared writer writes them.
+The supervisor restarts crashed workers and sends the new shards to the workers
+when devices.json changes, which only moves the added and removed devices.
+'''
+
+
+
+class QueueWriter:
+    '''
+    Stands in for the BatchWriter inside a worker, sending batches to the supervisor.
+    '''
+    def __init__(self, points: multiprocessing.Queue):
+        self.points = points
+        self.sent: int = 0
+        self.dropped: int = 0
+
+
+    def submit(self, points: list) -> bool:
+        try:
+            # Copied, the collector reuses its line buffer
+            self.points.put_nowait(list(points))
+        except queue.Full:
+            self.dropped += len(points)
+            return False
+        self.sent += len(points)
+        return True
+
+
+    def summary(self) -> str:
+        return f"{self.sent} points sent to the supervisor, {self.dropped} dropped"
+
+
+async def _run_worker(collector: Collector, control: multiprocessing.Queue) -> None:
+    '''
+    Runs the collector and applies the shards sent by the supervisor until told to stop.
+
+    Raises:
+        RuntimeError: If the collector stopped on its own, e.g. its run loop raised
+    '''
+    loop = asyncio.get_running_loop()
+    shards: asyncio.Queue = asyncio.Queue()
+
+    def read_control() -> None:
+        # A daemon thread, a worker exiting on a collector failure does not wait for the blocking read
+        while True:
+            devices = control.get()
+            loop.call_soon_threadsafe(shards.put_nowait, devices)
+            if devices is None:
+                return
+
+    threading.Thread(target=read_control, name="control", daemon=True).start()
+    task = asyncio.create_task(collector.run())
+    try:
+        while True:
+            shard = asyncio.create_task(shards.get())
+            await asyncio.wait((task, shard), return_when=asyncio.FIRST_COMPLETED)
+            if task.done():
+                shard.cancel()
+                # Re-raises the collector's exception
+                task.result()
+                raise RuntimeError("the collector stopped")
+            devices = shard.result()
+            if devices is None:
+                break
+            collector.load(devices)
+    finally:
+        task.cancel()
+
+
+def run_worker(index: int, devices: list, settings: dict, points: multiprocessing.Queue, control: multiprocessing.Queue) -> None:
+    '''
+    Worker process entrypoint, collects a shard until told to stop.
+
+    Args:
+        index (int): The worker/shard number
+        devices (list): The devices of the shard
+        settings (dict): The collector settings
+        points (multiprocessing.Queue): Serialized batches to the supervisor
+        control (multiprocessing.Queue): New shard device lists from the supervisor, None to stop
+    '''
+    print(f"Worker {index} collecting {len(devices)} devices.")
+    metrics = Metrics()
+    if settings["metrics_port"]:
+        # The supervisor serves the writer metrics on METRICS_PORT, the workers on the following ports
+        MetricsServer(metrics, settings["metrics_bind"], settings["metrics_port"] + 1 + index).start()
+    if settings["state_port"]:
+        # Every worker serves the state of its own shard, on STATE_PORT + the worker number
+        settings = {**settings, "state_port": settings["state_port"] + index}
+    collector = Collector(settings, QueueWriter(points), metrics)
+    collector.load(devices)
+    try:
+        asyncio.run(_run_worker(collector, control))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        # A non-zero exit code, the supervisor restarts the worker
+        print(f"Worker {index} failed: {type(e).__name__}: {e}")
+        sys.exit(1)
+
+
+
+class Worker:
+    def __init__(self, index: int, devices: list):
+        self.index = index
+        self.devices = devices
+        self.process: multiprocessing.Process = None
+        self.control: multiprocessing.Queue = None
+        self.restarts: int = 0
+        self.restart_at: float = 0.0
+        self.started_at: float = 0.0
+
+
+
+class Supervisor:
+    def __init__(
+            self,
+            settings: dict,
+            devices_file: DevicesFile,
+            writer: BatchWriter,
+            workers: int,
+            max_pending_batches: int = 1000,
+            restart_backoff: float = 1.0,
+            max_restart_backoff: float = 60.0
+        ):
+        self.settings = settings
+        self.devices_file = devices_file
+        self.writer = writer
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        # Spawned, forking would copy the writer and client threads
+        self._context = multiprocessing.get_context("spawn")
+        self.points = self._context.Queue(max_pending_batches)
+        self.restarts: int = 0
+        self.workers = [Worker(index, []) for index in range(workers)]
+        self._forwarder = threading.Thread(target=self._forward, name="forwarder", daemon=True)
+        self._stopping = threading.Event()
+
+
+    def _forward(self) -> None:
+        '''
+        Hands the workers' batches to the shared writer.
+        '''
+        while not self._stopping.is_set():
+            try:
+                batch = self.points.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if not self.writer.submit(batch):
+                print(f"Writer queue full, dropped {len(batch)} points.")
+
+
+    def _start_worker(self, worker: Worker) -> None:
+        worker.control = self._context.Queue()
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(worker.index, worker.devices, self.settings, self.points, worker.control),
+            name=f"collector-{worker.index}",
+            daemon=True
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+
+
+    def _check_workers(self) -> None:
+        '''
+        Restarts crashed workers with exponential backoff.
+        '''
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process.is_alive():
+                # The backoff starts over once a worker stays up
+                if worker.restarts and now - worker.started_at > self.max_restart_backoff:
+                    worker.restarts = 0
+                continue
+            if worker.restart_at == 0.0:
+                backoff = min(self.restart_backoff * 2 ** worker.restarts, self.max_restart_backoff)
+                worker.restart_at = now + backoff
+                print(f"Worker {worker.index} exited with code {worker.process.exitcode}, restarting in {backoff:.0f} seconds.")
+            elif now >= worker.restart_at:
+                worker.restarts += 1
+                self.restarts += 1
+                worker.restart_at = 0.0
+                self._start_worker(worker)
+
+
+    def rebalance(self, devices: list) -> None:
+        '''
+        Sends the new shards to the workers whose devices changed.
+        '''
+        for worker, shard in zip(self.workers, split(devices, len(self.workers))):
+            if shard == worker.devices:
+                continue
+            worker.devices = shard
+            if worker.process and worker.process.is_alive():
+                worker.control.put(shard)
+        print(f"Rebalanced {len(devices)} devices over {len(self.workers)} workers: {', '.join(str(len(worker.devices)) for worker in self.workers)}.")
+
+
+    def run(self, devices: list) -> None:
+        '''
+        Starts the workers and supervises them until interrupted.
+
+        Args:
+            devices (list): The devices from devices.json
+        '''
+        for worker, shard in zip(self.workers, split(devices, len(self.workers))):
+            worker.devices = shard
+            self._start_worker(worker)
+        self._forwarder.start()
+        report_interval = self.settings["poll_interval_seconds"]
+        last_report = time.monotonic()
+        try:
+            while True:
+                time.sleep(1)
+                self._check_workers()
+                changed = self.devices_file.changed()
+                if changed is not None:
+                    self.rebalance(changed)
+                if time.monotonic() - last_report >= report_interval:
+                    last_report = time.monotonic()
+                    alive = sum(1 for worker in self.workers if worker.process.is_alive())
+                    print(f"Supervisor: {alive}/{len(self.workers)} workers alive, {self.restarts} restarts. Writer: {self.writer.summary()}")
+        finally:
+            self.close()
+
+
+    def close(self) -> None:
+        for worker in self.workers:
+            if worker.process and worker.process.is_alive():
+                worker.control.put(None)
+        for worker in self.workers:
+            if worker.process:
+                worker.process.join(5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+        self._stopping.set()
+        self._forwarder.join(2)
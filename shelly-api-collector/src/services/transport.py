@@ -0,0 +1,130 @@
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+
+
+'''
+Shared HTTP transport for device I/O.
+Keeps a keep-alive connection pool per device host and applies
+connect/read timeouts to every request so a hung device cannot stall a cycle.
+'''
+
+
+
+class Transport:
+    def __init__(self, connect_timeout: float = 2.0, read_timeout: float = 5.0, pool_maxsize: int = 2, metrics=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+        # Request latency and errors per device, optional
+        self.metrics = metrics
+        if metrics:
+            metrics.histogram("shelly_request_seconds", "Device request latency", ("device", "endpoint"))
+            metrics.counter("shelly_request_errors_total", "Failed device requests by error", ("device", "type"))
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+
+    def session(self, host: str) -> requests.Session:
+        '''
+        Gets the keep-alive session for a host, creating it on first use.
+
+        Args:
+            host (str): The device host (ip or ip:port)
+
+        Returns:
+            requests.Session: The session with its own connection pool
+        '''
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[host] = session
+        return session
+
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        '''
+        Sends a GET request over the host's pooled connection.
+
+        Args:
+            url (str): The full URL
+            **kwargs: Passed to requests.Session.get, the timeout defaults to the transport timeout
+
+        Returns:
+            requests.Response: The response
+        '''
+        kwargs.setdefault("timeout", self.timeout)
+        parts = urlsplit(url)
+        if not self.metrics:
+            return self.session(parts.netloc).get(url, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.session(parts.netloc).get(url, **kwargs)
+        except Exception as e:
+            self.metrics.inc("shelly_request_errors_total", (parts.netloc, type(e).__name__))
+            raise
+        self.metrics.observe("shelly_request_seconds", (parts.netloc, parts.path), time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.metrics.inc("shelly_request_errors_total", (parts.netloc, f"HTTP {response.status_code}"))
+        return response
+
+
+    def close_host(self, host: str) -> None:
+        '''
+        Closes and forgets the connection pool of a host, e.g. when a device is removed.
+        '''
+        with self._lock:
+            session = self._sessions.pop(host, None)
+        if session:
+            session.close()
+
+
+    def stats(self) -> dict:
+        '''
+        Connection reuse statistics per host.
+
+        Returns:
+            dict: {host: {"requests": int, "connections": int, "reused": int}}
+        '''
+        stats = {}
+        for host, session in list(self._sessions.items()):
+            # Read the pools requests created, looking one up by URL would create
+            # (and with pool_connections=1 evict the live one for) a pool with a different key
+            poolmanager = session.get_adapter(f"http://{host}").poolmanager
+            pools = [poolmanager.pools.get(key) for key in poolmanager.pools.keys()]
+            requests_count = sum(pool.num_requests for pool in pools if pool)
+            connections = sum(pool.num_connections for pool in pools if pool)
+            stats[host] = {
+                "requests": requests_count,
+                "connections": connections,
+                "reused": max(requests_count - connections, 0)
+            }
+        return stats
+
+
+    def summary(self) -> str:
+        '''
+        One line summary of the connection reuse over all hosts.
+        '''
+        stats = self.stats().values()
+        requests_count = sum(host["requests"] for host in stats)
+        connections = sum(host["connections"] for host in stats)
+        return f"{requests_count} HTTP requests over {connections} connections to {len(stats)} hosts"
+
+
+    def close(self) -> None:
+        for host in list(self._sessions):
+            self.close_host(host)
+
+
+
+# Default transport for device classes created without one
+DEFAULT_TRANSPORT = Transport()
@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import deque
+
+
+
+'''
+Background batched writer.
+Points are queued by the poll loop and written to the sink on a dedicated thread,
+flushed when a batch is full or the flush interval expires, and retried with
+exponential backoff. Polling never waits for the sink.
+With a spool, failed batches go to disk instead of being retried in memory,
+and are replayed once the sink accepts writes again.
+'''
+
+
+
+class BatchWriter:
+    def __init__(
+            self,
+            sink,
+            batch_size: int = 5000,
+            flush_interval: float = 1.0,
+            max_pending: int = 100000,
+            max_retries: int = 5,
+            retry_backoff: float = 1.0,
+            max_backoff: float = 30.0,
+            spool=None,
+            probe_interval: float = 5.0,
+            replay_batches: int = 10,
+            metrics=None,
+            name: str = "influx"
+        ):
+        self.sink = sink
+        # The sink label of the metrics and the thread name
+        self.name = name
+        self.spool = spool
+        self.probe_interval = probe_interval
+        self.replay_batches = replay_batches
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        # Stats
+        self.written: int = 0
+        self.dropped: int = 0
+        self.flushes: int = 0
+        self.last_flush_latency: float = 0.0
+        # Internal
+        self._pending: deque = deque()
+        self._condition = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"writer-{name}", daemon=True)
+        self._sink_down: bool = False
+        self._last_probe: float = 0.0
+        # Write latency and queue metrics, optional
+        self.metrics = metrics
+        if metrics:
+            metrics.histogram("collector_write_seconds", "Sink write latency per batch", ("sink",))
+            metrics.counter("collector_write_errors_total", "Failed sink writes by error", ("sink", "type"))
+            metrics.gauge("collector_writer_queue_depth", "Points queued for writing", lambda: {(name,): len(self._pending)}, ("sink",))
+            metrics.gauge("collector_points_written_total", "Points written to the sink", lambda: {(name,): self.written}, ("sink",), kind="counter")
+            metrics.gauge("collector_points_dropped_total", "Points dropped by the writer", lambda: {(name,): self.dropped}, ("sink",), kind="counter")
+            if spool:
+                metrics.gauge("collector_spool_bytes", "Size of the spool on disk", lambda: {(name,): self.spool.size}, ("sink",))
+
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+
+    def start(self) -> None:
+        self._thread.start()
+
+
+    def submit(self, points: list) -> bool:
+        '''
+        Queues points for writing without blocking.
+        The points are dropped if the queue is full.
+
+        Args:
+            points (list): The points to write
+
+        Returns:
+            bool: True if queued, False if dropped
+        '''
+        with self._condition:
+            if len(self._pending) + len(points) > self.max_pending:
+                self.dropped += len(points)
+                return False
+            self._pending.extend(points)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+
+    def _next_batch(self) -> list:
+        '''
+        Waits until a full batch is queued, the flush interval expires or the writer stops.
+
+        Returns:
+            list: Up to batch_size points, empty if nothing is queued
+        '''
+        deadline = time.monotonic() + self.flush_interval
+        with self._condition:
+            while len(self._pending) < self.batch_size and not self._stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            size = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(size)]
+
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                if self._sink_down:
+                    self._spill(batch)
+                else:
+                    self._flush(batch)
+            elif self._stopping.is_set():
+                return
+            else:
+                self._idle()
+            if self.spool and self.spool.has_data and not self._stopping.is_set():
+                self._replay()
+
+
+    def _idle(self) -> None:
+        '''
+        Lets a sink that buffers (e.g. parquet) write out what it holds when no points arrive.
+        '''
+        idle = getattr(self.sink, "idle", None)
+        if idle is None:
+            return
+        try:
+            idle()
+        except Exception as e:
+            print(f"Error writing the buffered points of {self.name}: {e}")
+
+
+    def _flush(self, batch: list) -> bool:
+        '''
+        Writes a batch to the sink, retrying with exponential backoff.
+        With a spool the batch is spooled on the first failure instead.
+
+        Args:
+            batch (list): The points to write
+
+        Returns:
+            bool: True if written, False if spooled or dropped
+        '''
+        delay = self.retry_backoff
+        # The spool takes over the retries
+        retries = 0 if self.spool else self.max_retries
+        for attempt in range(retries + 1):
+            start = time.monotonic()
+            try:
+                self.sink.write(batch)
+                self.last_flush_latency = time.monotonic() - start
+                if self.metrics:
+                    self.metrics.observe("collector_write_seconds", (self.name,), self.last_flush_latency)
+                self.flushes += 1
+                self.written += len(batch)
+                return True
+            except Exception as e:
+                print(f"Error writing {len(batch)} points to {self.name} (attempt {attempt + 1}): {e}")
+                if self.metrics:
+                    self.metrics.inc("collector_write_errors_total", (self.name, type(e).__name__))
+                if attempt == retries or self._stopping.is_set():
+                    break
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+        if self.spool:
+            self._sink_down = True
+            self._last_probe = time.monotonic()
+            self._spill(batch)
+        else:
+            self.dropped += len(batch)
+        return False
+
+
+    def _spill(self, batch: list) -> None:
+        try:
+            self.spool.append(batch)
+        except OSError as e:
+            print(f"Error spooling {len(batch)} points: {e}")
+            self.dropped += len(batch)
+
+
+    def _replay(self) -> None:
+        '''
+        Replays part of the spool. While the sink is down this doubles as
+        the probe, attempted once every probe_interval.
+        '''
+        if self._sink_down and (time.monotonic() - self._last_probe) < self.probe_interval:
+            return
+        self._last_probe = time.monotonic()
+        try:
+            replayed = self.spool.replay(self.sink.write, self.batch_size, self.replay_batches)
+            self.written += replayed
+            if self._sink_down:
+                print("Sink is back, replaying the spool.")
+            self._sink_down = False
+        except Exception as e:
+            self._sink_down = True
+            print(f"Sink still unavailable, keeping points spooled: {e}")
+
+
+    def summary(self) -> str:
+        summary = (
+            f"queue depth {self.queue_depth}, {self.written} written, {self.dropped} dropped, "
+            f"last flush {self.last_flush_latency * 1000:.1f} ms"
+        )
+        if self.spool:
+            summary += f", spool {self.spool.size} bytes"
+        return summary
+
+
+    def close(self, timeout: float = 10.0) -> None:
+        '''
+        Stops the writer after flushing what is queued (one attempt per batch).
+        '''
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify()
+        self._thread.join(timeout)
+        if self.spool:
+            self.spool.close()
@@ -1,13 +1,17 @@
 import json
 import re
+from services.modelspec import load_specs, DEFAULT_MODELS_DIR
+from services.registry import DeviceRegistry
 
 class FromJson:
-    VALID_MODELS = ["shelly4em"]
-    IP_REGEX = re.compile(r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$")
+    # Gen1 device classes and the Gen2 model specs
+    VALID_MODELS = [*DeviceRegistry.MODEL_FACTORIES, *load_specs([DEFAULT_MODELS_DIR])]
+    IP_REGEX = re.compile(r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}(?::[0-9]{1,5})?$")
     NAME_REGEX = re.compile(r"^[a-zA-Z0-9_\- ]+$")
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, valid_models=None):
         self.file_path = file_path
+        self.valid_models = valid_models or self.VALID_MODELS
         self.devices = self._load_devices()
         self.valid_devices = []
         self.invalid_devices = []
@@ -17,21 +21,24 @@ class FromJson:
             return json.load(file)
 
     def _is_valid_ip(self, ip):
-        return bool(self.IP_REGEX.match(ip))
+        return isinstance(ip, str) and bool(self.IP_REGEX.match(ip))
 
     def _is_valid_model(self, model):
-        return model in self.VALID_MODELS
+        return isinstance(model, str) and model in self.valid_models
 
     def _is_valid_name(self, name):
-        return bool(self.NAME_REGEX.match(name))
+        return isinstance(name, str) and bool(self.NAME_REGEX.match(name))
 
     def validate_devices(self):
 
         for device in self.devices:
+            if not isinstance(device, dict):
+                self.invalid_devices.append(device)
+                continue
             ip = device.get("ip")
             model = device.get("model")
             name = device.get("name")
             if self._is_valid_ip(ip) and self._is_valid_model(model) and self._is_valid_name(name):
                 self.valid_devices.append(device)
             else:
-                self.invalid_devices.append(device)
\ No newline at end of file
+                self.invalid_devices.append(device)
@@ -0,0 +1,76 @@
+import json
+import os
+from types import SimpleNamespace
+from services.coiot import CoiotListener, URI_PATH, STATUS_CODE, parse_coap, sensor_map
+
+
+
+'''
+CoIoT packet parsing, on a Shelly 3EM status packet and /cit/d description recorded from shelly-simulator.
+'''
+
+
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+
+def load_packet() -> bytes:
+    with open(os.path.join(PAYLOADS, "shelly3em_cit_s.hex"), "r") as file:
+        return bytes.fromhex(file.read().strip())
+
+
+def load_description() -> dict:
+    with open(os.path.join(PAYLOADS, "shelly3em_cit_d.json"), "r") as file:
+        return json.load(file)
+
+
+def test_parse_coap_status_packet():
+    code, options, payload = parse_coap(load_packet())
+    assert code == STATUS_CODE
+    assert options[URI_PATH] == [b"cit", b"s"]
+    # Option numbers above 268 use the two byte extended delta
+    assert options[3332] == [b"SHEM-3#C45BBE000000#2"]
+    assert options[3412] == [b"\x96\x00"]
+    assert options[3420] == [b"\x00\x11"]
+    values = json.loads(payload)["G"]
+    assert values[:2] == [[0, 9103, 0], [0, 1101, 1]]
+    assert len(values) == 20
+
+
+def test_parse_coap_malformed():
+    packet = load_packet()
+    assert parse_coap(packet[:3]) is None
+    # CoAP version 2
+    assert parse_coap(bytes([0x90]) + packet[1:]) is None
+    # Option delta nibble 15 is reserved
+    assert parse_coap(packet[:4] + b"\xf1x") is None
+    # A message without a payload marker has an empty payload
+    assert parse_coap(packet[:4] + b"\xb3cit") == (STATUS_CODE, {URI_PATH: [b"cit"]}, b"")
+
+
+def test_sensor_map():
+    sensors, config_sensor = sensor_map(load_description())
+    assert config_sensor == 9103
+    assert sensors[1101] == ("relays", 0, "ison")
+    assert sensors[4105] == ("emeters", 0, "power")
+    assert sensors[4206] == ("emeters", 1, "total")
+    assert sensors[4310] == ("emeters", 2, "pf")
+    assert 9103 not in sensors
+
+
+def test_apply_status_packet():
+    sensors, _ = sensor_map(load_description())
+    _, _, payload = parse_coap(load_packet())
+    values = json.loads(payload)["G"]
+    status = {
+        "relays": [{"ison": False}],
+        "emeters": [{"power": 0.0, "total": 0.0} for _ in range(3)],
+        "total_power": 0.0
+    }
+    device = SimpleNamespace(status=status)
+    CoiotListener(lambda device, components: None, poller=None).apply(device, sensors, values)
+    readings = {sensor: value for _, sensor, value in values}
+    assert status["relays"][0]["ison"] is True
+    assert status["emeters"][1]["power"] == readings[4205]
+    assert status["emeters"][2]["total"] == readings[4306]
+    assert status["total_power"] == round(readings[4105] + readings[4205] + readings[4305], 2)
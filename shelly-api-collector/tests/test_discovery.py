@@ -0,0 +1,73 @@
+import os
+import struct
+import pytest
+from services.discovery import MDNS_SERVICES, TYPE_A, TYPE_PTR, TYPE_SRV, decode_name, encode_query, parse_records, shelly_hosts
+
+
+
+'''
+mDNS parsing, on a Shelly Pro 1 PM service announcement (PTR, SRV, TXT and A records
+with name compression) encoded by dnspython.
+'''
+
+
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+INSTANCE = "shellypro1pm-30c6f7000001._shelly._tcp.local"
+HOST = "shellypro1pm-30c6f7000001.local"
+
+
+def load_response() -> bytes:
+    with open(os.path.join(PAYLOADS, "shellypro1pm_mdns.hex"), "r") as file:
+        return bytes.fromhex(file.read().strip())
+
+
+def test_parse_records():
+    records = parse_records(load_response())
+    assert [(name, record_type) for name, record_type, _ in records] == [
+        ("_shelly._tcp.local", TYPE_PTR),
+        (INSTANCE, TYPE_SRV),
+        (INSTANCE, 16),
+        (HOST, TYPE_A)
+    ]
+    values = {record_type: value for _, record_type, value in records}
+    assert values[TYPE_PTR] == INSTANCE
+    assert values[TYPE_SRV] == (HOST, 80)
+    assert values[TYPE_A] == "192.168.1.50"
+    # Other records keep their raw data, TXT strings are length prefixed
+    assert values[16] == b"\x05gen=2\x0aapp=Pro1PM\x09ver=1.4.4"
+
+
+def test_shelly_hosts():
+    records = parse_records(load_response())
+    assert shelly_hosts(records, "192.168.1.99") == {"192.168.1.50": 80}
+    # Without an A record the sender is the device
+    without_address = [record for record in records if record[1] != TYPE_A]
+    assert shelly_hosts(without_address, "192.168.1.99") == {"192.168.1.99": 80}
+    other = [("_http._tcp.local", TYPE_PTR, "printer._http._tcp.local")]
+    assert shelly_hosts(other, "192.168.1.99") == {}
+
+
+def test_encode_query():
+    query = encode_query(MDNS_SERVICES)
+    assert struct.unpack_from("!6H", query) == (0, 0, len(MDNS_SERVICES), 0, 0, 0)
+    offset = 12
+    for service in MDNS_SERVICES:
+        name, offset = decode_name(query, offset)
+        assert name == service
+        assert struct.unpack_from("!2H", query, offset) == (TYPE_PTR, 1)
+        offset += 4
+    assert offset == len(query)
+    assert parse_records(query) == []
+
+
+def test_decode_name_pointer_loop():
+    # A pointer to itself ends after the label limit instead of looping forever
+    message = bytes(12) + b"\xc0\x0c"
+    assert decode_name(message, 12) == ("", 14)
+
+
+def test_parse_records_truncated():
+    response = load_response()
+    with pytest.raises((struct.error, IndexError)):
+        parse_records(response[:len(response) // 2])
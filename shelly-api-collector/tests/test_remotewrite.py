@@ -0,0 +1,137 @@
+import os
+import struct
+import pytest
+from services.remotewrite import encode_point, snappy_literal, varint
+
+
+
+'''
+Remote write encoding, decoded with a protobuf wire format reader written from the
+specification (not from the encoder) and a literal-only snappy block reader.
+'''
+
+
+
+def read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_message(data: bytes) -> list[tuple[int, object]]:
+    '''
+    The (field number, value) pairs of a protobuf message: ints for varints, bytes otherwise.
+    '''
+    fields = []
+    offset = 0
+    while offset < len(data):
+        key, offset = read_varint(data, offset)
+        number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, offset = read_varint(data, offset)
+        elif wire_type == 1:
+            value, offset = data[offset:offset + 8], offset + 8
+        elif wire_type == 2:
+            length, offset = read_varint(data, offset)
+            value, offset = data[offset:offset + length], offset + length
+        else:
+            raise ValueError(f"unexpected wire type {wire_type}")
+        fields.append((number, value))
+    assert offset == len(data)
+    return fields
+
+
+def decode_write_request(data: bytes) -> list[tuple[dict, list]]:
+    '''
+    WriteRequest -> [(labels, [(value, timestamp ms)])] per TimeSeries.
+    '''
+    series = []
+    for number, timeseries in read_message(data):
+        assert number == 1
+        labels = {}
+        names = []
+        samples = []
+        for field, value in read_message(timeseries):
+            if field == 1:
+                label = dict(read_message(value))
+                labels[label[1].decode()] = label[2].decode()
+                names.append(label[1].decode())
+            elif field == 2:
+                sample = dict(read_message(value))
+                samples.append((struct.unpack("<d", sample[1])[0], sample[2]))
+        # Receivers require the labels sorted by name
+        assert names == sorted(names)
+        series.append((labels, samples))
+    return series
+
+
+def read_snappy_literal(block: bytes) -> bytes:
+    length, offset = read_varint(block, 0)
+    data = bytearray()
+    while offset < len(block):
+        tag = block[offset]
+        offset += 1
+        assert tag & 0x03 == 0, "only literals expected"
+        size = tag >> 2
+        if size >= 60:
+            extra = size - 59
+            size = int.from_bytes(block[offset:offset + extra], "little")
+            offset += extra
+        data += block[offset:offset + size + 1]
+        offset += size + 1
+    assert len(data) == length
+    return bytes(data)
+
+
+TAGS = {"component": "emeter", "index": "0", "mac": "C45BBE000001"}
+
+
+def test_encode_point():
+    fields = {"power": 123.5, "is_valid": True, "total": 2537178, "status": "ok", "pf": float("nan"), "current": None}
+    series = decode_write_request(encode_point(("shelly3em", TAGS, fields, 1_700_000_000_123_456_789)))
+    assert series == [
+        ({"__name__": "shelly3em_power", **TAGS}, [(123.5, 1_700_000_000_123)]),
+        ({"__name__": "shelly3em_is_valid", **TAGS}, [(1.0, 1_700_000_000_123)]),
+        ({"__name__": "shelly3em_total", **TAGS}, [(2537178.0, 1_700_000_000_123)])
+    ]
+
+
+def test_encode_point_cached_series():
+    # The series header is cached, a timestamp of another varint length changes the entry size
+    point = ("shellypro1pm", {"mac": "30C6F7000001"}, {"switch_0_apower": 12.25}, 1_700_000_000_000_000_000)
+    first = encode_point(point)
+    assert encode_point(point) == first
+    early = decode_write_request(encode_point((*point[:3], 1_000_000)))
+    assert early == [({"__name__": "shellypro1pm_switch_0_apower", "mac": "30C6F7000001"}, [(12.25, 1)])]
+
+
+def test_encode_point_sanitizes_names():
+    series = decode_write_request(encode_point(("shelly-3em", {"1st-tag": "x"}, {"a.b": 1.0}, 0)))
+    assert series == [({"__name__": "shelly_3em_a_b", "_1st_tag": "x"}, [(1.0, 0)])]
+
+
+def test_batch_is_one_write_request():
+    points = [("energy", {"channel": f"emeter_{index}"}, {"energy_wh": float(index)}, 60_000_000_000) for index in range(3)]
+    series = decode_write_request(b"".join(encode_point(point) for point in points))
+    assert [labels["channel"] for labels, _ in series] == ["emeter_0", "emeter_1", "emeter_2"]
+    assert [samples for _, samples in series] == [[(0.0, 60_000)], [(1.0, 60_000)], [(2.0, 60_000)]]
+
+
+@pytest.mark.parametrize("size", [0, 1, 60, 61, 256, 257, 65536, 70000])
+def test_snappy_literal(size):
+    data = os.urandom(size)
+    block = snappy_literal(data)
+    assert block.startswith(varint(size))
+    assert read_snappy_literal(block) == data
+
+
+def test_snappy_literal_python_snappy():
+    snappy = pytest.importorskip("snappy")
+    data = encode_point(("shelly3em", TAGS, {"power": 1.0}, 0)) * 5000
+    assert snappy.uncompress(snappy_literal(data)) == data
@@ -1,7 +1,7 @@
 from components.device import Device
 from components.sysGetStatus import SysGetStatus
 from components.boolean.status import BooleanStatus
-import requests
+from services.health import DeviceHealth
 import time
 
 
@@ -25,6 +25,8 @@ class Fk06x:
         # Error
         self._has_error: bool = False
         self._last_error_msg: str = None
+        # Circuit breaker, skips the requests while the device is unreachable
+        self._health: DeviceHealth = DeviceHealth(f"FK-06X {device.name} ({device.ip})")
 
 
     
@@ -41,11 +43,36 @@ class Fk06x:
             'is_error' : self.is_error,
             'last_error_msg' : self.last_error_msg
         }
+
+
+    def cached_dict(self) -> dict:
+        '''
+        The state from the cached responses, unlike as_dict() it never sends a request \n
+        Used by the state API, its readers must not add load to the device
+
+
+        Args:
+            None
+
+        Returns:
+            dict: The device, the last statuses (None until read), health and error
+        '''
+        sys_cache = self._sys_get_status_cache
+        return {
+            'device' : self.device.as_dict(),
+            'sys' : sys_cache.as_dict() if sys_cache else None,
+            'booleans' : [boolean_status.as_dict() if boolean_status else None for boolean_status in self._boolean_get_status_caches],
+            'zone_active' : any(boolean.value for boolean in self._boolean_get_status_caches if boolean),
+            'polled_time' : max(self._boolean_get_status_polled_times) or None,
+            'health' : self.health,
+            'has_error' : self.has_error,
+            'last_error_msg' : str(self.last_error_msg) if self.last_error_msg else None
+        }
         
     
     def _sys_get_status(self):
         if (time.time() - self._sys_get_status_polled_time) > self.device.interval_seconds:
-            data = requests.get(f"http://{self.device.ip}/rpc/Sys.GetStatus")
+            data = self._health.get(f"http://{self.device.ip}/rpc/Sys.GetStatus")
             self._sys_get_status_cache = SysGetStatus(data.json())
             self._sys_get_status_polled_time = time.time()
 
@@ -54,13 +81,15 @@ class Fk06x:
         for idx, key in enumerate(self._boolean_keys):
             if (time.time() - self._boolean_get_status_polled_times[idx]) > self.device.interval_seconds:
                 try:
-                    data = requests.get(f"http://{self.device.ip}/rpc/Boolean.GetStatus?id={key}")
+                    data = self._health.get(f"http://{self.device.ip}/rpc/Boolean.GetStatus?id={key}")
                     self._boolean_get_status_caches[idx] = BooleanStatus(data.json())
                     self._boolean_get_status_polled_times[idx] = time.time()
                     self._has_error = False
                 except Exception as e:
                     self._last_error_msg = e
                     self._has_error = True
+                    # Fail fast, the other keys would wait for the same unreachable device
+                    return
         
     
     @property
@@ -82,10 +111,16 @@ class Fk06x:
     
     @property
     def zone_active(self) -> bool:
-        zone_states = [boolean.value for boolean in self.boolean_statuses]
+        # A zone never read (device unreachable since startup) counts as inactive
+        zone_states = [boolean.value for boolean in self.boolean_statuses if boolean]
         return any(zone_states)
     
     
+    @property
+    def health(self) -> str:
+        return self._health.state
+
+
     @property
     def has_error(self) -> bool:
         return self._has_error
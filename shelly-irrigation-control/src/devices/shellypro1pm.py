@@ -2,7 +2,7 @@ from components.device import Device
 from components.sysGetStatus import SysGetStatus
 from components.switch import SwitchGetConfig, SwitchGetStatus
 from components.relay import Relay
-import requests
+from services.health import DeviceHealth
 import time
 
 
@@ -31,6 +31,8 @@ class ShellyPro1Pm:
         # Error
         self._has_error: bool = False
         self._last_error_msg: str = None
+        # Circuit breaker, skips the requests while the device is unreachable
+        self._health: DeviceHealth = DeviceHealth(f"Pro 1PM {device.name} ({device.ip})")
 
     
     def __string__(self) -> str:
@@ -45,12 +47,42 @@ class ShellyPro1Pm:
             'switch_0_status' : self.switch_0_status.as_dict(),
             'is_active' : self.is_active
         }
+
+
+    def cached_dict(self) -> dict:
+        '''
+        The state from the cached responses, unlike as_dict() it never sends a request \n
+        Used by the state API, its readers must not add load to the device
+
+
+        Args:
+            None
+
+        Returns:
+            dict: The device, the last responses (None until read), health and error
+        '''
+        sys_cache = self._sys_get_status_cache
+        config_cache = self._switch_get_config_cache
+        status_cache = self._switch_get_status_cache
+        relay_cache = self._relay_response_cache
+        return {
+            'device' : self.device.as_dict(),
+            'sys' : sys_cache.as_dict() if sys_cache else None,
+            'switch_0_config' : config_cache.as_dict() if config_cache else None,
+            'switch_0_status' : status_cache.as_dict() if status_cache else None,
+            'relay' : relay_cache.as_dict() if relay_cache else None,
+            'is_active' : status_cache.output if status_cache else False,
+            'polled_time' : self._switch_get_status_polled_time or None,
+            'health' : self.health,
+            'has_error' : self.has_error,
+            'last_error_msg' : str(self.last_error_msg) if self.last_error_msg else None
+        }
         
     
     def _sys_get_status(self):
         if (time.time() - self._sys_get_status_polled_time) > self.device.interval_seconds:
             try:
-                data = requests.get(f"http://{self.device.ip}/rpc/Sys.GetStatus")
+                data = self._health.get(f"http://{self.device.ip}/rpc/Sys.GetStatus")
                 self._sys_get_status_cache = SysGetStatus(data.json())
                 self._sys_get_status_polled_time = time.time()
             except Exception as e:
@@ -61,7 +93,7 @@ class ShellyPro1Pm:
     def _switch_get_config(self, id: int):
         if (time.time() - self._switch_get_config_polled_time) > self.device.interval_seconds:
             try:
-                data = requests.get(f"http://{self.device.ip}/rpc/Switch.GetConfig?id={id}")
+                data = self._health.get(f"http://{self.device.ip}/rpc/Switch.GetConfig?id={id}")
                 self._switch_get_config_cache = SwitchGetConfig(data.json())
                 self._switch_get_config_polled_time = time.time()
             except Exception as e:
@@ -72,7 +104,7 @@ class ShellyPro1Pm:
     def _switch_get_status(self, id: int):
         if (time.time() - self._switch_get_status_polled_time) > self.device.interval_seconds:
             try:
-                data = requests.get(f"http://{self.device.ip}/rpc/Switch.GetStatus?id={id}")
+                data = self._health.get(f"http://{self.device.ip}/rpc/Switch.GetStatus?id={id}")
                 self._switch_get_status_cache = SwitchGetStatus(data.json())
                 self._switch_get_status_polled_time = time.time()
             except Exception as e:
@@ -99,7 +131,7 @@ class ShellyPro1Pm:
         '''
         if (time.time() - self._relay_response_polled_time) > self.device.interval_seconds:
             try:
-                response = requests.get(f"http://{self.device.ip}/relay/0?turn=on&timer={self.device.failsafe_seconds}")
+                response = self._health.get(f"http://{self.device.ip}/relay/0?turn=on&timer={self.device.failsafe_seconds}")
                 response.raise_for_status()
                 self._relay_response_cache = Relay(response.json())
                 self._relay_response_polled_time = time.time()
@@ -145,7 +177,13 @@ class ShellyPro1Pm:
     
     @property
     def is_active(self) -> bool:
-        return self.switch_0_status.output
+        switch_0_status = self.switch_0_status
+        return switch_0_status.output if switch_0_status else False
+
+
+    @property
+    def health(self) -> str:
+        return self._health.state
 
 
     @property
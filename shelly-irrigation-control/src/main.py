@@ -1,6 +1,8 @@
 from services.environment import ENV
 from services.logging import LOGGER
 from services import loaddevices
+from services.transport import TRANSPORT
+from services.stateapi import StateApi
 import time
 
 
@@ -10,6 +12,7 @@ Main entrypoint module for the Shelly Irrigation Control
 Loads shelly devices (fk06x and Pro1PM) from .json config
 Simply checks if any irrigation zone is active, then turns on the Pro1PM relay
 Uses the relay on timer as a failsafe. No need to trigger the relay off.
+With STATE_PORT set the cached device state is served over HTTP (services.stateapi)
 '''
 
 
@@ -26,6 +29,11 @@ def main():
     pump_state: bool = None
     some_error: bool = False
     error_state = None
+    # Local HTTP API, served from the cached responses
+    state_api = None
+    if ENV.STATE_PORT:
+        state_api = StateApi(ENV.STATE_BIND, ENV.STATE_PORT)
+        state_api.start()
     
     while True:
         for irrigation_controller in irrigation_controllers:
@@ -55,6 +63,9 @@ def main():
                 LOGGER.error("There was some error, ignoring and trying again...")
                 
         error_state = some_error
+        if state_api:
+            state_api.publish(pump, irrigation_controllers)
+        TRANSPORT.log_stats()
         time.sleep(ENV.POLLING_INTERVAL_SECONDS)
     
 
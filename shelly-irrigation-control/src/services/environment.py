@@ -61,6 +61,13 @@ class env:
         # Polling
         self.TIMEOUT = None
         self.FAILSAFE = None
+        # Circuit breaker
+        self.BREAKER_FAILURES = None
+        self.BREAKER_BACKOFF_SECONDS = None
+        self.BREAKER_MAX_BACKOFF_SECONDS = None
+        # State API
+        self.STATE_PORT = None
+        self.STATE_BIND = None
         
 
         ########################
@@ -106,6 +113,38 @@ class env:
                 "required" : False,
                 "default" : "10",
                 "type" : "int"
+            },
+            # Circuit breaker
+            {
+                "name" : "BREAKER_FAILURES",
+                "required" : False,
+                "default" : "3",
+                "type" : "int"
+            },
+            {
+                "name" : "BREAKER_BACKOFF_SECONDS",
+                "required" : False,
+                "default" : "10",
+                "type" : "int"
+            },
+            {
+                "name" : "BREAKER_MAX_BACKOFF_SECONDS",
+                "required" : False,
+                "default" : "300",
+                "type" : "int"
+            },
+            # State API
+            {
+                "name" : "STATE_PORT",
+                "required" : False,
+                "default" : "0",
+                "type" : "int"
+            },
+            {
+                "name" : "STATE_BIND",
+                "required" : False,
+                "default" : "0.0.0.0",
+                "type" : "str"
             }
         ]
 
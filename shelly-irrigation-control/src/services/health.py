@@ -0,0 +1,123 @@
+from services.environment import ENV
+from services.logging import LOGGER
+from services.transport import TRANSPORT
+import time
+import requests
+
+
+
+'''
+Per-device health with a circuit breaker
+healthy -> degraded on a failed request, still polled at the normal rate
+degraded -> open after BREAKER_FAILURES failed requests in a row, no requests are sent
+open -> half-open once the backoff expires, the next request is the probe
+A successful probe closes the circuit, a failed one doubles the backoff up to BREAKER_MAX_BACKOFF_SECONDS
+An unreachable device costs nothing while its circuit is open instead of a timeout per request
+'''
+
+
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+OPEN = "open"
+
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    '''
+    Raised instead of sending a request to a device with an open circuit
+    '''
+
+
+
+class DeviceHealth:
+    def __init__(self, name: str):
+        self._name: str = name
+        self._failures: int = 0
+        self._backoff: float = 0.0
+        self._retry_at: float = 0.0
+
+
+    @property
+    def state(self) -> str:
+        if self._failures == 0:
+            return HEALTHY
+        if self._failures < ENV.BREAKER_FAILURES:
+            return DEGRADED
+        return OPEN
+
+
+    def allow(self) -> bool:
+        '''
+        Checks if a request may be sent, an open circuit allows the half-open probe once the backoff expired
+
+        Args:
+            None
+
+        Returns:
+            bool: True if the request may be sent
+        '''
+        return self.state != OPEN or time.monotonic() >= self._retry_at
+
+
+    def success(self) -> None:
+        '''
+        Records a successful request and closes the circuit
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        if self.state == OPEN:
+            LOGGER.info(f"{self._name} is reachable again, circuit closed")
+        self._failures = 0
+        self._backoff = 0.0
+
+
+    def failure(self) -> None:
+        '''
+        Records a failed request, opens the circuit or doubles the backoff of an open circuit
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self._failures += 1
+        if self._failures < ENV.BREAKER_FAILURES:
+            return
+        if self._failures == ENV.BREAKER_FAILURES:
+            self._backoff = ENV.BREAKER_BACKOFF_SECONDS
+            LOGGER.warning(f"{self._name} failed {self._failures} requests in a row, circuit open for {self._backoff} seconds")
+        else:
+            self._backoff = min(self._backoff * 2, ENV.BREAKER_MAX_BACKOFF_SECONDS)
+            LOGGER.debug(f"{self._name} probe failed, circuit open for {self._backoff} seconds")
+        self._retry_at = time.monotonic() + self._backoff
+
+
+    def get(self, url: str) -> requests.Response:
+        '''
+        Sends a GET request through the shared transport unless the circuit is open
+
+        Args:
+            url (str): The full URL
+
+        Returns:
+            requests.Response: The response
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            requests.exceptions.RequestException: If the request fails or times out
+        '''
+        if not self.allow():
+            raise CircuitOpenError(f"{self._name} is unreachable, circuit open for {self._retry_at - time.monotonic():.0f} more seconds")
+        try:
+            response = TRANSPORT.get(url)
+        except requests.exceptions.RequestException:
+            self.failure()
+            raise
+        self.success()
+        return response
@@ -0,0 +1,132 @@
+from services.logging import LOGGER
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+
+'''
+Local HTTP API serving the latest state of the pump and irrigation controllers
+The state comes from the devices' cached responses (cached_dict), never from new requests
+It is serialized once per loop, a request only sends the stored bytes
+Any number of dashboards and scripts reading it add no load to the devices
+Every response has an ETag, a request with a matching If-None-Match gets a 304 Not Modified
+
+GET /state                    The pump, the zones and every device
+GET /devices/<model>/<ip>     One device, e.g. /devices/fk-06x/192.168.1.20
+'''
+
+
+
+CONTENT_TYPE = "application/json"
+
+
+def render(document: dict) -> tuple[bytes, str]:
+    '''
+    Serializes a document and derives its ETag from the content
+
+    Args:
+        document (dict): The document
+
+    Returns:
+        tuple[bytes, str]: The body and its ETag, unchanged state keeps the same ETag
+    '''
+    body = json.dumps(document, separators=(",", ":"), default=str).encode()
+    return body, '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def matches(if_none_match: str, tag: str) -> bool:
+    # A list of tags, weak or strong, or "*"
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+
+class StateHandler(BaseHTTPRequestHandler):
+    api: "StateApi" = None
+    # Keep-alive, a dashboard polling the API reuses its connection
+    protocol_version = "HTTP/1.1"
+
+
+    def do_GET(self) -> None:
+        document = self.api.documents.get(self.path.partition("?")[0].rstrip("/"))
+        if document is None:
+            self.send_error(404)
+            return
+        body, tag = document
+        if matches(self.headers.get("If-None-Match", ""), tag):
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", tag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+
+class StateApi:
+    def __init__(self, host: str, port: int):
+        # Path -> (body, ETag), replaced whole once per loop so a request never sees a half published state
+        self.documents: dict[str, tuple[bytes, str]] = {}
+        handler = type("Handler", (StateHandler,), {"api": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="state", daemon=True)
+
+
+    def start(self) -> None:
+        '''
+        Serves the API on a background thread
+
+        Args:
+            None
+
+        Returns:
+            None
+        '''
+        self._thread.start()
+        LOGGER.info(f"Serving the state on http://{self.server.server_address[0]}:{self.server.server_address[1]}/state")
+
+
+    def publish(self, pump, irrigation_controllers: list) -> None:
+        '''
+        Serializes the cached state of the devices, called once per loop
+
+        Args:
+            pump (ShellyPro1Pm): The pump relay
+            irrigation_controllers (list[Fk06x]): The irrigation controllers
+
+        Returns:
+            None
+        '''
+        documents = {}
+        states = []
+        for device in [pump, *irrigation_controllers]:
+            state = device.cached_dict()
+            states.append(state)
+            documents[f"/devices/{device.device.model}/{device.device.ip}"] = render(state)
+        documents["/state"] = render({
+            "pump_active": states[0]["is_active"],
+            "zone_active": any(state["zone_active"] for state in states[1:]),
+            "devices": states
+        })
+        self.documents = documents
+
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,95 @@
+from services.environment import ENV
+from services.logging import LOGGER
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+
+
+'''
+Shared HTTP transport for the Shelly devices.
+Keeps a keep-alive connection pool per device host and applies the
+environment TIMEOUT (seconds) as the connect and read timeout of every request.
+'''
+
+
+
+class Transport:
+    def __init__(self, timeout: float, pool_maxsize: int = 2):
+        self._timeout: tuple[float, float] = (timeout, timeout)
+        self._pool_maxsize: int = pool_maxsize
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+
+    def _session(self, host: str) -> requests.Session:
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_maxsize, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[host] = session
+        return session
+
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        '''
+        Sends a GET request over the host's pooled keep-alive connection
+
+        Args:
+            url (str): The full URL
+            **kwargs: Passed to requests.Session.get, timeout defaults to ENV.TIMEOUT
+
+        Returns:
+            requests.Response: The response
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails or times out
+        '''
+        kwargs.setdefault("timeout", self._timeout)
+        return self._session(urlsplit(url).netloc).get(url, **kwargs)
+
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        '''
+        Connection reuse statistics per host
+
+        Args:
+            None
+
+        Returns:
+            dict[str, dict[str, int]]: {host: {"requests": int, "connections": int, "reused": int}}
+        '''
+        stats = {}
+        for host, session in list(self._sessions.items()):
+            # Read the pools requests created, looking one up by URL would create
+            # (and with pool_connections=1 evict the live one for) a pool with a different key
+            poolmanager = session.get_adapter(f"http://{host}").poolmanager
+            pools = [poolmanager.pools.get(key) for key in poolmanager.pools.keys()]
+            requests_count = sum(pool.num_requests for pool in pools if pool)
+            connections = sum(pool.num_connections for pool in pools if pool)
+            stats[host] = {
+                "requests": requests_count,
+                "connections": connections,
+                "reused": max(requests_count - connections, 0)
+            }
+        return stats
+
+
+    def log_stats(self) -> None:
+        '''
+        Logs the connection reuse statistics per host at DEBUG level
+        '''
+        for host, stats in self.stats().items():
+            LOGGER.debug(f'{host}: {stats["requests"]} requests over {stats["connections"]} connections ({stats["reused"]} reused)')
+
+
+
+# Initialize the transport and load to TRANSPORT
+# Use "from services.transport import TRANSPORT"
+TRANSPORT = Transport(ENV.TIMEOUT)
@@ -0,0 +1,3 @@
+from .shelly3em import VirtualShelly3EM
+from .shellypro1pm import VirtualShellyPro1Pm
+from .fk06x import VirtualFk06x
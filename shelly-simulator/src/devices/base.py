@@ -0,0 +1,100 @@
+import random
+import time
+from urllib.parse import parse_qs
+from services.faults import FaultProfile
+
+
+
+'''
+Base class for a virtual Shelly device.
+Keeps the uptime, reboot schedule and routing shared by every model.
+Readings are advanced lazily, on request, from the time since the last request.
+'''
+
+
+
+class VirtualDevice:
+    MODEL: str = None
+
+
+    def __init__(self, ip: str, index: int, faults: FaultProfile, rng: random.Random):
+        self.ip: str = ip
+        self.index: int = index
+        self.faults: FaultProfile = faults
+        self.rng: random.Random = rng
+        self.mac: str = f"{0xC45BBE000000 + index:012X}"
+        self.boot_time: float = time.time() - rng.uniform(60, 86400)
+        self.down_until: float = 0.0
+        self.next_reboot: float = self._schedule_reboot(time.time())
+        self.last_update: float = time.time()
+        self.requests: int = 0
+        # Path -> handler(query) returning the JSON body
+        self.routes: dict = {}
+
+
+    def _schedule_reboot(self, now: float) -> float:
+        if self.faults.reboot_interval <= 0:
+            return float("inf")
+        return now + self.rng.expovariate(1 / self.faults.reboot_interval)
+
+
+    @property
+    def uptime(self) -> int:
+        return int(time.time() - self.boot_time)
+
+
+    def is_down(self, now: float) -> bool:
+        '''
+        Checks if the device is rebooting, starting a reboot when one is due.
+        '''
+        if now >= self.next_reboot:
+            self.reboot(now)
+        return now < self.down_until
+
+
+    def reboot(self, now: float) -> None:
+        self.down_until = now + self.faults.reboot_seconds
+        self.boot_time = self.down_until
+        self.next_reboot = self._schedule_reboot(self.down_until)
+        self.on_reboot()
+
+
+    def on_reboot(self) -> None:
+        '''
+        Resets the state lost on a reboot, overridden per model.
+        '''
+
+
+    def update(self, now: float) -> None:
+        '''
+        Advances the readings to now, overridden per model.
+        '''
+
+
+    def handle(self, path: str, query: str) -> tuple[int, dict]:
+        '''
+        Handles a GET request.
+
+        Args:
+            path (str): The request path, e.g. /rpc/Switch.GetStatus
+            query (str): The raw query string
+
+        Returns:
+            tuple[int, dict]: The HTTP status and JSON body
+        '''
+        self.requests += 1
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, {"code": 404, "message": f"No handler for {path}"}
+        now = time.time()
+        self.update(now)
+        self.last_update = now
+        params = {key: values[-1] for key, values in parse_qs(query).items()}
+        return 200, handler(params)
+
+
+    def drift(self, value: float, step: float, low: float, high: float) -> float:
+        '''
+        Random walk of a reading within its range.
+        '''
+        return min(max(value + self.rng.uniform(-step, step), low), high)
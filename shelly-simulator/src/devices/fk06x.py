@@ -0,0 +1,62 @@
+import random
+import time
+from devices.gen2 import VirtualGen2Device
+from services.faults import FaultProfile
+
+
+
+'''
+Virtual FK-06X irrigation controller (Gen2)
+The six zones are Boolean components 200-205, each zone runs for a few minutes at random
+'''
+
+
+
+class VirtualFk06x(VirtualGen2Device):
+    MODEL = "fk-06x"
+    APP = "FK06X"
+    DEVICE_MODEL = "FK-06X"
+    ZONE_KEYS = [200, 201, 202, 203, 204, 205]
+
+
+    def __init__(self, ip: str, index: int, faults: FaultProfile, rng: random.Random, zone_interval: float = 600, zone_seconds: float = 120):
+        super().__init__(ip, index, faults, rng)
+        # Mean seconds between zone runs and how long a zone runs
+        self.zone_interval: float = zone_interval
+        self.zone_seconds: float = zone_seconds
+        self.zone: int = None
+        self.zone_until: float = 0.0
+        self.next_zone: float = time.time() + rng.expovariate(1 / zone_interval)
+        self.last_update_ts: dict[int, int] = {key: int(time.time()) for key in self.ZONE_KEYS}
+        self.routes.update({
+            "/rpc/Boolean.GetStatus": self.boolean_status
+        })
+
+
+    def on_reboot(self) -> None:
+        self.zone = None
+
+
+    def update(self, now: float) -> None:
+        if self.zone is not None and now >= self.zone_until:
+            self.last_update_ts[self.zone] = int(now)
+            self.zone = None
+        if self.zone is None and now >= self.next_zone:
+            self.zone = self.rng.choice(self.ZONE_KEYS)
+            self.zone_until = now + self.zone_seconds
+            self.next_zone = self.zone_until + self.rng.expovariate(1 / self.zone_interval)
+            self.last_update_ts[self.zone] = int(now)
+
+
+    def boolean_status(self, params: dict) -> dict:
+        key = int(params.get("id", 200))
+        return {
+            "id": key,
+            "value": self.zone == key,
+            "source": "schedule",
+            "last_update_ts": self.last_update_ts.get(key, 0)
+        }
+
+
+    def status_components(self) -> dict:
+        return {f"boolean:{key}": self.boolean_status({"id": key}) for key in self.ZONE_KEYS}
@@ -0,0 +1,109 @@
+import random
+import time
+from devices.base import VirtualDevice
+from services.faults import FaultProfile
+
+
+
+'''
+Base class for virtual Gen2 (RPC) devices.
+Serves /shelly, Sys.GetStatus, WiFi.GetStatus, Shelly.GetStatus and Shelly.GetConfig.
+Models add their components with status_components() and config_components().
+'''
+
+
+
+class VirtualGen2Device(VirtualDevice):
+    APP: str = None
+    DEVICE_MODEL: str = None
+    FIRMWARE_ID: str = "20231107-164738/1.0.8-g8c7bb8d"
+    VERSION: str = "1.0.8"
+
+
+    def __init__(self, ip: str, index: int, faults: FaultProfile, rng: random.Random):
+        super().__init__(ip, index, faults, rng)
+        self.cfg_rev: int = 10
+        self.device_id: str = f"{self.APP.lower()}-{self.mac.lower()}"
+        self.routes = {
+            "/shelly": self.shelly,
+            "/rpc/Shelly.GetDeviceInfo": self.shelly,
+            "/rpc/Shelly.GetStatus": self.get_status,
+            "/rpc/Shelly.GetConfig": self.get_config,
+            "/rpc/Sys.GetStatus": self.sys_status,
+            "/rpc/WiFi.GetStatus": self.wifi_status
+        }
+
+
+    def shelly(self, params: dict) -> dict:
+        return {
+            "name": None,
+            "id": self.device_id,
+            "mac": self.mac,
+            "slot": 0,
+            "model": self.DEVICE_MODEL,
+            "gen": 2,
+            "fw_id": self.FIRMWARE_ID,
+            "ver": self.VERSION,
+            "app": self.APP,
+            "auth_en": False,
+            "auth_domain": None
+        }
+
+
+    def sys_status(self, params: dict) -> dict:
+        now = time.time()
+        return {
+            "mac": self.mac,
+            "restart_required": False,
+            "time": time.strftime("%H:%M", time.localtime(now)),
+            "unixtime": int(now),
+            "last_sync_ts": int(now) - 60,
+            "uptime": self.uptime,
+            "ram_size": 247140,
+            "ram_free": 120000 + self.rng.randint(0, 2000),
+            "ram_min_free": 104220,
+            "fs_size": 524288,
+            "fs_free": 212992,
+            "cfg_rev": self.cfg_rev,
+            "kvs_rev": 0,
+            "schedule_rev": 0,
+            "webhook_rev": 0,
+            "btrelay_rev": 0,
+            "available_updates": {},
+            "reset_reason": 3,
+            "utc_offset": 36000
+        }
+
+
+    def wifi_status(self, params: dict) -> dict:
+        return {
+            "sta_ip": self.ip,
+            "status": "got ip",
+            "ssid": "simulator",
+            "rssi": -55 - self.rng.randint(0, 10),
+            "sta_ip6": ["fe80::1"]
+        }
+
+
+    def status_components(self) -> dict:
+        return {}
+
+
+    def config_components(self) -> dict:
+        return {}
+
+
+    def get_status(self, params: dict) -> dict:
+        return {
+            "ble": {},
+            "cloud": {"connected": False},
+            "mqtt": {"connected": False},
+            "sys": self.sys_status(params),
+            "wifi": self.wifi_status(params),
+            "ws": {"connected": False},
+            **self.status_components()
+        }
+
+
+    def get_config(self, params: dict) -> dict:
+        return self.config_components()
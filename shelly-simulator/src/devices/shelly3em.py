@@ -0,0 +1,189 @@
+import random
+import time
+from devices.base import VirtualDevice
+from services.faults import FaultProfile
+
+
+
+'''
+Virtual Shelly 3EM (Gen1)
+Serves /shelly, /status, /relay/0 and the CoIoT description /cit/d
+'''
+
+
+
+class VirtualShelly3EM(VirtualDevice):
+    MODEL = "shelly3em"
+    FIRMWARE = "20230913-114244/v1.14.0-gcb84623"
+    # CoIoT v2 sensor ids, the emeter ids count up by 100 per phase
+    CONFIG_CHANGED = 9103
+    OUTPUT = 1101
+    EMETER_SENSORS = {"power": 4105, "energy": 4106, "returnedEnergy": 4107, "voltage": 4108, "current": 4109, "powerFactor": 4110}
+
+
+    def __init__(self, ip: str, index: int, faults: FaultProfile, rng: random.Random):
+        super().__init__(ip, index, faults, rng)
+        self.powers: list[float] = [rng.uniform(0, 2000) for _ in range(3)]
+        self.voltages: list[float] = [rng.uniform(228, 242) for _ in range(3)]
+        self.totals: list[float] = [rng.uniform(0, 5e6) for _ in range(3)]
+        self.totals_returned: list[float] = [rng.uniform(0, 1e4) for _ in range(3)]
+        self.relay_on: bool = False
+        self.relay_timer_started: int = 0
+        self.relay_timer_duration: int = 0
+        self.routes = {
+            "/shelly": self.shelly,
+            "/status": self.status,
+            "/relay/0": self.relay,
+            "/cit/d": self.cit_description
+        }
+
+
+    def on_reboot(self) -> None:
+        self.relay_on = False
+        self.relay_timer_duration = 0
+        if self.faults.reset_counters_on_reboot:
+            self.totals = [0.0, 0.0, 0.0]
+            self.totals_returned = [0.0, 0.0, 0.0]
+
+
+    def update(self, now: float) -> None:
+        hours = (now - self.last_update) / 3600
+        for phase in range(3):
+            self.powers[phase] = self.drift(self.powers[phase], 50, 0, 4000)
+            self.voltages[phase] = self.drift(self.voltages[phase], 0.5, 220, 250)
+            self.totals[phase] += self.powers[phase] * hours
+        if self.relay_timer_duration and now >= self.relay_timer_started + self.relay_timer_duration:
+            self.relay_on = False
+            self.relay_timer_duration = 0
+
+
+    def shelly(self, params: dict) -> dict:
+        return {
+            "type": "SHEM-3",
+            "mac": self.mac,
+            "auth": False,
+            "fw": self.FIRMWARE,
+            "discoverable": False,
+            "longid": 1,
+            "num_outputs": 1,
+            "num_emeters": 3,
+            "report_period": 1
+        }
+
+
+    def _relay(self) -> dict:
+        remaining = 0
+        if self.relay_timer_duration:
+            remaining = max(self.relay_timer_started + self.relay_timer_duration - int(time.time()), 0)
+        return {
+            "ison": self.relay_on,
+            "has_timer": bool(self.relay_timer_duration),
+            "timer_started": self.relay_timer_started,
+            "timer_duration": self.relay_timer_duration,
+            "timer_remaining": remaining,
+            "overpower": False,
+            "is_valid": True,
+            "source": "http"
+        }
+
+
+    def status(self, params: dict) -> dict:
+        now = time.time()
+        emeters = []
+        for phase in range(3):
+            current = self.powers[phase] / self.voltages[phase]
+            emeters.append({
+                "power": round(self.powers[phase], 2),
+                "pf": 0.95,
+                "current": round(current, 2),
+                "voltage": round(self.voltages[phase], 2),
+                "is_valid": True,
+                "total": round(self.totals[phase], 1),
+                "total_returned": round(self.totals_returned[phase], 1)
+            })
+        return {
+            "wifi_sta": {"connected": True, "ssid": "simulator", "ip": self.ip, "rssi": -60},
+            "cloud": {"enabled": False, "connected": False},
+            "mqtt": {"connected": False},
+            "time": time.strftime("%H:%M", time.localtime(now)),
+            "unixtime": int(now),
+            "serial": self.requests,
+            "has_update": False,
+            "mac": self.mac,
+            "cfg_changed_cnt": 0,
+            "actions_stats": {"skipped": 0},
+            "relays": [self._relay()],
+            "emeters": emeters,
+            "emeter_n": {"current": 0, "ixsum": 0, "mismatch": False, "is_valid": False},
+            "total_power": round(sum(self.powers), 2),
+            "fs_mounted": True,
+            "v_data": 1,
+            "ct_calst": 0,
+            "update": {
+                "status": "idle",
+                "has_update": False,
+                "new_version": self.FIRMWARE,
+                "old_version": self.FIRMWARE,
+                "beta_version": None
+            },
+            "ram_total": 49920,
+            "ram_free": 30000 + self.rng.randint(0, 1000),
+            "fs_size": 233681,
+            "fs_free": 156875,
+            "uptime": self.uptime
+        }
+
+
+    def relay(self, params: dict) -> dict:
+        turn = params.get("turn")
+        if turn in ("on", "off", "toggle"):
+            self.relay_on = (not self.relay_on) if turn == "toggle" else (turn == "on")
+            self.relay_timer_duration = int(params.get("timer", 0)) if self.relay_on else 0
+            self.relay_timer_started = int(time.time()) if self.relay_timer_duration else 0
+        return self._relay()
+
+
+    def cit_description(self, params: dict) -> dict:
+        units = {"power": ("P", "W"), "energy": ("E", "Wh"), "returnedEnergy": ("E", "Wh"), "voltage": ("V", "V"), "current": ("A", "A"), "powerFactor": ("S", None)}
+        sensors = [
+            {"I": self.CONFIG_CHANGED, "T": "EVC", "D": "cfgChanged", "R": "U16", "L": 5},
+            {"I": self.OUTPUT, "T": "S", "D": "output", "R": "0/1", "L": 1}
+        ]
+        for phase in range(3):
+            for description, sensor_id in self.EMETER_SENSORS.items():
+                kind, unit = units[description]
+                sensor = {"I": sensor_id + phase * 100, "T": kind, "D": description, "L": 2 + phase}
+                if unit:
+                    sensor["U"] = unit
+                sensors.append(sensor)
+        return {
+            "blk": [
+                {"I": 1, "D": "relay_0"},
+                {"I": 2, "D": "emeter_0"},
+                {"I": 3, "D": "emeter_1"},
+                {"I": 4, "D": "emeter_2"},
+                {"I": 5, "D": "device"}
+            ],
+            "sen": sensors
+        }
+
+
+    def coiot_values(self) -> list:
+        '''
+        The [channel, sensor id, value] triples of a CoIoT status packet.
+        '''
+        now = time.time()
+        self.update(now)
+        self.last_update = now
+        values = [[0, self.CONFIG_CHANGED, 0], [0, self.OUTPUT, int(self.relay_on)]]
+        for phase in range(3):
+            offset = phase * 100
+            values += [
+                [0, self.EMETER_SENSORS["power"] + offset, round(self.powers[phase], 2)],
+                [0, self.EMETER_SENSORS["energy"] + offset, round(self.totals[phase], 1)],
+                [0, self.EMETER_SENSORS["returnedEnergy"] + offset, round(self.totals_returned[phase], 1)],
+                [0, self.EMETER_SENSORS["voltage"] + offset, round(self.voltages[phase], 2)],
+                [0, self.EMETER_SENSORS["current"] + offset, round(self.powers[phase] / self.voltages[phase], 2)],
+                [0, self.EMETER_SENSORS["powerFactor"] + offset, 0.95]
+            ]
+        return values
@@ -0,0 +1,160 @@
+import random
+import time
+from devices.gen2 import VirtualGen2Device
+from services.faults import FaultProfile
+
+
+
+'''
+Virtual Shelly Pro 1 PM (Gen2)
+Serves the Switch, Input, Sys and WiFi RPC methods and the Gen1 style /relay/0
+'''
+
+
+
+class VirtualShellyPro1Pm(VirtualGen2Device):
+    MODEL = "shellypro1pm"
+    APP = "Pro1PM"
+    DEVICE_MODEL = "SPSW-201XE16EU"
+
+
+    def __init__(self, ip: str, index: int, faults: FaultProfile, rng: random.Random):
+        super().__init__(ip, index, faults, rng)
+        self.output: bool = False
+        self.source: str = "init"
+        self.load_power: float = rng.uniform(200, 2500)
+        self.voltage: float = rng.uniform(228, 242)
+        self.aenergy_total: float = rng.uniform(0, 1e6)
+        self.by_minute: list[float] = [0.0, 0.0, 0.0]
+        self.timer_started_at: float = 0.0
+        self.timer_duration: float = 0.0
+        self.temperature: float = rng.uniform(30, 45)
+        self.inputs: list[bool] = [False, False]
+        self.config: dict = {
+            "id": 0,
+            "name": f"Simulated {index}",
+            "in_mode": "follow",
+            "in_locked": False,
+            "initial_state": "off",
+            "auto_on": False,
+            "auto_on_delay": 60.0,
+            "auto_off": False,
+            "auto_off_delay": 60.0,
+            "power_limit": 4480,
+            "voltage_limit": 280,
+            "undervoltage_limit": 0,
+            "autorecover_voltage_errors": False,
+            "current_limit": 16.0,
+            "reverse": False,
+            "input_id": 0
+        }
+        self.routes.update({
+            "/rpc/Switch.GetStatus": self.switch_status,
+            "/rpc/Switch.GetConfig": self.switch_config,
+            "/rpc/Switch.Set": self.switch_set,
+            "/rpc/Input.GetStatus": self.input_status,
+            "/relay/0": self.relay
+        })
+
+
+    def on_reboot(self) -> None:
+        self.output = False
+        self.source = "init"
+        self.timer_duration = 0.0
+        self.by_minute = [0.0, 0.0, 0.0]
+        if self.faults.reset_counters_on_reboot:
+            self.aenergy_total = 0.0
+
+
+    @property
+    def apower(self) -> float:
+        return self.load_power if self.output else 0.0
+
+
+    def update(self, now: float) -> None:
+        if self.timer_duration and now >= self.timer_started_at + self.timer_duration:
+            self.output = False
+            self.source = "timer"
+            self.timer_duration = 0.0
+        self.load_power = self.drift(self.load_power, 20, 100, 3500)
+        self.voltage = self.drift(self.voltage, 0.5, 220, 250)
+        self.aenergy_total += self.apower * (now - self.last_update) / 3600
+        self.temperature = self.drift(self.temperature, 0.2, 25, 70)
+
+
+    def _set_output(self, on: bool, timer: float, source: str) -> None:
+        self.output = on
+        self.source = source
+        self.timer_duration = timer if on and timer else 0.0
+        self.timer_started_at = time.time() if self.timer_duration else 0.0
+
+
+    def switch_status(self, params: dict | None = None) -> dict:
+        minute_ts = int(time.time()) // 60 * 60
+        status = {
+            "id": 0,
+            "source": self.source,
+            "output": self.output,
+            "apower": round(self.apower, 1),
+            "voltage": round(self.voltage, 1),
+            "freq": 50.0,
+            "current": round(self.apower / self.voltage, 3),
+            "pf": 0.98 if self.output else 0.0,
+            "aenergy": {"total": round(self.aenergy_total, 3), "by_minute": list(self.by_minute), "minute_ts": minute_ts},
+            "ret_aenergy": {"total": 0.0, "by_minute": [0.0, 0.0, 0.0], "minute_ts": minute_ts},
+            "temperature": {"tC": round(self.temperature, 1), "tF": round(self.temperature * 9 / 5 + 32, 1)}
+        }
+        if self.timer_duration:
+            status["timer_started_at"] = self.timer_started_at
+            status["timer_duration"] = self.timer_duration
+        return status
+
+
+    def switch_config(self, params: dict | None = None) -> dict:
+        return dict(self.config)
+
+
+    def switch_set(self, params: dict) -> dict:
+        was_on = self.output
+        self._set_output(params.get("on", "false").lower() == "true", float(params.get("toggle_after", 0)), "HTTP_in")
+        return {"was_on": was_on}
+
+
+    def input_status(self, params: dict) -> dict:
+        input_id = int(params.get("id", 0))
+        return {"id": input_id, "state": self.inputs[input_id]}
+
+
+    def relay(self, params: dict) -> dict:
+        turn = params.get("turn")
+        if turn in ("on", "off", "toggle"):
+            on = (not self.output) if turn == "toggle" else (turn == "on")
+            self._set_output(on, float(params.get("timer", 0)), "http")
+        remaining = 0.0
+        if self.timer_duration:
+            remaining = max(self.timer_started_at + self.timer_duration - time.time(), 0.0)
+        return {
+            "ison": self.output,
+            "has_timer": bool(self.timer_duration),
+            "timer_started_at": int(self.timer_started_at),
+            "timer_duration": self.timer_duration,
+            "timer_remaining": remaining,
+            "overpower": False,
+            "source": self.source
+        }
+
+
+    def status_components(self) -> dict:
+        return {
+            "input:0": self.input_status({"id": 0}),
+            "input:1": self.input_status({"id": 1}),
+            "switch:0": self.switch_status()
+        }
+
+
+    def config_components(self) -> dict:
+        return {
+            "input:0": {"id": 0, "name": None, "type": "switch", "enable": True, "invert": False},
+            "input:1": {"id": 1, "name": None, "type": "switch", "enable": True, "invert": False},
+            "switch:0": self.switch_config()
+        }
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import random
+import resource
+from devices import VirtualShelly3EM, VirtualShellyPro1Pm, VirtualFk06x
+from services.faults import FaultProfile
+from services.server import SimulatorServer
+from services.mqtt import MqttPublisher
+from services.coiot import CoiotSender
+
+
+
+'''
+Main entrypoint of the Shelly device simulator.
+Simulates thousands of Shelly devices on localhost for load and latency testing
+of the collector and the irrigation controller.
+Each virtual device gets its own loopback IP, starting at --base-ip.
+'''
+
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulate Shelly devices on localhost.")
+    # Fleet
+    parser.add_argument("--shelly3em", type=int, default=0, help="Number of Shelly 3EM devices")
+    parser.add_argument("--shellypro1pm", type=int, default=0, help="Number of Shelly Pro 1 PM devices")
+    parser.add_argument("--fk06x", type=int, default=0, help="Number of FK-06X irrigation controllers")
+    parser.add_argument("--base-ip", type=str, default="127.1.0.1", help="IP of the first device, the following devices count up")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on, must cover the device IPs")
+    parser.add_argument("--port", type=int, default=8080, help="Port every device listens on")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable runs")
+    # Faults
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Latency jitter (+/-)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that never get a response")
+    parser.add_argument("--hang-seconds", type=float, default=30.0, help="How long a hung request holds the connection")
+    parser.add_argument("--reboot-interval", type=float, default=0.0, help="Mean seconds between reboots of a device, 0 disables")
+    parser.add_argument("--reboot-seconds", type=float, default=10.0, help="Seconds a rebooting device is unreachable")
+    parser.add_argument("--reset-counters-on-reboot", action="store_true", help="Reset the energy counters on a reboot")
+    parser.add_argument("--notify-seconds", type=float, default=1.0, help="Seconds between NotifyStatus frames on a Gen2 WebSocket")
+    parser.add_argument("--mqtt-broker", type=str, default=None, help="Publish the device statuses to this MQTT broker (host or host:port)")
+    parser.add_argument("--mqtt-seconds", type=float, default=10.0, help="Seconds between MQTT status publishes")
+    parser.add_argument("--coiot", type=str, default=None, nargs="?", const="224.0.1.187:5683", help="Send CoIoT status packets from the Shelly 3EMs, to the multicast group or host:port")
+    parser.add_argument("--coiot-seconds", type=float, default=1.0, help="Seconds between CoIoT status packets")
+    parser.add_argument("--coiot-replay", type=str, default=None, help="Replay recorded CoIoT packets (hex, one per line) instead of generating them")
+    # Outputs
+    parser.add_argument("--devices-json", type=str, default=None, help="Write a collector devices.json for the fleet")
+    parser.add_argument("--irrigation-config", type=str, default=None, help="Write an irrigation config.json (first FK-06X controllers and Pro 1 PM)")
+    parser.add_argument("--report-seconds", type=float, default=10.0, help="Seconds between stats reports")
+    return parser.parse_args()
+
+
+def create_fleet(args: argparse.Namespace, faults: FaultProfile) -> list:
+    '''
+    Creates the virtual devices with consecutive IPs from --base-ip.
+    '''
+    rng = random.Random(args.seed)
+    ip = ipaddress.IPv4Address(args.base_ip)
+    fleet = []
+    index = 0
+    for device_class, count in ((VirtualShelly3EM, args.shelly3em), (VirtualShellyPro1Pm, args.shellypro1pm), (VirtualFk06x, args.fk06x)):
+        for _ in range(count):
+            if not ipaddress.IPv4Address(ip).is_loopback:
+                raise ValueError(f"{ip} is outside the loopback network, use a lower --base-ip or fewer devices")
+            fleet.append(device_class(str(ip), index, faults, random.Random(rng.random())))
+            ip += 1
+            index += 1
+    return fleet
+
+
+def device_address(device, port: int) -> str:
+    return device.ip if port == 80 else f"{device.ip}:{port}"
+
+
+def write_devices_json(file_path: str, fleet: list, port: int) -> None:
+    devices = [
+        {"name": f"{device.MODEL} {device.index}", "ip": device_address(device, port), "model": device.MODEL}
+        for device in fleet if device.MODEL in ("shelly3em", "shellypro1pm")
+    ]
+    with open(file_path, "w") as file:
+        json.dump(devices, file, indent=4)
+    print(f"Wrote {len(devices)} devices to {file_path}")
+
+
+def write_irrigation_config(file_path: str, fleet: list, port: int) -> None:
+    controllers = [device for device in fleet if device.MODEL == "fk-06x"]
+    pumps = [device for device in fleet if device.MODEL == "shellypro1pm"]
+    if not controllers or not pumps:
+        print("The irrigation config needs at least one --fk06x and one --shellypro1pm")
+        return
+    config = {
+        "irrigation_controllers": [
+            {"name": f"Zone controller {device.index}", "ip": device_address(device, port), "model": "fk-06x", "interval_seconds": 5, "failsafe_seconds": 10}
+            for device in controllers
+        ],
+        "pump_relay": {"name": "Pump", "ip": device_address(pumps[0], port), "model": "shellypro1pm", "interval_seconds": 5, "failsafe_seconds": 10}
+    }
+    with open(file_path, "w") as file:
+        json.dump(config, file, indent=4)
+    print(f"Wrote the irrigation config to {file_path}")
+
+
+def raise_open_files_limit() -> None:
+    # Every simulated connection is a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run(args: argparse.Namespace) -> None:
+    faults = FaultProfile(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        reboot_interval=args.reboot_interval,
+        reboot_seconds=args.reboot_seconds,
+        reset_counters_on_reboot=args.reset_counters_on_reboot
+    )
+    fleet = create_fleet(args, faults)
+    if not fleet:
+        print("No devices to simulate, use --shelly3em, --shellypro1pm or --fk06x")
+        return
+    if args.devices_json:
+        write_devices_json(args.devices_json, fleet, args.port)
+    if args.irrigation_config:
+        write_irrigation_config(args.irrigation_config, fleet, args.port)
+
+    simulator = SimulatorServer(fleet, faults, args.host, args.port, args.seed, args.notify_seconds)
+    server = await simulator.start()
+    print(f"Simulating {len(fleet)} devices from {fleet[0].ip} to {fleet[-1].ip} on port {args.port}")
+    publisher = None
+    if args.mqtt_broker:
+        host, _, port = args.mqtt_broker.partition(":")
+        publisher = MqttPublisher(fleet, host, int(port or 1883), args.mqtt_seconds)
+        asyncio.create_task(publisher.run())
+    sender = None
+    if args.coiot:
+        sender = CoiotSender(fleet, args.coiot, args.coiot_seconds, args.coiot_replay)
+        asyncio.create_task(sender.run())
+    async with server:
+        while True:
+            await asyncio.sleep(args.report_seconds)
+            print(
+                simulator.summary()
+                + (f", {publisher.published} MQTT messages" if publisher else "")
+                + (f", {sender.sent} CoIoT packets" if sender else "")
+            )
+
+
+def main():
+    args = parse_args()
+    raise_open_files_limit()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import socket
+import struct
+import time
+from devices.shelly3em import VirtualShelly3EM
+
+
+
+'''
+CoIoT status packet sender for the virtual Gen1 devices.
+Every device sends a CoAP /cit/s packet from its own IP every interval, to the
+CoIoT multicast group by default or to a unicast address for local testing.
+Recorded packets (one hex encoded datagram per line) can be replayed instead.
+'''
+
+
+
+GROUP = "224.0.1.187"
+PORT = 5683
+
+
+def encode_option(delta: int, value: bytes) -> bytes:
+    extended = b""
+    nibbles = []
+    for number in (delta, len(value)):
+        if number < 13:
+            nibbles.append(number)
+        elif number < 269:
+            nibbles.append(13)
+            extended += bytes([number - 13])
+        else:
+            nibbles.append(14)
+            extended += struct.pack("!H", number - 269)
+    header = bytes([nibbles[0] << 4 | nibbles[1]])
+    return header + extended + value
+
+
+def status_packet(device: VirtualShelly3EM, message_id: int, serial: int) -> bytes:
+    '''
+    Encodes a CoIoT status packet: non-confirmable, code 0.30, Uri-Path cit/s,
+    the device id (3332), validity (3412) and serial (3420) options and the JSON payload.
+    '''
+    options = [
+        (11, b"cit"),
+        (11, b"s"),
+        (3332, f"SHEM-3#{device.mac}#2".encode()),
+        (3412, struct.pack("!H", 38400)),
+        (3420, struct.pack("!H", serial & 0xFFFF))
+    ]
+    packet = bytes([0x50, 30]) + struct.pack("!H", message_id & 0xFFFF)
+    number = 0
+    for option, value in options:
+        packet += encode_option(option - number, value)
+        number = option
+    payload = json.dumps({"G": device.coiot_values()}, separators=(",", ":")).encode()
+    return packet + b"\xff" + payload
+
+
+
+class CoiotSender:
+    def __init__(self, devices: list, target: str, interval: float, replay_file: str = None):
+        self.devices = [device for device in devices if isinstance(device, VirtualShelly3EM)]
+        host, _, port = target.partition(":")
+        self.target = (host or GROUP, int(port or PORT))
+        self.interval = interval
+        self.replay_file = replay_file
+        self.sent: int = 0
+        self._sockets: dict = {}
+
+
+    def _socket(self, device: VirtualShelly3EM) -> socket.socket:
+        # Bound to the device IP so the listener maps the packet to the device
+        sock = self._sockets.get(device.ip)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.bind((device.ip, 0))
+            sock.setblocking(False)
+            self._sockets[device.ip] = sock
+        return sock
+
+
+    def _recorded(self) -> list:
+        with open(self.replay_file, "r") as file:
+            return [bytes.fromhex(line.strip()) for line in file if line.strip()]
+
+
+    async def run(self) -> None:
+        recorded = self._recorded() if self.replay_file else None
+        cycle = 0
+        while True:
+            now = time.time()
+            for index, device in enumerate(self.devices):
+                if device.is_down(now):
+                    continue
+                if recorded:
+                    packet = recorded[(cycle + index) % len(recorded)]
+                else:
+                    packet = status_packet(device, cycle * len(self.devices) + index, cycle)
+                try:
+                    self._socket(device).sendto(packet, self.target)
+                    self.sent += 1
+                except OSError as e:
+                    print(f"CoIoT send error from {device.ip}: {e}")
+            cycle += 1
+            await asyncio.sleep(self.interval)
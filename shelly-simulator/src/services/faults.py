@@ -0,0 +1,56 @@
+import random
+
+
+
+'''
+Fault injection profile shared by every virtual device.
+'''
+
+
+
+class FaultProfile:
+    def __init__(
+            self,
+            latency_ms: float = 0.0,
+            jitter_ms: float = 0.0,
+            error_rate: float = 0.0,
+            hang_rate: float = 0.0,
+            hang_seconds: float = 30.0,
+            reboot_interval: float = 0.0,
+            reboot_seconds: float = 10.0,
+            reset_counters_on_reboot: bool = False
+        ):
+        self.latency_ms: float = latency_ms
+        self.jitter_ms: float = jitter_ms
+        self.error_rate: float = error_rate
+        self.hang_rate: float = hang_rate
+        self.hang_seconds: float = hang_seconds
+        # Mean seconds between reboots of a device, 0 disables reboots
+        self.reboot_interval: float = reboot_interval
+        self.reboot_seconds: float = reboot_seconds
+        self.reset_counters_on_reboot: bool = reset_counters_on_reboot
+
+
+    def latency(self, rng: random.Random) -> float:
+        '''
+        Response delay in seconds.
+        '''
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += rng.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(delay, 0.0) / 1000
+
+
+    def draw(self, rng: random.Random) -> str | None:
+        '''
+        Draws the fault for a request.
+
+        Returns:
+            str | None: "hang", "error" or None
+        '''
+        roll = rng.random()
+        if roll < self.hang_rate:
+            return "hang"
+        if roll < self.hang_rate + self.error_rate:
+            return "error"
+        return None
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import struct
+import time
+from devices.base import VirtualDevice
+from devices.gen2 import VirtualGen2Device
+
+
+
+'''
+Minimal MQTT 3.1.1 publisher (QoS 0) for the virtual devices.
+Publishes what the devices would send to a broker, on one connection for the whole fleet:
+Gen1 devices their /status document to shellies/<id>/info, Gen2 devices each
+component to <id>/status/<component>.
+'''
+
+
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def packet(kind: int, body: bytes) -> bytes:
+    return bytes([kind]) + encode_length(len(body)) + body
+
+
+def gen1_id(device: VirtualDevice) -> str:
+    return f"shellyem3-{device.mac}"
+
+
+
+class MqttPublisher:
+    CONNECT = 0x10
+    PUBLISH = 0x30
+    PINGREQ = 0xC0
+
+
+    def __init__(self, devices: list[VirtualDevice], host: str, port: int, interval: float, keepalive: int = 60):
+        self.devices = devices
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.keepalive = keepalive
+        self.published: int = 0
+        self._writer: asyncio.StreamWriter = None
+
+
+    async def connect(self) -> None:
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        body = encode_string("MQTT") + bytes([4, 0x02]) + struct.pack("!H", self.keepalive) + encode_string("shelly-simulator")
+        self._writer.write(packet(self.CONNECT, body))
+        await self._writer.drain()
+        connack = await reader.readexactly(4)
+        if connack[0] != 0x20 or connack[3] != 0:
+            raise ConnectionError(f"MQTT broker refused the connection: {connack[3]}")
+        # Drain PINGRESPs
+        asyncio.create_task(self._read(reader))
+
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while await reader.read(1024):
+            pass
+
+
+    def publish(self, topic: str, payload: dict) -> None:
+        body = encode_string(topic) + json.dumps(payload, separators=(",", ":")).encode()
+        self._writer.write(packet(self.PUBLISH, body))
+        self.published += 1
+
+
+    async def publish_fleet(self) -> None:
+        '''
+        Publishes the status of every device that is not rebooting.
+        '''
+        for device in self.devices:
+            if device.is_down(time.time()):
+                continue
+            if isinstance(device, VirtualGen2Device):
+                _, status = device.handle("/rpc/Shelly.GetStatus", "")
+                for component, value in status.items():
+                    self.publish(f"{device.device_id}/status/{component}", value)
+            elif "/status" in device.routes:
+                _, status = device.handle("/status", "")
+                self.publish(f"shellies/{gen1_id(device)}/info", status)
+            await self._writer.drain()
+
+
+    async def run(self) -> None:
+        '''
+        Publishes the fleet every interval, reconnecting when the broker drops the connection.
+        '''
+        last_ping = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if self._writer is None or self._writer.is_closing():
+                    await self.connect()
+                await self.publish_fleet()
+                if loop.time() - last_ping > self.keepalive / 2:
+                    self._writer.write(packet(self.PINGREQ, b""))
+                    last_ping = loop.time()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                print(f"MQTT publish error, reconnecting: {e}")
+                self._writer = None
+            await asyncio.sleep(self.interval)
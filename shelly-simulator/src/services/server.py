@@ -0,0 +1,166 @@
+import asyncio
+import json
+import random
+import time
+from devices.base import VirtualDevice
+from devices.gen2 import VirtualGen2Device
+from services.faults import FaultProfile
+from services.websocket import RpcSocket, handshake
+
+
+
+'''
+HTTP/1.1 server for the virtual devices.
+A single listening socket serves every device. The device is picked from the
+local address the client connected to, so each virtual device has its own IP
+on the loopback network (127.0.0.0/8) while sharing one port.
+Connections are kept alive like the real devices' web servers.
+Gen2 devices also accept a WebSocket upgrade on /rpc and stream NotifyStatus frames.
+'''
+
+
+
+class SimulatorServer:
+    def __init__(self, devices: list[VirtualDevice], faults: FaultProfile, host: str, port: int, seed: int = None, notify_interval: float = 1.0):
+        self.devices: dict[str, VirtualDevice] = {device.ip: device for device in devices}
+        self.faults: FaultProfile = faults
+        self.host: str = host
+        self.port: int = port
+        self.rng = random.Random(seed)
+        self.notify_interval: float = notify_interval
+        # Stats
+        self.requests: int = 0
+        self.errors: int = 0
+        self.hangs: int = 0
+        self.refused: int = 0
+        self.connections: int = 0
+        self.websockets: int = 0
+        self._notifications: int = 0
+        self._sockets: set = set()
+
+
+    async def start(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple[str, str, bool, dict] | None:
+        '''
+        Reads a request head.
+
+        Returns:
+            tuple[str, str, bool, dict] | None: The path, query, keep-alive flag and headers (lower case names), None when the client closed
+        '''
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            _, target, version = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return None
+        keep_alive = "close" not in headers.get("connection", "").lower() and version.strip() != "HTTP/1.0"
+        path, _, query = target.partition("?")
+        return path, query, keep_alive, headers
+
+
+    @staticmethod
+    def _response(status: int, body: dict, keep_alive: bool) -> bytes:
+        payload = json.dumps(body, separators=(",", ":")).encode()
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}.get(status, "OK")
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        return head.encode() + payload
+
+
+    async def _respond(self, device: VirtualDevice, handler, error):
+        '''
+        Runs a request through the fault injection.
+
+        Args:
+            device (VirtualDevice): The device the request is for
+            handler (callable): Returns the response
+            error: The response for a simulated error
+
+        Returns:
+            The response, None to drop the connection
+        '''
+        self.requests += 1
+        # A rebooting device drops the connection
+        if device.is_down(time.time()):
+            self.refused += 1
+            return None
+        fault = self.faults.draw(self.rng)
+        if fault == "hang":
+            self.hangs += 1
+            await asyncio.sleep(self.faults.hang_seconds)
+            return None
+        await asyncio.sleep(self.faults.latency(self.rng))
+        if fault == "error":
+            self.errors += 1
+            return error
+        return handler()
+
+
+    async def _serve_websocket(self, device: VirtualGen2Device, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, key: str) -> None:
+        writer.write(handshake(key))
+        await writer.drain()
+        socket = RpcSocket(device, reader, writer, self.notify_interval)
+        self._sockets.add(socket)
+        self.websockets += 1
+        try:
+            await socket.serve(lambda handler, error: self._respond(device, handler, error))
+        finally:
+            self._sockets.discard(socket)
+            self._notifications += socket.notifications
+
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        device = self.devices.get(writer.get_extra_info("sockname")[0])
+        self.connections += 1
+        try:
+            while device is not None:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                path, query, keep_alive, headers = request
+                if path == "/rpc" and headers.get("upgrade", "").lower() == "websocket" and isinstance(device, VirtualGen2Device):
+                    await self._serve_websocket(device, reader, writer, headers.get("sec-websocket-key", ""))
+                    break
+                response = await self._respond(
+                    device,
+                    lambda: device.handle(path, query),
+                    (500, {"code": -114, "message": "Simulated error"})
+                )
+                if response is None:
+                    break
+                writer.write(self._response(*response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    @property
+    def notifications(self) -> int:
+        return self._notifications + sum(socket.notifications for socket in self._sockets)
+
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.devices)} devices, {self.connections} connections, {self.requests} requests, "
+            f"{self.errors} errors, {self.hangs} hangs, {self.refused} refused while rebooting, "
+            f"{len(self._sockets)} open WebSockets ({self.websockets} total), {self.notifications} notifications"
+        )
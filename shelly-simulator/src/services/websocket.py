@@ -0,0 +1,170 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+from urllib.parse import urlencode
+from devices.gen2 import VirtualGen2Device
+
+
+
+'''
+Minimal WebSocket (RFC 6455) stand-in for the Gen2 /rpc socket.
+Answers JSON-RPC frames like the HTTP /rpc endpoints. Once a request with a "src"
+has been received the device sends NotifyStatus frames with the components and
+fields that changed since the previous notification, like the real firmware.
+Unfragmented frames only.
+'''
+
+
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+TEXT = 0x1
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def handshake(key: str) -> bytes:
+    accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+    ).encode()
+
+
+def encode_frame(opcode: int, payload: bytes) -> bytes:
+    # Server frames are not masked
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return head + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return first & 0x0F, payload
+
+
+def status_delta(previous: dict, current: dict) -> dict:
+    '''
+    Returns the components and fields of a Shelly.GetStatus document that changed.
+    '''
+    delta = {}
+    for component, status in current.items():
+        before = previous.get(component)
+        if status == before:
+            continue
+        if isinstance(status, dict) and isinstance(before, dict):
+            delta[component] = {key: value for key, value in status.items() if before.get(key) != value}
+        else:
+            delta[component] = status
+    return delta
+
+
+
+class RpcSocket:
+    def __init__(self, device: VirtualGen2Device, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, notify_interval: float):
+        self.device = device
+        self.reader = reader
+        self.writer = writer
+        self.notify_interval = notify_interval
+        self.destination: str = None
+        self.notifications: int = 0
+        self._last_status: dict = None
+
+
+    def send(self, message: dict) -> None:
+        self.writer.write(encode_frame(TEXT, json.dumps(message, separators=(",", ":")).encode()))
+
+
+    def call(self, request: dict) -> dict:
+        '''
+        Runs a JSON-RPC request against the device's /rpc routes.
+        '''
+        params = request.get("params") or {}
+        status, body = self.device.handle(f"/rpc/{request.get('method')}", urlencode(params))
+        response = {"id": request.get("id"), "src": self.device.device_id}
+        if request.get("src"):
+            response["dst"] = request["src"]
+        if status == 200:
+            response["result"] = body
+        else:
+            response["error"] = {"code": body.get("code", status), "message": body.get("message", "")}
+        return response
+
+
+    def error(self, request: dict) -> dict:
+        return {"id": request.get("id"), "src": self.device.device_id, "error": {"code": -114, "message": "Simulated error"}}
+
+
+    async def notify(self) -> None:
+        '''
+        Sends the changed components every notify_interval once subscribed.
+        '''
+        while True:
+            await asyncio.sleep(self.notify_interval)
+            # A rebooting device drops the socket
+            if self.device.is_down(time.time()):
+                self.writer.close()
+                return
+            if self.destination is None:
+                continue
+            _, status = self.device.handle("/rpc/Shelly.GetStatus", "")
+            delta = status_delta(self._last_status or {}, status)
+            self._last_status = status
+            if not delta:
+                continue
+            delta["ts"] = round(time.time(), 2)
+            self.send({"src": self.device.device_id, "dst": self.destination, "method": "NotifyStatus", "params": delta})
+            self.notifications += 1
+            await self.writer.drain()
+
+
+    async def serve(self, respond) -> None:
+        '''
+        Serves the socket until the client closes it.
+
+        Args:
+            respond (coroutine function): Runs a request through the fault injection given the handler and
+                the error response, returns the response or None to drop the socket
+        '''
+        notifier = asyncio.create_task(self.notify())
+        try:
+            while True:
+                opcode, payload = await read_frame(self.reader)
+                if opcode == CLOSE:
+                    self.writer.write(encode_frame(CLOSE, payload[:2]))
+                    break
+                if opcode == PING:
+                    self.writer.write(encode_frame(PONG, payload))
+                elif opcode == TEXT:
+                    request = json.loads(payload)
+                    response = await respond(lambda: self.call(request), self.error(request))
+                    if response is None:
+                        break
+                    self.send(response)
+                    if request.get("src"):
+                        self.destination = request["src"]
+                        if request.get("method") == "Shelly.GetStatus" and "result" in response:
+                            self._last_status = response["result"]
+                await self.writer.drain()
+        finally:
+            notifier.cancel()